@@ -1,10 +1,14 @@
 # import asyncio
+import os
 from src import create_app
 
 if __name__ == '__main__':
     # TODO: Async not working as expected, fix this later
     # app = asyncio.run(create_app())
 
-    app = create_app()
+    # With debug=True the reloader restarts this script in a child process(which has WERKZEUG_RUN_MAIN set) that serves the
+    # requests, while this process only watches for file changes. Only the child sets up the positions and the background tasks,
+    # otherwise both processes would refresh prices and write them to the DB
+    app = create_app(initialize=os.environ.get("WERKZEUG_RUN_MAIN") == "true")
 
     app.run(debug=True)
@@ -1,8 +1,15 @@
 from flask import Flask
 from flask_cors import CORS
-from src.api.options_positions import options_positions_api, initialize_options_positions
+from src.api.metrics import metrics_api
+from src.api.options_positions import options_positions_api, start_options_positions
+from src.api.profiling import profiling_api
+from src.data.option_positions_dao import init_db
 
-def create_app():
+def create_app(initialize: bool = True):
+    """
+    Creates the app. The DB connection, the positions and the background tasks are only set up when initialize is True, which
+    lets the entry point skip them in processes that never serve requests(ex: the debug reloader's file watcher)
+    """
     app = Flask(__name__)
     
     # Enable CORS for the entire app
@@ -10,8 +17,17 @@ def create_app():
 
     # Register Blueprints
     app.register_blueprint(options_positions_api)
+    app.register_blueprint(metrics_api)
+    app.register_blueprint(profiling_api)
+    if not initialize:
+        return app
 
-    # Initializes the list with the locally stored options information
-    initialize_options_positions()
+    # Connects to the DB and applies any new migrations
+    init_db()
+
+    # Initializes the list with the locally stored options information, then keeps the prices of the active positions up to date
+    # while the server is running. In background startup mode this happens on its own thread so that the server can start
+    # answering requests right away
+    start_options_positions()
 
     return app
@@ -0,0 +1,31 @@
+import time
+from flask import Blueprint, Response, g, request
+from src.util.metrics import registry
+
+metrics_api = Blueprint('metrics_api', __name__)
+
+# Latency of every request, labelled with the route pattern(ex: /api/options_positions/get_active_position) rather than the
+# full URL so that the number of label values stays small
+http_request_duration_seconds = registry.histogram(
+    "http_request_duration_seconds", "Time taken to handle each request, in seconds", ["route", "method", "status"]
+)
+
+@metrics_api.before_app_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+
+@metrics_api.after_app_request
+def record_request_duration(response: Response) -> Response:
+    # Streamed responses(ex: exports) are only timed until the response starts, the rest happens after this point
+    started_at = g.pop("request_started_at", None)
+    if started_at is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        http_request_duration_seconds.observe(
+            time.perf_counter() - started_at, route=route, method=request.method, status=str(response.status_code)
+        )
+    return response
+
+# Gets every metric in the Prometheus text format, for Prometheus(or anything else that reads the format) to scrape
+@metrics_api.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
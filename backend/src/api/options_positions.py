@@ -1,79 +1,582 @@
 # import asyncio
-from flask import Blueprint, request
+import copy
+import csv
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import numpy as np
+from datetime import datetime, time as time_of_day, timedelta
+from flask import Blueprint, Response, request, stream_with_context
+from src.api.profiling import PROFILE_STARTUP, PROFILING_OUTPUT_DIR
 from src.data.data_fetcher import *
 from src.data.option_positions_dao import *
 from src.util.common import *
 from src.util.options_position import *
+from src.util.black_scholes import calculate_position_greeks, calculate_scenario_profits
+from src.util.expiry_engine import ExpiryEngine
+from src.util.metrics import MetricFamily, registry
+from src.util.pnl_engine import PnlEngine
+from src.util.position_book import PositionBook
+from src.util.profiling import profile_block
+from src.util.scheduler import PeriodicTask, is_market_open
+from src.util.startup import StartupProgress
 
 options_positions_api = Blueprint('options_positions_api', __name__)
 api_header = '/api/options_positions'
 
-# List of active and expired OptionsPosition objects
-active_positions: list
-expired_positions: list
+# How the positions are loaded when the app is created: background(the app starts serving right away while the positions are
+# loaded and priced on a background thread, see /ready) or blocking(the app only starts serving once every position is priced)
+STARTUP_MODE = os.getenv("STARTUP_MODE", "background").lower()
+# How long background startup waits before trying again after it failed
+STARTUP_RETRY_SECONDS = float(os.getenv("STARTUP_RETRY_SECONDS", "30"))
+
+# How often the active positions are re-priced in the background(0 disables it), and whether that only happens during market hours
+PRICE_REFRESH_INTERVAL_SECONDS = float(os.getenv("PRICE_REFRESH_INTERVAL_SECONDS", "300"))
+PRICE_REFRESH_MARKET_HOURS_ONLY = os.getenv("PRICE_REFRESH_MARKET_HOURS_ONLY", "true").lower() == "true"
+
+# Market time at which positions are settled on their expiration date, how often we check for positions to settle, and how long
+# we wait before retrying positions whose closing price wasn't available yet
+EXPIRY_SETTLE_TIME = time_of_day.fromisoformat(os.getenv("EXPIRY_SETTLE_TIME", "16:30"))
+EXPIRY_CHECK_INTERVAL_SECONDS = float(os.getenv("EXPIRY_CHECK_INTERVAL_SECONDS", "60"))
+EXPIRY_RETRY_SECONDS = float(os.getenv("EXPIRY_RETRY_SECONDS", "900"))
+
+# Annual risk-free interest rate used to compute the implied volatilities and greeks of the active positions
+RISK_FREE_RATE = float(os.getenv("RISK_FREE_RATE", "0.04"))
+
+# Number of positions written to each chunk of a streamed export
+EXPORT_CHUNK_SIZE = 500
+
+# Maximum number of scenarios(price moves x volatility shifts x days forward) in a single scenario grid request, and of scenarios
+# x active positions, which bounds how long a single request can take
+MAX_SCENARIO_GRID_SIZE = 100_000
+MAX_SCENARIO_EVALUATIONS = 20_000_000
+
+# Fields that every row of an imported CSV file must have
+import_position_fields = [
+    "ticker",
+    "contract_type",
+    "quantity",
+    "trade_direction",
+    "strike_price",
+    "expiration_date",
+    "premium",
+    "open_price",
+    "open_date"
+]
+
+# Store of the active and expired OptionsPosition objects
+position_book = PositionBook()
+
+# Stage of loading the positions at startup(starting -> loading -> pricing -> ready, or failed), reported by /ready
+startup_progress = StartupProgress()
+# Set once the positions are in the position book, until then requests for them are answered with a 503
+positions_loaded = threading.Event()
+
+# Background task that keeps the prices of the active positions up to date
+price_refresh_task = PeriodicTask(
+    "price_refresh",
+    PRICE_REFRESH_INTERVAL_SECONDS,
+    lambda: refresh_active_prices(),
+    should_run=is_market_open if PRICE_REFRESH_MARKET_HOURS_ONLY else None
+)
+
+# Schedule of when each active position is due to be settled, along with the background task that settles them
+expiry_engine = ExpiryEngine(EXPIRY_SETTLE_TIME)
+expiry_task = PeriodicTask("expiry", EXPIRY_CHECK_INTERVAL_SECONDS, lambda: expire_due_positions())
+
+# Held while the background tasks update positions in place, so that a position can't be re-priced while it is being settled
+background_update_lock = threading.Lock()
+
+# Cache of the serialized position listings, maps the listing name -> (book version, ETag, JSON body). A listing is only
+# re-serialized once its version in the position book changes
+listing_response_cache = {}
+
+# Number of listing requests by whether the serialized listing was cached, and whether the client's copy was still current
+listing_requests_total = registry.counter(
+    "listing_requests_total", "Number of position listing requests, by whether the cached response could be used", ["listing", "result"]
+)
+
+# Columnar copy of every position in the position book used for the portfolio profit totals, as ((active version, expired version), PnlEngine).
+# It is only rebuilt once either of the versions changes
+pnl_engine_cache = None
+
+# Implied volatilities and greeks of the active positions as (active version, greeks), recomputed after every price refresh
+position_greeks_cache = None
+
+# Scenario grid responses for the current active positions as (active version, {(price moves, volatility shifts, days forward) ->
+# response}), so that repeating a request(ex: re-rendering a chart) doesn't recompute the grid. At most SCENARIO_GRID_CACHE_SIZE
+# responses are kept, the oldest one is dropped first
+scenario_grid_cache = None
+SCENARIO_GRID_CACHE_SIZE = 16
+
+# Market data of the active positions as position_id -> (underlying price, bid, ask, last price), taken from the option chains
+# that were fetched to price the positions. The greeks are computed from it, so only positions added since the last price
+# refresh need their option chains fetched when the greeks are recomputed
+position_market_data = {}
 
 # Initializes the options positions
 def initialize_options_positions():
     """
-    Initializes the active_positions and expired_positions lists with the positions from the DB
+    Initializes the position book with the positions from the DB and prices the active ones
     """
-    global active_positions
-    global expired_positions
-
     print("Initializing options positions...")
 
+    startup_progress.advance("loading")
+    load_options_positions()
+    startup_progress.advance("pricing")
+    price_loaded_positions()
+    startup_progress.advance("ready")
+
+    print("Options positions initialized")
+
+def load_options_positions():
+    """
+    Loads the positions from the DB into the position book and schedules the active ones to be settled, without fetching any
+    market data
+    """
     expired_positions = get_positions(False, True)
     active_positions = get_positions(True, False)
+    position_book.load(active_positions, expired_positions)
+    expiry_engine.load(active_positions)
+    positions_loaded.set()
+
+def price_loaded_positions():
+    """
+    Fetches the market data for the active positions loaded from the DB, settling the ones that expired while the server was down
+    """
+    # Settled positions are moved over to the expired positions by reconcile_positions(positions deleted since they were loaded are
+    # skipped by the book). Positions that couldn't be settled stay active, and since their settle time has already passed the
+    # expiry engine retries them on its first check
+    reconcile_positions(position_book.active_positions())
+
+def start_options_positions():
+    """
+    Initializes the options positions and then starts the background tasks that keep them up to date. In background startup
+    mode this happens on its own thread and the function returns right away
+    """
+    if STARTUP_MODE == "background":
+        threading.Thread(target=warm_up_options_positions, name="warm_up", daemon=True).start()
+    elif STARTUP_MODE == "blocking":
+        warm_up_options_positions()
+    else:
+        raise ValueError(f"Unknown startup mode {STARTUP_MODE}, expected background or blocking")
+
+def warm_up_options_positions():
+    """
+    Initializes the options positions and starts the background tasks. In background startup mode a failure is recorded for
+    /ready instead of being raised, and the initialization is retried every STARTUP_RETRY_SECONDS until it succeeds
+    """
+    while True:
+        try:
+            with profile_block("initialize_options_positions", PROFILING_OUTPUT_DIR, enabled=PROFILE_STARTUP):
+                initialize_options_positions()
+            break
+        except Exception as e:
+            print(f"Failed to initialize the options positions: {e}")
+            startup_progress.fail(e)
+            if STARTUP_MODE != "background":
+                raise
+        # Positions that were already loaded keep being served in the meantime, a retry reloads them from the DB
+        print(f"Retrying the initialization in {STARTUP_RETRY_SECONDS} seconds")
+        time.sleep(STARTUP_RETRY_SECONDS)
+
+    start_background_tasks()
+
+def start_background_tasks():
+    """
+    Starts the background tasks that keep the positions up to date
+    """
+    if PRICE_REFRESH_INTERVAL_SECONDS > 0:
+        price_refresh_task.start()
+    expiry_task.start()
+
+def refresh_active_prices():
+    """
+    Re-prices the active positions in the position book and writes their updated profits back to the DB
+    """
+    global position_market_data
+    with background_update_lock:
+        active_positions = position_book.active_positions()
+        previous_profits = {position.position_id: position.profit for position in active_positions}
+        # The chains are fetched once and used for both the prices and the market data the greeks are computed from
+        option_chains = get_option_chains(get_option_chain_keys(active_positions))
+        # The positions are priced on copies and the new prices are swapped into the book in one step, so that requests never
+        # see a position with a mix of old and new prices
+        priced_positions = price_options_positions([copy.copy(position) for position in active_positions], option_chains)
+        position_market_data = get_options_market_data(active_positions, option_chains)
+        priced_positions = position_book.update_active(priced_positions)
+
+    # Only the profits that moved need to be written, outside of market hours that is usually none of them
+    changed_positions = [position for position in priced_positions if position.profit != previous_profits[position.position_id]]
+    if changed_positions:
+        bulk_update_option_positions([(position.position_id, {'profit': position.profit}) for position in changed_positions])
+    print(f"Refreshed the prices of {len(priced_positions)} active positions, {len(changed_positions)} of them changed")
+
+    # Recomputing the greeks here means that requests for them are served from the cache
+    get_position_greeks()
+
+def expire_due_positions():
+    """
+    Settles the active positions whose settle time has passed, moving them over to the expired positions both in the position
+    book and in the DB. Positions whose closing price isn't available yet(or that couldn't be written to the DB) are retried after
+    EXPIRY_RETRY_SECONDS
+    """
+    due_positions = []
+    for position_id in expiry_engine.pop_due():
+        # Positions that were deleted or already settled since they were scheduled are skipped
+        if position_book.is_expired(position_id) is False:
+            due_positions.append(position_book.get(position_id))
+    if not due_positions:
+        return
+
+    settled_position_ids = set()
+    try:
+        with background_update_lock:
+            # The positions are settled on copies and the DB is written first, so the positions in the book keep their active values
+            # until the DB has them as expired too
+            settled_positions = settle_options_positions([copy.copy(position) for position in due_positions])
+            bulk_update_option_positions([
+                (settled_position.position_id, get_settled_position_updates(settled_position)) for settled_position in settled_positions
+            ])
+            for settled_position in settled_positions:
+                settled_position.is_expired = True
+            position_book.update_active(settled_positions, expire=True)
+            settled_position_ids.update(settled_position.position_id for settled_position in settled_positions)
+    finally:
+        # The due positions were popped from the schedule, so any that didn't get settled have to be put back on it
+        retry_at = datetime.now().astimezone() + timedelta(seconds=EXPIRY_RETRY_SECONDS)
+        for position in due_positions:
+            if position.position_id not in settled_position_ids:
+                expiry_engine.schedule_at(position.position_id, retry_at)
+
+    print(f"Settled {len(settled_position_ids)} of the {len(due_positions)} positions due to expire")
 
-    numNewlyExpiredPositions = 0
-    for active_position in active_positions:
-        # The OptionsPosition object creation runs a check to see if the position is actually expired, regardless of what
-        # the DB item has set for is_expired
-        if not active_position.is_expired:
-            active_position.update_active_contract()
-            updates = {
-                'profit': active_position.profit
-            }
-            update_option_position(active_position.position_id, updates)
-            continue
-
-        # Update the DB item's is_expired and closing_price fields and also the local OptionsPosition object
-        underlying_price = get_security_closing_price(active_position.ticker, active_position.expiration_date)
-        active_position.update_position_at_maturity(underlying_price)
+def get_settled_position_updates(settled_position: OptionsPosition) -> dict:
+    """
+    Returns the DB updates for the input position that was just settled
+    """
+    # Update the DB item's is_expired and closing_price fields
+    return {
+        'position_status': settled_position.position_status.value,
+        'close_price': settled_position.close_price,
+        'profit': settled_position.profit,
+        'is_expired': True
+    }
+
+def reconcile_positions(positions: list) -> list:
+    """
+    Fetches the market data for the input positions(which are active in the DB and in the position book), updates them and writes
+    the results back to the DB. Positions that turn out to be expired are settled on copies, which only replace the positions in
+    the book(moving them over to the expired positions) once the DB has been written.
+
+    Returns the list of positions that turned out to be expired and were settled
+    """
+    # The OptionsPosition object creation runs a check to see if the position is actually expired, regardless of what
+    # the DB item has set for is_expired
+    still_active_positions = [position for position in positions if not position.is_expired]
+    newly_expired_positions = [position for position in positions if position.is_expired]
+
+    # Positions are hydrated from the DB without any market data, so we fetch the market data for all of them in batches grouped
+    # by (ticker, expiration_date) and then swap the new prices into the positions in the book(see refresh_active_prices)
+    option_chains = get_option_chains(get_option_chain_keys(still_active_positions))
+    priced_positions = price_options_positions([copy.copy(position) for position in still_active_positions], option_chains)
+    position_market_data.update(get_options_market_data(still_active_positions, option_chains))
+    position_book.update_active(priced_positions)
+    settled_positions = settle_options_positions([copy.copy(position) for position in newly_expired_positions])
+    for settled_position in settled_positions:
+        settled_position.is_expired = True
+
+    # Writing the results back to the DB in one bulk update once all the market data has been applied. Positions that couldn't
+    # be priced keep the profit they already have in the DB
+    position_updates = []
+    for active_position in priced_positions:
         updates = {
-            'position_status': active_position.position_status.value,
-            'close_price': active_position.close_price,
-            'profit': active_position.profit,
-            'is_expired': True
+            'profit': active_position.profit
         }
-        update_option_position(active_position.position_id, updates)
-        active_position.close_price = underlying_price
-        
-        # We then increment numNewlyExpiredPositions(which is how we decide how many items to pop later from active_positions) and
-        # then add to the back of expired_positions. This still guarantees that expired_positions is ordered by increasing
-        # expiration_date
-        numNewlyExpiredPositions += 1
-        expired_positions.append(active_position)
-
-    for __ in range(numNewlyExpiredPositions):
-        active_positions.pop(0)
+        position_updates.append((active_position.position_id, updates))
 
-    print("Options positions initialized")
+    for settled_position in settled_positions:
+        position_updates.append((settled_position.position_id, get_settled_position_updates(settled_position)))
+
+    bulk_update_option_positions(position_updates)
+
+    return position_book.update_active(settled_positions, expire=True)
+
+def cached_listing_response(listing: str, version: int, get_listing_json) -> Response:
+    """
+    Returns the JSON response for the input position listing, only re-serializing the positions if the version has changed since
+    the last time. Responses carry an ETag, and requests whose If-None-Match matches it get an empty 304 response
+    """
+    cached = listing_response_cache.get(listing)
+    result = "hit"
+    if cached is None or cached[0] != version:
+        body = json.dumps(get_listing_json())
+        # The ETag is derived from the content rather than the version, since versions start over whenever the server restarts
+        cached = (version, hashlib.sha1(body.encode()).hexdigest(), body)
+        listing_response_cache[listing] = cached
+        result = "miss"
+
+    _, etag, body = cached
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        result = "not_modified"
+    else:
+        response = Response(body, status=200, mimetype='application/json')
+    listing_requests_total.inc(listing=listing, result=result)
+    response.set_etag(etag)
+    # Makes clients revalidate with us every time instead of using a stale listing
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def collect_position_book_metrics() -> list:
+    """
+    Returns the size of the position book and the status of the background tasks as metrics
+    """
+    task_stats = [price_refresh_task.stats(), expiry_task.stats()]
+    return [
+        MetricFamily("position_book_positions", "gauge", "Number of positions in the position book", [
+            ({"status": "active"}, len(position_book.active)),
+            ({"status": "expired"}, len(position_book.expired))
+        ]),
+        MetricFamily("position_book_expired_store_bytes", "gauge", "Memory used by the arrays of the expired position store, in bytes", [
+            ({}, position_book.expired.nbytes())
+        ]),
+        MetricFamily("background_task_runs_total", "counter", "Number of runs of each background task", [
+            ({"task": stats["name"]}, stats["runs"]) for stats in task_stats
+        ]),
+        MetricFamily("background_task_failed_runs_total", "counter", "Number of runs of each background task that raised", [
+            ({"task": stats["name"]}, stats["failed_runs"]) for stats in task_stats
+        ]),
+        MetricFamily("background_task_skipped_runs_total", "counter", "Number of runs of each background task that were skipped", [
+            ({"task": stats["name"]}, stats["skipped_runs"]) for stats in task_stats
+        ]),
+        MetricFamily("background_task_last_duration_seconds", "gauge", "How long the last run of each background task took, in seconds", [
+            ({"task": stats["name"]}, stats["last_duration"]) for stats in task_stats if stats["last_duration"] is not None
+        ])
+    ]
+
+registry.add_collector(collect_position_book_metrics)
+
+@options_positions_api.before_request
+def require_loaded_positions():
+    # Every endpoint other than the readiness check needs the positions, and would otherwise answer as if there weren't any
+    if not positions_loaded.is_set() and request.endpoint != f'{options_positions_api.name}.get_readiness':
+        return {'error': 'The positions are still being loaded, try again shortly', 'stage': startup_progress.stage}, 503, {'Retry-After': '1'}
+
+# Gets whether the server has finished loading and pricing the positions, for load balancers and deploy scripts to wait on.
+# Responds with a 503 until then. The positions can already be requested once the stage reaches pricing, but their prices
+# may not be current yet
+@options_positions_api.route('/ready', methods=['GET'])
+def get_readiness():
+    stats = startup_progress.stats()
+    is_ready = stats['stage'] == 'ready'
+    return {**stats, 'ready': is_ready, 'positions_loaded': positions_loaded.is_set(), 'startup_mode': STARTUP_MODE}, 200 if is_ready else 503
 
 # GET methods
 # Get the active options positions
 @options_positions_api.route(f'{api_header}/get_active_position', methods=['GET'])
 def get_active_positions():
-    # TODO: This is pretty inefficient, think of a better way to do this
-    # Probably just re-add that global list to represent the JSON object, might need a diff design with async
-    return [position.__json__() for position in active_positions], 200
+    # The version has to be read before the positions, so that a change made in between gets picked up by the next request
+    return cached_listing_response('active', position_book.active_version, position_book.active_positions_json)
 
 # Gets the expired options positions
 @options_positions_api.route(f'{api_header}/get_expired_position', methods=['GET'])
 def get_expired_positions():
-    # TODO: This is pretty inefficient, think of a better way to do this
-    # Probably just re-add that global list to represent the JSON object, might need a diff design with async
-    return [position.__json__() for position in expired_positions], 200
+    return cached_listing_response('expired', position_book.expired_version, position_book.expired_positions_json)
+
+# Queries the options positions with optional filters, one page at a time
+# Filters(all optional): ticker, contract_type, trade_direction, status, is_expired, expiration_from, expiration_to, open_from, open_to
+# Pagination: limit(default 100, max 1000) and cursor, which is the next_cursor returned with the previous page
+@options_positions_api.route(f'{api_header}/query_positions', methods=['GET'])
+def get_queried_positions():
+    args = request.args
+    try:
+        filters = {
+            'ticker': args['ticker'].upper() if args.get('ticker') else None,
+            'contract_type': ContractType[args['contract_type'].upper()].value if args.get('contract_type') else None,
+            'trade_direction': TradeDirection[args['trade_direction'].upper()].value if args.get('trade_direction') else None,
+            'position_status': PositionStatus[args['status'].upper()].value if args.get('status') else None,
+            'is_expired': args['is_expired'].lower() == 'true' if args.get('is_expired') else None,
+            'expiration_from': string_to_date(args['expiration_from']) if args.get('expiration_from') else None,
+            'expiration_to': string_to_date(args['expiration_to']) if args.get('expiration_to') else None,
+            'open_from': string_to_date(args['open_from']) if args.get('open_from') else None,
+            'open_to': string_to_date(args['open_to']) if args.get('open_to') else None
+        }
+        limit = min(max(int(args.get('limit', 100)), 1), 1000)
+        after = parse_position_cursor(args['cursor']) if args.get('cursor') else None
+    except KeyError as e:
+        return {'error': f'Invalid filter value {e}'}, 400
+    except ValueError as e:
+        return {'error': f'Invalid query: {e}'}, 400
+
+    # Fetching one extra position tells us whether there is another page after this one
+    positions = query_positions(filters, limit + 1, after)
+    has_next_page = len(positions) > limit
+    positions = positions[:limit]
+
+    # Positions that are in the position book have their market data(ex: current_price), so we return those instead
+    positions = [position_book.get(position.position_id) or position for position in positions]
+    next_cursor = format_position_cursor(positions[-1]) if has_next_page else None
+    return {'positions': position_book.to_json(positions), 'next_cursor': next_cursor}, 200
+
+def format_position_cursor(position: OptionsPosition) -> str:
+    """
+    Returns the pagination cursor pointing right after the input position, in the format of YYYY-MM-DD_<position_id>
+    """
+    return f"{position.expiration_date.isoformat()}_{position.position_id}"
+
+def parse_position_cursor(cursor: str) -> tuple:
+    """
+    Converts the input pagination cursor into an (expiration_date, position_id) tuple. A ValueError is thrown if it is malformed
+    """
+    expiration_date, position_id = cursor.split("_")
+    return string_to_date(expiration_date), int(position_id)
+
+# Exports all the expired options positions, either as CSV(format=csv, the default) or as newline-delimited JSON(format=ndjson)
+# The export is streamed straight from the DB in chunks, so it never has to be held in memory
+@options_positions_api.route(f'{api_header}/export_expired_positions', methods=['GET'])
+def export_expired_positions():
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format == 'csv':
+        return Response(
+            stream_with_context(generate_csv_export(iter_positions(False, True))),
+            mimetype='text/csv',
+            headers={'Content-Disposition': 'attachment; filename=expired_positions.csv'}
+        )
+    if export_format == 'ndjson':
+        return Response(
+            stream_with_context(generate_ndjson_export(iter_positions(False, True))),
+            mimetype='application/x-ndjson',
+            headers={'Content-Disposition': 'attachment; filename=expired_positions.ndjson'}
+        )
+
+    return {'error': f'Unsupported export format {export_format}'}, 400
+
+def generate_csv_export(positions):
+    """
+    Yields the input positions as CSV text(with a header row), EXPORT_CHUNK_SIZE positions at a time
+    """
+    buffer = io.StringIO()
+    writer = None
+    num_buffered_positions = 0
+    for position in positions:
+        position_json = position.__json__()
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(position_json.keys()))
+            writer.writeheader()
+
+        writer.writerow(position_json)
+        num_buffered_positions += 1
+        if num_buffered_positions == EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            num_buffered_positions = 0
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def generate_ndjson_export(positions):
+    """
+    Yields the input positions as newline-delimited JSON, EXPORT_CHUNK_SIZE positions at a time
+    """
+    lines = []
+    for position in positions:
+        lines.append(json.dumps(position.__json__()))
+        if len(lines) == EXPORT_CHUNK_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+# Gets the total, realized and unrealized profit of the portfolio, along with the totals per ticker and per expiry month
+@options_positions_api.route(f'{api_header}/get_portfolio_summary', methods=['GET'])
+def get_portfolio_summary():
+    pnl_engine = get_pnl_engine()
+    return {
+        **pnl_engine.totals(),
+        'by_ticker': pnl_engine.totals_by_ticker(),
+        'by_expiry_month': pnl_engine.totals_by_expiry_month()
+    }, 200
+
+def get_pnl_engine() -> PnlEngine:
+    """
+    Returns the PnlEngine for the positions currently in the position book, rebuilding it if the book has changed since it was built
+    """
+    global pnl_engine_cache
+    # The versions have to be read before the positions, so that a change made in between gets picked up by the next request
+    versions = (position_book.active_version, position_book.expired_version)
+    if pnl_engine_cache is None or pnl_engine_cache[0] != versions:
+        pnl_engine_cache = (versions, PnlEngine(position_book.active_positions(), position_book.expired_columns()))
+    return pnl_engine_cache[1]
+
+# Gets the implied volatility and greeks of each active position(optionally only for the input ticker), along with the greek
+# totals per ticker
+@options_positions_api.route(f'{api_header}/get_greeks', methods=['GET'])
+def get_greeks():
+    position_greeks = get_position_greeks()
+    ticker = request.args.get('ticker')
+    if not ticker:
+        return position_greeks, 200
+
+    ticker = ticker.upper()
+    return {
+        'positions': [greeks for greeks in position_greeks['positions'] if greeks['ticker'] == ticker],
+        'by_ticker': {ticker: position_greeks['by_ticker'][ticker]} if ticker in position_greeks['by_ticker'] else {}
+    }, 200
+
+def get_position_greeks() -> dict:
+    """
+    Returns the implied volatility and greeks of the active positions, recomputing them if the active positions have changed
+    since they were last computed. The market data comes from the last price refresh, only positions that are new since then
+    have their option chains fetched
+    """
+    global position_greeks_cache
+    version = position_book.active_version
+    if position_greeks_cache is None or position_greeks_cache[0] != version:
+        active_positions = position_book.active_positions()
+        new_positions = [position for position in active_positions if position.position_id not in position_market_data]
+        if new_positions:
+            position_market_data.update(get_options_market_data(new_positions))
+        position_greeks_cache = (version, calculate_position_greeks(active_positions, position_market_data, RISK_FREE_RATE))
+    return position_greeks_cache[1]
+
+# Gets how stale the price of each active position is, along with the status of the background price refresh
+# A price is considered stale once it is older than two refresh intervals
+@options_positions_api.route(f'{api_header}/get_pricing_status', methods=['GET'])
+def get_pricing_status():
+    now = datetime.now().astimezone()
+    positions = []
+    for position in position_book.active_positions():
+        price_age = (now - position.priced_at).total_seconds() if position.priced_at else None
+        positions.append({
+            'position_id': position.position_id,
+            'ticker': position.ticker,
+            'priced_at': position.priced_at.isoformat() if position.priced_at else None,
+            'price_age_seconds': price_age,
+            'is_stale': price_age is None or price_age > 2 * PRICE_REFRESH_INTERVAL_SECONDS
+        })
+
+    next_settle_at = expiry_engine.next_settle_at()
+    next_settle_at = next_settle_at.isoformat() if next_settle_at else None
+    price_ages = [position['price_age_seconds'] for position in positions if position['price_age_seconds'] is not None]
+    return {
+        'market_open': is_market_open(),
+        'refresh': price_refresh_task.stats(),
+        'expiry': {**expiry_task.stats(), 'scheduled_positions': len(expiry_engine), 'next_settle_at': next_settle_at},
+        'oldest_price_age_seconds': max(price_ages, default=None),
+        'unpriced_positions': len(positions) - len(price_ages),
+        'positions': positions
+    }, 200
+
+# Gets the utilization and wait time statistics of the DB connection pool, used for sizing the pool
+@options_positions_api.route(f'{api_header}/get_db_pool_stats', methods=['GET'])
+def get_db_pool_stats():
+    return get_connection_pool_stats(), 200
 
 
 # POST methods
@@ -89,37 +592,153 @@ def add_position():
 
     position_id = add_option_position(new_position)
     new_position.update_position_id(position_id)
-    # Checks if the position is expired
-    if new_position.is_expired:
-        # If expired, update the status and then add it to the expired positions store
-        add_position_to_list(new_position, expired_positions)
-    else:
-        # Add to list if position is active
-        add_position_to_list(new_position, active_positions)
+    # Adds the position to the expired positions if it is expired, otherwise to the active positions
+    position_book.add(new_position, new_position.is_expired)
+    if not new_position.is_expired:
+        expiry_engine.schedule(new_position.position_id, new_position.expiration_date)
     
     return {'message': 'Position added successfully!', 'expired': new_position.is_expired}, 201
 
+# Imports the option positions in the uploaded CSV file(either as the "file" field of a multipart form or as the raw request body)
+# The CSV must have a header row with the same fields as the add_position JSON
+@options_positions_api.route(f'{api_header}/import_positions', methods=['POST'])
+def import_positions():
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+
+    errors = []
+    imported_positions = {}
+    def validated_positions():
+        # Rows are validated one at a time as the DAO consumes them, so the raw upload is never held in memory. Only the validated
+        # positions are kept, since they are added to the position book once they are in the DB
+        for line_number, row in enumerate(reader, start=2): # Line 1 is the header
+            missing_fields = [field for field in import_position_fields if not row.get(field)]
+            if missing_fields:
+                errors.append({'line': line_number, 'error': f"Missing fields {', '.join(missing_fields)}"})
+                continue
+
+            try:
+                # Same checks as add_position, except that creation isn't blind so that no market data is fetched per row
+                position = OptionsPosition(**parse_options_position_inputs(row), blind_init=False)
+                if not float(position.quantity).is_integer():
+                    raise ValueError("Quantity must be a whole number")
+                position.quantity = int(position.quantity)
+            except KeyError as e:
+                # Enum lookups raise a KeyError for values that aren't valid
+                errors.append({'line': line_number, 'error': f"Invalid value {e}"})
+                continue
+            except Exception as e:
+                errors.append({'line': line_number, 'error': str(e)})
+                continue
+
+            imported_positions[line_number] = position
+            yield line_number, position
+
+    position_ids = import_option_positions(validated_positions())
+    for line_number, position_id in position_ids.items():
+        imported_positions[line_number].update_position_id(position_id)
+
+    # The positions are committed to the DB at this point, so they go into the position book before any market data is fetched.
+    # That way a pricing failure can't leave the book out of sync with the DB
+    new_positions = list(imported_positions.values())
+    for position in new_positions:
+        position_book.add(position, False)
+        expiry_engine.schedule(position.position_id, position.expiration_date)
+
+    # Pricing the imported positions in one batched pass now that they are all in the DB. Positions that can't be priced or settled
+    # yet are picked up by the price refresh and expiry tasks
+    try:
+        reconcile_positions(new_positions)
+    except Exception as e:
+        print(f"Unable to price the imported positions: {e}")
+
+    status_code = 201 if new_positions or not errors else 400
+    return {'message': f'Imported {len(new_positions)} positions', 'imported': len(new_positions), 'errors': errors}, status_code
+
+# Computes the profit of the active positions over a grid of scenarios, the input JSON has the lists price_moves(ex: 0.05 for a
+# +5% move in the underlying), volatility_shifts(ex: -0.02 for -2 volatility points) and days_forward(calendar days ahead)
+# The result is the total profit for every scenario, indexed as profits[price move][volatility shift][days forward]
+@options_positions_api.route(f'{api_header}/scenario_grid', methods=['POST'])
+def scenario_grid():
+    data = request.json
+    if not data:
+        return {'error': 'Invalid data'}, 400
+
+    try:
+        price_moves = np.array([float(move) for move in data.get('price_moves', [0])], dtype=np.float64)
+        volatility_shifts = np.array([float(shift) for shift in data.get('volatility_shifts', [0])], dtype=np.float64)
+        days_forward = np.array([float(days) for days in data.get('days_forward', [0])], dtype=np.float64)
+    except (TypeError, ValueError) as e:
+        return {'error': f'Invalid scenario values: {e}'}, 400
+
+    grid_size = len(price_moves) * len(volatility_shifts) * len(days_forward)
+    if grid_size == 0 or grid_size > MAX_SCENARIO_GRID_SIZE:
+        return {'error': f'The scenario grid must have between 1 and {MAX_SCENARIO_GRID_SIZE} scenarios'}, 400
+    # NaN would get past the checks below and come back out as NaN profits, which aren't valid JSON
+    if not (np.isfinite(price_moves).all() and np.isfinite(volatility_shifts).all() and np.isfinite(days_forward).all()):
+        return {'error': 'Scenario values must be finite numbers'}, 400
+    if (price_moves <= -1).any() or (days_forward < 0).any():
+        return {'error': 'Price moves must be greater than -1 and days forward can\'t be negative'}, 400
+
+    global scenario_grid_cache
+    version = position_book.active_version
+    scenario_key = (tuple(price_moves.tolist()), tuple(volatility_shifts.tolist()), tuple(days_forward.tolist()))
+    if scenario_grid_cache is None or scenario_grid_cache[0] != version:
+        scenario_grid_cache = (version, {})
+    cached_responses = scenario_grid_cache[1]
+    cached_response = cached_responses.get(scenario_key)
+    if cached_response is not None:
+        return cached_response, 200
+
+    # The scenarios start from the current underlying prices and implied volatilities of the positions. The active positions are
+    # read once, so the counts below are for the same positions as the profits
+    greeks_by_position_id = {greeks['position_id']: greeks for greeks in get_position_greeks()['positions']}
+    active_positions = position_book.active_positions()
+    positions = [
+        position for position in active_positions
+        if greeks_by_position_id.get(position.position_id, {}).get('implied_volatility') is not None
+    ]
+    if grid_size * len(positions) > MAX_SCENARIO_EVALUATIONS:
+        return {'error': f'The scenario grid is too large for {len(positions)} positions, it can have at most {MAX_SCENARIO_EVALUATIONS // len(positions)} scenarios'}, 400
+    underlying_prices = np.array([greeks_by_position_id[position.position_id]['underlying_price'] for position in positions], dtype=np.float64)
+    volatilities = np.array([greeks_by_position_id[position.position_id]['implied_volatility'] for position in positions], dtype=np.float64)
+
+    profits = calculate_scenario_profits(
+        positions, underlying_prices, volatilities, price_moves, volatility_shifts, days_forward, RISK_FREE_RATE
+    )
+    response = {
+        'price_moves': price_moves.tolist(),
+        'volatility_shifts': volatility_shifts.tolist(),
+        'days_forward': days_forward.tolist(),
+        'profits': np.round(profits, 2).tolist(),
+        'positions': len(positions),
+        'excluded_positions': len(active_positions) - len(positions)
+    }
+    cached_responses[scenario_key] = response
+    while len(cached_responses) > SCENARIO_GRID_CACHE_SIZE:
+        cached_responses.pop(next(iter(cached_responses)), None)
+    return response, 200
+
 # Deletes an option position corresponding to the input position_id
 @options_positions_api.route(f'{api_header}/delete_position', methods=['POST'])
 def delete_position():
-    global active_positions
-    global expired_positions
-
     data = request.json
     if not data:
         return {'error': 'Invalid data'}, 400
     
     position_id = data["position_id"]
-    is_expired = is_position_expired(position_id)
-    
-    # Finding the index of the position in our local store
-    position_list = expired_positions if is_expired else active_positions
-    idx = next((i for i, position in enumerate(position_list) if position.position_id == position_id), -1)
-    if idx == -1:
-        return {'error': 'Input position_id does not correspond to any existing position'}
-    position_list.pop(idx)
-
-    # Deleting from the DB
-    delete_option_position(position_id)
+
+    # The position book knows whether the position is expired, so we don't need to look it up in the DB
+    is_expired = position_book.is_expired(position_id)
+    if is_expired is None:
+        return {'error': 'Input position_id does not correspond to any existing position'}, 404
+
+    # Deleting from the DB and then from our local store, which is left as it is if the DB delete fails
+    try:
+        delete_option_position(position_id)
+    except Exception as e:
+        return {'error': f'Unable to delete the position: {e}'}, 500
+    position_book.remove(position_id)
 
     return {'message': 'Position deleted successfully!', 'expired': is_expired}, 200
@@ -0,0 +1,101 @@
+import hmac
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from flask import Blueprint, Response, g, request
+from src.util.profiling import StackSampler, log_slow_request, start_profiler, summarize_profile, summarize_samples, write_profile
+
+profiling_api = Blueprint('profiling_api', __name__)
+
+# This module is imported before anything else that loads the .env file, so it has to load it itself
+load_dotenv()
+
+# When requests are profiled with cProfile: off, header(only requests whose X-Profile header matches PROFILING_TOKEN) or always.
+# Profiling slows requests down a lot and writes a file per request, so it is off unless we are investigating something, and
+# header mode does nothing until a token is set so that not just any client can trigger it
+PROFILING_MODE = os.getenv("PROFILING_MODE", "off").lower()
+PROFILING_HEADER = "X-Profile"
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN") or None
+if PROFILING_MODE == "header" and PROFILING_TOKEN is None:
+    print("PROFILING_MODE is header but PROFILING_TOKEN isn't set, no requests will be profiled")
+
+# Whether the startup run of initialize_options_positions is profiled, and where the .prof files are written
+PROFILE_STARTUP = os.getenv("PROFILE_STARTUP", "false").lower() == "true"
+PROFILING_OUTPUT_DIR = os.getenv(
+    "PROFILING_OUTPUT_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "profiles")
+)
+
+# Requests that take longer than the threshold(in seconds) are logged along with the functions they spent their time in. While
+# the log is on, every request is sampled at the sample interval so that we know where the time went once a request turns out
+# to be slow. That costs far less than profiling every request but still isn't free, so the log is off(0) unless a threshold is set
+SLOW_REQUEST_THRESHOLD_SECONDS = float(os.getenv("SLOW_REQUEST_THRESHOLD_SECONDS", "0"))
+SLOW_REQUEST_SAMPLE_INTERVAL_SECONDS = float(os.getenv("SLOW_REQUEST_SAMPLE_INTERVAL_SECONDS", "0.005"))
+SLOW_REQUEST_LOG_PATH = os.getenv("SLOW_REQUEST_LOG_PATH") or None
+
+# Only created when the slow request log is on, so that its sampling thread never runs otherwise
+stack_sampler = StackSampler(SLOW_REQUEST_SAMPLE_INTERVAL_SECONDS) if SLOW_REQUEST_THRESHOLD_SECONDS > 0 else None
+
+def should_profile_request() -> bool:
+    if PROFILING_MODE == "always":
+        return True
+    if PROFILING_MODE != "header" or PROFILING_TOKEN is None:
+        return False
+    return hmac.compare_digest(request.headers.get(PROFILING_HEADER, "").encode(), PROFILING_TOKEN.encode())
+
+@profiling_api.before_app_request
+def start_request_profiling():
+    g.profiling_started_at = time.perf_counter()
+    g.profiler = start_profiler() if should_profile_request() else None
+    # A request that is already being profiled doesn't need to be sampled as well
+    if g.profiler is None and stack_sampler is not None:
+        g.sampled_thread_id = threading.get_ident()
+        stack_sampler.register(g.sampled_thread_id)
+
+@profiling_api.after_app_request
+def finish_request_profiling(response: Response) -> Response:
+    started_at = g.pop("profiling_started_at", None)
+    if started_at is None:
+        return response
+    duration = time.perf_counter() - started_at
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+    profiler = g.pop("profiler", None)
+    top_functions = None
+    if profiler is not None:
+        profiler.disable()
+        profile_path = write_profile(profiler, PROFILING_OUTPUT_DIR, f"{request.method}_{route}")
+        # Only the file name is sent back, the client has no business knowing where it is on the server
+        response.headers["X-Profile-File"] = os.path.basename(profile_path)
+        if SLOW_REQUEST_THRESHOLD_SECONDS > 0 and duration > SLOW_REQUEST_THRESHOLD_SECONDS:
+            top_functions = summarize_profile(profiler)
+
+    sampled_thread_id = g.pop("sampled_thread_id", None)
+    if sampled_thread_id is not None:
+        sample_count, function_samples = stack_sampler.unregister(sampled_thread_id)
+        if duration > SLOW_REQUEST_THRESHOLD_SECONDS:
+            top_functions = summarize_samples(sample_count, function_samples, duration)
+
+    if top_functions is not None:
+        log_slow_request({
+            "method": request.method,
+            "path": request.path,
+            "route": route,
+            "status": response.status_code,
+            "duration_seconds": round(duration, 6),
+            "threshold_seconds": SLOW_REQUEST_THRESHOLD_SECONDS,
+            "profiler": "cprofile" if profiler is not None else "sampling",
+            "top_functions": top_functions
+        }, SLOW_REQUEST_LOG_PATH)
+
+    return response
+
+@profiling_api.teardown_app_request
+def clean_up_request_profiling(error: BaseException = None):
+    # after_app_request doesn't run if the request fails before a response is made, so the profiler and sampler are stopped here too
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+    sampled_thread_id = g.pop("sampled_thread_id", None)
+    if sampled_thread_id is not None:
+        stack_sampler.unregister(sampled_thread_id)
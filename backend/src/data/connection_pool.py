@@ -0,0 +1,142 @@
+import threading
+import time
+from contextlib import contextmanager
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+# The purpose of this class is to let each request borrow its own DB connection instead of sharing one global connection
+class ConnectionPool:
+    """
+    Thread-safe pool of PostgreSQL connections.
+
+    Callers block(up to timeout seconds) when every connection is in use instead of failing right away. Connections that have been
+    idle for longer than health_check_interval seconds are checked before being handed out, and dropped connections are replaced
+    with fresh ones.
+    """
+    minconn: int
+    maxconn: int
+    timeout: float
+    health_check_interval: float
+
+    def __init__(self, minconn: int, maxconn: int, timeout: float, health_check_interval: float, **connect_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout # In seconds
+        self.health_check_interval = health_check_interval # In seconds
+        self.pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, **connect_kwargs)
+
+        # ThreadedConnectionPool raises as soon as it runs out of connections, so the semaphore is what makes callers wait their turn
+        self._semaphore = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used = {} # Maps id(connection) -> monotonic time the connection was last returned to the pool
+
+        # Statistics
+        self.in_use = 0
+        self.checkouts = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.reconnects = 0
+        self.timeouts = 0
+
+    def _get_healthy_connection(self):
+        conn = self.pool.getconn()
+        last_used = self._last_used.get(id(conn))
+        needs_check = last_used is None or time.monotonic() - last_used > self.health_check_interval
+
+        if not conn.closed and needs_check:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1;")
+                conn.rollback()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                pass
+
+        if conn.closed:
+            # The connection was dropped(ex: the DB restarted), so we throw it away and open a new one in its place
+            self.pool.putconn(conn, close=True)
+            conn = self.pool.getconn()
+            with self._lock:
+                self.reconnects += 1
+
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a connection from the pool for the duration of the with block
+        """
+        start = time.monotonic()
+        if not self._semaphore.acquire(timeout=self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise psycopg2.pool.PoolError(f"Timed out after {self.timeout} seconds waiting for a DB connection")
+
+        try:
+            conn = self._get_healthy_connection()
+        except Exception:
+            self._semaphore.release()
+            raise
+
+        wait_time = time.monotonic() - start
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._last_used[id(conn)] = time.monotonic()
+            # Connections that got dropped while in use are closed instead of being put back for the next caller
+            self.pool.putconn(conn, close=bool(conn.closed))
+            self._semaphore.release()
+
+    @contextmanager
+    def transaction(self, isolation_level: int = psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED, cursor_name: str = None):
+        """
+        Borrows a connection and yields a cursor running in a transaction with the input isolation level. The transaction is
+        committed when the with block finishes and rolled back if it raises(or if a generator using it is closed early).
+
+        If cursor_name is provided, the cursor is a named(server-side) cursor, which fetches its results from the DB in batches
+        of cursor.itersize rows as it is iterated over instead of all at once
+        """
+        with self.connection() as conn:
+            conn.set_isolation_level(isolation_level)
+            cursor = conn.cursor(name=cursor_name) if cursor_name else conn.cursor()
+            try:
+                yield cursor
+                # Server-side cursors have to be closed while their transaction is still open
+                cursor.close()
+                conn.commit()
+            except BaseException:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+
+    def stats(self) -> dict:
+        """
+        Returns the utilization and wait time statistics of the pool
+        """
+        with self._lock:
+            return {
+                "min_connections": self.minconn,
+                "max_connections": self.maxconn,
+                "in_use": self.in_use,
+                "utilization": self.in_use / self.maxconn,
+                "checkouts": self.checkouts,
+                "total_wait_time": self.total_wait_time,
+                "average_wait_time": self.total_wait_time / self.checkouts if self.checkouts else 0.0,
+                "max_wait_time": self.max_wait_time,
+                "reconnects": self.reconnects,
+                "timeouts": self.timeouts
+            }
+
+    def close(self):
+        """
+        Closes every connection in the pool
+        """
+        self.pool.closeall()
@@ -1,33 +1,161 @@
+import math
 import sys
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timedelta
-import yfinance as yf
+from io import StringIO
+from dotenv import load_dotenv
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 from util.common import *
 from util.rate_limiter import *
+from src.data.option_chain_cache import OptionChainCache
+from src.data.market_data_store import MarketDataStore
+from src.data.single_flight import SingleFlight
+from src.data.market_data_provider import MarketDataProvider, OptionChain
+from src.util.metrics import MetricFamily, registry
+
+load_dotenv()
 
 # Tomorrow's date formatted as YYYY-MM-DD
 tomorrow_date = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
 
-# Dictionary containing the tickers we've already instantiated(computing power for memory tradeoff)
-tickers = {}
+# Rate limiter for our calls to the market data provider, 100 calls a second overall with separate budgets for history and option chain calls
+rate_limiter = RateLimitedExecutor(100, 1.0, endpoint_limits={
+    "history": (50, 1.0),
+    "option_chain": (50, 1.0)
+})
+
+# Cache for the option chains we've downloaded, keyed by (ticker, expiry) with the entire OptionChain(both sides and the
+# underlying price) as one entry. Chains are shared by every position on the same expiry, so one refresh cycle only needs one
+# download per distinct (ticker, expiry) as long as max_entries covers the number of distinct chains
+option_chain_cache = OptionChainCache(
+    ttl=float(os.getenv("OPTION_CHAIN_CACHE_TTL_SECONDS", "60")),
+    max_entries=int(os.getenv("OPTION_CHAIN_CACHE_MAX_ENTRIES", "512"))
+)
+
+# Where the market data comes from, yfinance by default or local(recorded and synthetic data, see LocalMarketDataProvider)
+# to run offline
+MARKET_DATA_PROVIDER = os.getenv("MARKET_DATA_PROVIDER", "yfinance").lower()
+
+# Directory the local provider reads its recorded market data from
+MARKET_DATA_LOCAL_DIR = os.getenv("MARKET_DATA_LOCAL_DIR") or None
+
+def create_market_data_provider(name: str) -> MarketDataProvider:
+    """
+    Returns the market data provider for the input name
+    """
+    if name == "yfinance":
+        from src.data.yfinance_provider import YFinanceProvider
+        return YFinanceProvider(rate_limiter)
+    if name == "local":
+        from src.data.local_market_data_provider import LocalMarketDataProvider
+        return LocalMarketDataProvider(MARKET_DATA_LOCAL_DIR)
+    raise ValueError(f"Unknown market data provider {name}, expected yfinance or local")
+
+# The provider is created on first use, since creating it imports the provider's market data libraries(yfinance and pandas
+# take a large share of our import time) and startup shouldn't have to wait on them
+market_data_provider = None
+market_data_provider_lock = threading.Lock()
+
+def get_market_data_provider() -> MarketDataProvider:
+    """
+    Returns the market data provider selected by MARKET_DATA_PROVIDER, creating it on the first call
+    """
+    global market_data_provider
+    if market_data_provider is None:
+        with market_data_provider_lock:
+            if market_data_provider is None:
+                market_data_provider = create_market_data_provider(MARKET_DATA_PROVIDER)
+    return market_data_provider
+
+# On-disk store for market data that never changes, such as closing prices on past dates and the chains of expired options.
+# Data is written through to the store whenever we fetch it, so after a restart only new data has to come from the network.
+# Each provider gets its own store by default so that synthetic data never gets mixed in with real data. Like the provider, the
+# store is only opened on first use
+default_market_data_store_name = "market_data.sqlite3" if MARKET_DATA_PROVIDER == "yfinance" else f"market_data_{MARKET_DATA_PROVIDER}.sqlite3"
+MARKET_DATA_STORE_PATH = os.getenv(
+    "MARKET_DATA_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), default_market_data_store_name)
+)
+market_data_store = None
+market_data_store_lock = threading.Lock()
 
-# Rate limiter for our calls to yfinance
-rate_limiter = RateLimitedExecutor(100, 1.0) # 100 calls a second
+def get_market_data_store() -> MarketDataStore:
+    """
+    Returns the market data store at MARKET_DATA_STORE_PATH, opening it on the first call
+    """
+    global market_data_store
+    if market_data_store is None:
+        with market_data_store_lock:
+            if market_data_store is None:
+                market_data_store = MarketDataStore(MARKET_DATA_STORE_PATH)
+    return market_data_store
+
+# Collapses concurrent fetches of the same market data(ex: two refresh workers asking for the same chain) into one upstream call
+single_flight = SingleFlight()
 
-def get_security_ticker_object(ticker: str) -> yf.Ticker:
+# Maximum number of worker threads used for batched market data fetches. All the workers still go through the rate limiter
+MARKET_DATA_MAX_WORKERS = int(os.getenv("MARKET_DATA_MAX_WORKERS", "8"))
+
+# Metrics for the calls to the market data provider and for how much of our market data is served from the market data store
+market_data_request_duration_seconds = registry.histogram(
+    "market_data_request_duration_seconds",
+    "Time taken by calls to the market data provider(including rate limiter waits), in seconds",
+    ["provider", "call"]
+)
+market_data_request_errors_total = registry.counter(
+    "market_data_request_errors_total", "Number of calls to the market data provider that failed", ["provider", "call"]
+)
+market_data_store_lookups_total = registry.counter(
+    "market_data_store_lookups_total", "Number of lookups in the market data store, by the type of data and whether it was found", ["data", "result"]
+)
+
+def call_market_data_provider(call: str, func, *args):
+    """
+    Returns func(*args), where func is a method of the market data provider, recording how long the call took and whether it failed
     """
-    Returns the Ticker object for the input ticker string
+    provider_name = get_market_data_provider().name
+    try:
+        with market_data_request_duration_seconds.time(provider=provider_name, call=call):
+            return func(*args)
+    except Exception:
+        market_data_request_errors_total.inc(provider=provider_name, call=call)
+        raise
 
-    TODO: Check if exception is thrown when the ticker doesn't exist
+def collect_market_data_metrics() -> list:
+    """
+    Returns the statistics of the rate limiter, option chain cache and single flight as metrics
     """
-    if ticker in tickers:
-        return tickers[ticker]
+    rate_limiter_stats = rate_limiter.stats()
+    bucket_stats = [({"bucket": "shared"}, rate_limiter_stats["shared"])]
+    bucket_stats += [({"bucket": endpoint}, stats) for endpoint, stats in rate_limiter_stats["endpoints"].items()]
+    cache_stats = option_chain_cache.stats()
+
+    return [
+        MetricFamily("rate_limiter_calls_total", "counter", "Number of calls that went through the rate limiter", [
+            (labels, stats["calls"]) for labels, stats in bucket_stats
+        ]),
+        MetricFamily("rate_limiter_waited_calls_total", "counter", "Number of calls that had to wait for the rate limiter", [
+            (labels, stats["waited_calls"]) for labels, stats in bucket_stats
+        ]),
+        MetricFamily("rate_limiter_wait_seconds_total", "counter", "Total time spent waiting for the rate limiter, in seconds", [
+            (labels, stats["total_wait_time"]) for labels, stats in bucket_stats
+        ]),
+        MetricFamily("rate_limiter_queue_depth", "gauge", "Number of calls currently waiting for the rate limiter", [
+            (labels, stats["queue_depth"]) for labels, stats in bucket_stats
+        ]),
+        MetricFamily("option_chain_cache_hits_total", "counter", "Number of option chain cache lookups that were hits", [({}, cache_stats["hits"])]),
+        MetricFamily("option_chain_cache_misses_total", "counter", "Number of option chain cache lookups that were misses", [({}, cache_stats["misses"])]),
+        MetricFamily("option_chain_cache_hit_ratio", "gauge", "Share of option chain cache lookups that were hits", [({}, cache_stats["hit_ratio"])]),
+        MetricFamily("option_chain_cache_entries", "gauge", "Number of entries in the option chain cache", [({}, cache_stats["size"])]),
+        MetricFamily("option_chain_cache_evictions_total", "counter", "Number of entries evicted from the option chain cache", [({}, cache_stats["evictions"])]),
+        MetricFamily("single_flight_shared_calls_total", "counter", "Number of market data fetches served by another caller's fetch", [
+            ({}, single_flight.shared_calls)
+        ])
+    ]
 
-    security = rate_limiter.call(yf.Ticker, ticker)
-    tickers[ticker] = security
-    return security
+registry.add_collector(collect_market_data_metrics)
 
 def get_security_closing_price(ticker: str, date: date) -> float:
     """
@@ -35,39 +163,124 @@ def get_security_closing_price(ticker: str, date: date) -> float:
 
     Date must be in the format of YYYY-MM-DD.
     """
-    security = get_security_ticker_object(ticker)
+    stored_closing_prices = get_market_data_store().get_closing_prices(ticker, {date})
+    if date in stored_closing_prices:
+        market_data_store_lookups_total.inc(data="closing_price", result="hit")
+        return stored_closing_prices[date]
+    market_data_store_lookups_total.inc(data="closing_price", result="miss")
+
+    return single_flight.do(("close", ticker, date), fetch_security_closing_price, ticker, date)
+
+def fetch_security_closing_price(ticker: str, date: date) -> float:
+    """
+    Fetches the closing price for the input ticker and date from the market data provider and writes it through to the market
+    data store
+    """
+    closing_prices = call_market_data_provider("closing_prices", get_market_data_provider().get_closing_prices, ticker, date, date)
 
-    # Fetches data from current day to next day since the results are [start date, end day)
-    current_day = datetime.combine(date, datetime.min.time())
-    next_day = current_day + timedelta(days=1)
-    historical_data = rate_limiter.call(security.history, start=current_day, end=next_day)
-    
     # Check if the data exists for the specified date
-    if historical_data.empty:
-        raise ValueError(f"No data available for {ticker} on {current_day}")
-    
+    if date not in closing_prices:
+        raise ValueError(f"No data available for {ticker} on {date}")
+
     # Rounding the result to the penny since Yahoo finance's result often has floating point errors
-    return round(historical_data['Close'].iloc[0], 2)
+    closing_price = round(closing_prices[date], 2)
+    get_market_data_store().put_closing_prices(ticker, {date: closing_price})
+    return closing_price
+
+def get_entire_option_chain(ticker: str, expiration_date: date) -> OptionChain:
+    """
+    Returns both sides of the option chain for the input ticker and expiration date along with the underlying price, using the
+    cache when possible
+
+    ticker: Ticker for the underlying security
+    expiration_date: Expiration date of the option chain
+    """
+    ticker = ticker.upper()
+    expiry = expiration_date.strftime("%Y-%m-%d")
+
+    option_chain = option_chain_cache.get((ticker, expiry))
+    if option_chain is not None:
+        return option_chain
+
+    # Chains for past expiration dates can't be downloaded anymore and never change, so they come from the last stored snapshot
+    if expiration_date < datetime.now().date():
+        option_chain = load_option_chain_snapshot(ticker, expiry)
+        option_chain_cache.put((ticker, expiry), option_chain)
+        return option_chain
+
+    return single_flight.do(("option_chain", ticker, expiry), download_option_chain, ticker, expiry)
+
+def get_option_chain(ticker: str, expiration_date: date, is_call: bool, entire_option_chain: OptionChain = None):
+    """
+    Returns the calls or puts option chain for the input ticker and expiration date, using the cache when possible
+
+    ticker: Ticker for the underlying security
+    expiration_date: Expiration date of the option chain
+    is_call: True to get the calls side of the chain, false for the puts side
+    entire_option_chain: Chain that was already fetched(ex: by get_option_chains), it is looked up when not provided
+    """
+    option_chain = entire_option_chain or get_entire_option_chain(ticker, expiration_date)
+    side = option_chain.calls if is_call else option_chain.puts
+    if side is None:
+        raise ValueError(f"No stored option chain for {ticker.upper()} with expiration date {expiration_date.strftime('%Y-%m-%d')}")
+    return side
+
+def load_option_chain_snapshot(ticker: str, expiry: str) -> OptionChain:
+    """
+    Returns the last stored snapshot of the input option chain, sides that weren't stored are None. Snapshots don't have the
+    underlying price, so it is NaN
+    """
+    sides = {}
+    for side in ["calls", "puts"]:
+        snapshot = get_market_data_store().get_option_chain_snapshot(ticker, expiry, side)
+        market_data_store_lookups_total.inc(data="option_chain", result="miss" if snapshot is None else "hit")
+        if snapshot is not None:
+            import pandas as pd
+            sides[side] = pd.read_json(StringIO(snapshot), orient="split")
+
+    if not sides:
+        raise ValueError(f"No stored option chain for {ticker} with expiration date {expiry}")
+    return OptionChain(sides.get("calls"), sides.get("puts"), float("nan"))
+
+def download_option_chain(ticker: str, expiry: str) -> OptionChain:
+    """
+    Downloads the option chain for the input ticker and YYYY-MM-DD expiry, stores it and returns it
+    """
+    # Another caller may have finished downloading this chain between our cache miss and us getting to make the call
+    option_chain = option_chain_cache.get((ticker, expiry))
+    if option_chain is not None:
+        return option_chain
+
+    # The chain also comes with a quote for the underlying security, which is cached as NaN when it is missing so that we don't
+    # keep downloading the chain to look for it
+    option_chain = call_market_data_provider("option_chain", get_market_data_provider().get_option_chain, ticker, expiry)
+    underlying_price = float("nan") if option_chain.underlying_price is None else float(option_chain.underlying_price)
+    option_chain = OptionChain(option_chain.calls, option_chain.puts, underlying_price)
+    option_chain_cache.put((ticker, expiry), option_chain)
+
+    # Overwriting the snapshots each time means the stored chain is the last one we saw before the expiration date
+    get_market_data_store().put_option_chain_snapshot(ticker, expiry, "calls", option_chain.calls.to_json(orient="split", date_format="iso"))
+    get_market_data_store().put_option_chain_snapshot(ticker, expiry, "puts", option_chain.puts.to_json(orient="split", date_format="iso"))
+
+    return option_chain
 
 def get_current_option_price(
     ticker: str,
-    expiration_date: str,
+    expiration_date: date,
     strike: float,
-    is_call: bool
+    is_call: bool,
+    entire_option_chain: OptionChain = None
 ) -> float:
     """
     Returns the current price for the input option
 
     ticker: Ticker for the underlying security
-    expiration_date: Expiration date of the option as a YYYY-MM-DD string
+    expiration_date: Expiration date of the option
     strike: Strike price of the option
     is_call: True if option is a call option, false for put option
+    entire_option_chain: Chain that was already fetched(ex: by get_option_chains), it is looked up when not provided
     """
-    security = get_security_ticker_object(ticker)
-    
-    expiry = expiration_date.strftime("%Y-%m-%d")
-    entire_option_chain = rate_limiter.call(security.option_chain, date=expiry)
-    option_chain = entire_option_chain.calls if is_call else entire_option_chain.puts
+    option_chain = get_option_chain(ticker, expiration_date, is_call, entire_option_chain)
     
     try:
         option = option_chain[option_chain.strike == strike]
@@ -75,3 +288,132 @@ def get_current_option_price(
     except:
         # print(option_chain) # for debugging, remove once done
         raise Exception(f"Provided strike {strike} with expiration date {expiration_date} is not present in the option chain for {ticker}")
+
+def get_underlying_price(ticker: str, expiration_date: date, entire_option_chain: OptionChain = None) -> float:
+    """
+    Returns the price of the underlying security that came with the latest download of the input option chain
+
+    ticker: Ticker for the underlying security
+    expiration_date: Expiration date of the option chain
+    entire_option_chain: Chain that was already fetched(ex: by get_option_chains), it is looked up when not provided
+    """
+    underlying_price = (entire_option_chain or get_entire_option_chain(ticker, expiration_date)).underlying_price
+    if underlying_price is None or math.isnan(underlying_price):
+        raise ValueError(
+            f"No underlying price available for {ticker.upper()} with the option chain expiring on {expiration_date.strftime('%Y-%m-%d')}"
+        )
+    return underlying_price
+
+def get_option_quotes(
+    ticker: str,
+    expiration_date: date,
+    strikes: list,
+    is_call: bool,
+    entire_option_chain: OptionChain = None
+) -> "pd.DataFrame":
+    """
+    Returns the bid, ask and lastPrice columns of the option chain for each of the input strikes, in the same order.
+    Strikes that aren't in the option chain have NaN quotes
+
+    ticker: Ticker for the underlying security
+    expiration_date: Expiration date of the option chain
+    strikes: Strike prices of the options
+    is_call: True for call options, false for put options
+    entire_option_chain: Chain that was already fetched(ex: by get_option_chains), it is looked up when not provided
+    """
+    option_chain = get_option_chain(ticker, expiration_date, is_call, entire_option_chain)
+    quote_columns = [column for column in ["bid", "ask", "lastPrice"] if column in option_chain.columns]
+    quotes = option_chain.drop_duplicates("strike").set_index("strike")[quote_columns]
+    return quotes.reindex(strikes).reindex(columns=["bid", "ask", "lastPrice"])
+
+def run_market_data_tasks(func, keys: list) -> dict:
+    """
+    Runs func(*key) for each of the input keys on a bounded worker pool and returns a dictionary of key -> result.
+
+    Exceptions are not raised, the exception is returned as the result for that key instead so that one bad key doesn't fail
+    the whole batch
+    """
+    results = {}
+    if not keys:
+        return results
+
+    with ThreadPoolExecutor(max_workers=min(MARKET_DATA_MAX_WORKERS, len(keys))) as executor:
+        futures = {key: executor.submit(func, *key) for key in keys}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                results[key] = e
+
+    return results
+
+def get_option_chains(chain_keys: set) -> dict:
+    """
+    Gets the option chains for the input set of (ticker, expiration_date) pairs concurrently, using the cache when possible.
+
+    Returns a dictionary of (ticker, expiration_date) -> OptionChain, or the exception for the chains that couldn't be retrieved.
+    Callers should use the returned chains rather than looking them up again, since the cache may have evicted them by then
+    """
+    return run_market_data_tasks(get_entire_option_chain, list(chain_keys))
+
+def get_security_closing_price_history(ticker: str, start_date: date, end_date: date) -> dict:
+    """
+    Returns a dictionary of date -> closing price for the input ticker over [start_date, end_date], using a single history request.
+
+    Dates that the market was closed on are not present in the returned dictionary
+    """
+    return single_flight.do(("history", ticker, start_date, end_date), fetch_security_closing_price_history, ticker, start_date, end_date)
+
+def fetch_security_closing_price_history(ticker: str, start_date: date, end_date: date) -> dict:
+    """
+    Fetches the closing prices for the input ticker over [start_date, end_date] from the market data provider and writes them
+    through to the market data store
+    """
+    closing_prices = call_market_data_provider("closing_prices", get_market_data_provider().get_closing_prices, ticker, start_date, end_date)
+
+    # Rounding the results to the penny since Yahoo finance's result often has floating point errors
+    closing_prices = {day: round(close, 2) for day, close in closing_prices.items()}
+    get_market_data_store().put_closing_prices(ticker, closing_prices)
+    return closing_prices
+
+def get_security_closing_prices(ticker_dates: set) -> dict:
+    """
+    Returns a dictionary of (ticker, date) -> closing price for the input set of (ticker, date) pairs.
+
+    Closing prices that are already in the market data store are read from there. For the rest, we make one history request
+    per ticker covering the min-max range of its dates, and the tickers are fetched concurrently.
+    Pairs that have no closing price are left out of the returned dictionary
+    """
+    dates_by_ticker = {}
+    for ticker, day in ticker_dates:
+        dates_by_ticker.setdefault(ticker, set()).add(day)
+
+    closing_prices = {}
+    for ticker in list(dates_by_ticker.keys()):
+        stored_closing_prices = get_market_data_store().get_closing_prices(ticker, dates_by_ticker[ticker])
+        for day, close in stored_closing_prices.items():
+            closing_prices[(ticker, day)] = close
+        market_data_store_lookups_total.inc(len(stored_closing_prices), data="closing_price", result="hit")
+
+        missing_dates = dates_by_ticker[ticker] - stored_closing_prices.keys()
+        market_data_store_lookups_total.inc(len(missing_dates), data="closing_price", result="miss")
+        if missing_dates:
+            dates_by_ticker[ticker] = missing_dates
+        else:
+            del dates_by_ticker[ticker]
+
+    history_keys = [(ticker, min(dates), max(dates)) for ticker, dates in dates_by_ticker.items()]
+    results = run_market_data_tasks(get_security_closing_price_history, history_keys)
+
+    for (ticker, start_date, end_date), result in results.items():
+        if isinstance(result, Exception):
+            print(f"Unable to get the closing prices for {ticker} from {start_date} to {end_date}: {result}")
+            continue
+
+        for day in dates_by_ticker[ticker]:
+            if day not in result:
+                print(f"No data available for {ticker} on {day}")
+                continue
+            closing_prices[(ticker, day)] = result[day]
+
+    return closing_prices
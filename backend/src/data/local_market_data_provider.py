@@ -0,0 +1,176 @@
+import csv
+import json
+import math
+import os
+import zlib
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from src.data.market_data_provider import MarketDataProvider, OptionChain
+
+# Interest rate used to price the synthetic option chains
+SYNTHETIC_RATE = 0.04
+
+# Number of days to look back for the last close when pricing a synthetic chain(covers weekends and long weekends)
+SYNTHETIC_CLOSE_LOOKBACK_DAYS = 7
+
+def _unit_hash(*values) -> float:
+    """
+    Returns a number in [0, 1) that is always the same for the input values
+    """
+    return zlib.crc32("|".join(str(value) for value in values).encode()) / 2**32
+
+class LocalMarketDataProvider(MarketDataProvider):
+    """
+    Market data read from files, for running the app offline and for repeatable performance runs.
+
+    Recorded data is read from the input directory:
+        closes/<TICKER>.csv: date,close rows
+        option_chains/<TICKER>_<YYYY-MM-DD>.json: {"underlying_price": ..., "calls": ..., "puts": ...} with each side of the chain
+        in the split orient of DataFrame.to_json
+
+    Anything that hasn't been recorded is generated instead. Synthetic closes follow a smooth yearly cycle with a bit of noise on
+    weekdays, and synthetic chains are priced with Black-Scholes off the last synthetic close. Synthetic data only depends on the
+    ticker and the dates, so every run sees the same prices.
+    """
+    name = "local"
+
+    def __init__(self, directory: str = None, today: date = None):
+        """
+        directory: Directory the recorded data is read from, only synthetic data is served when it is None
+        today: Date the synthetic chains are priced on, defaults to the current date
+        """
+        self.directory = directory
+        self.today = today
+        self._recorded_closes = {} # Maps ticker -> recorded {date: close}, or None when the ticker hasn't been recorded
+
+    def _get_today(self) -> date:
+        return self.today or date.today()
+
+    def _get_recorded_closes(self, ticker: str) -> dict:
+        if ticker not in self._recorded_closes:
+            closes = None
+            path = None if self.directory is None else os.path.join(self.directory, "closes", f"{ticker}.csv")
+            if path is not None and os.path.exists(path):
+                with open(path, newline="") as closes_file:
+                    closes = {date.fromisoformat(row["date"]): float(row["close"]) for row in csv.DictReader(closes_file)}
+            self._recorded_closes[ticker] = closes
+        return self._recorded_closes[ticker]
+
+    def get_closing_prices(self, ticker: str, start_date: date, end_date: date) -> dict:
+        ticker = ticker.upper()
+        recorded_closes = self._get_recorded_closes(ticker)
+        if recorded_closes is not None:
+            return {day: close for day, close in recorded_closes.items() if start_date <= day <= end_date}
+
+        closing_prices = {}
+        day = start_date
+        while day <= end_date:
+            if day.weekday() < 5:
+                closing_prices[day] = synthetic_close(ticker, day)
+            day += timedelta(days=1)
+        return closing_prices
+
+    def get_option_chain(self, ticker: str, expiry: str) -> OptionChain:
+        ticker = ticker.upper()
+        path = None if self.directory is None else os.path.join(self.directory, "option_chains", f"{ticker}_{expiry}.json")
+        if path is not None and os.path.exists(path):
+            with open(path) as chain_file:
+                recorded_chain = json.load(chain_file)
+            return OptionChain(
+                pd.DataFrame(**recorded_chain["calls"]),
+                pd.DataFrame(**recorded_chain["puts"]),
+                recorded_chain.get("underlying_price")
+            )
+
+        today = self._get_today()
+        closes = self.get_closing_prices(ticker, today - timedelta(days=SYNTHETIC_CLOSE_LOOKBACK_DAYS), today)
+        if not closes:
+            raise ValueError(f"No closing price for {ticker} to price a synthetic option chain on")
+        underlying_price = closes[max(closes)]
+        calls, puts = synthetic_option_chain(ticker, underlying_price, date.fromisoformat(expiry), today)
+        return OptionChain(calls, puts, underlying_price)
+
+def synthetic_close(ticker: str, day: date) -> float:
+    """
+    Returns the synthetic closing price for the input ticker and date
+    """
+    base_price = 20 + 480 * _unit_hash(ticker, "base")
+    phase = 2 * math.pi * _unit_hash(ticker, "phase")
+    cycle = 0.15 * math.sin(2 * math.pi * day.toordinal() / 365 + phase)
+    noise = 0.04 * (_unit_hash(ticker, day.isoformat()) - 0.5) # +-2%
+    return round(base_price * math.exp(cycle + noise), 2)
+
+def synthetic_strike_step(underlying_price: float) -> float:
+    """
+    Returns the spacing between the strikes of a synthetic chain, wider for more expensive securities like real chains
+    """
+    if underlying_price < 100:
+        return 0.5
+    if underlying_price < 500:
+        return 1.0
+    return 5.0
+
+def synthetic_option_chain(ticker: str, underlying_price: float, expiration_date: date, today: date) -> tuple:
+    """
+    Returns the (calls, puts) DataFrames of the synthetic chain for the input ticker and expiration date, with strikes from 50% to
+    150% of the underlying price
+    """
+    # Imported here since src.util imports data_fetcher, which imports this module
+    from src.util.black_scholes import option_prices
+
+    step = synthetic_strike_step(underlying_price)
+    strikes = np.arange(math.floor(underlying_price * 0.5 / step), math.ceil(underlying_price * 1.5 / step) + 1) * step
+    years_to_expiry = max((expiration_date - today).days, 1) / 365
+    # Each ticker gets its own volatility, with a smile that raises it away from the money
+    log_moneyness = np.log(strikes / underlying_price)
+    volatilities = (0.2 + 0.3 * _unit_hash(ticker, "volatility")) * (1 + 2 * log_moneyness * log_moneyness)
+
+    expiry = expiration_date.strftime("%y%m%d")
+    def chain_side(is_call: bool) -> pd.DataFrame:
+        prices = option_prices(underlying_price, strikes, years_to_expiry, SYNTHETIC_RATE, volatilities, is_call)
+        prices = np.maximum(np.round(prices, 2), 0.01)
+        half_spreads = np.maximum(np.round(prices * 0.02, 2), 0.01)
+        contract_type = "C" if is_call else "P"
+        return pd.DataFrame({
+            "contractSymbol": [f"{ticker}{expiry}{contract_type}{int(round(strike * 1000)):08d}" for strike in strikes],
+            "strike": strikes,
+            "lastPrice": prices,
+            "bid": np.maximum(np.round(prices - half_spreads, 2), 0.0),
+            "ask": np.round(prices + half_spreads, 2),
+            "impliedVolatility": volatilities,
+            "inTheMoney": strikes < underlying_price if is_call else strikes > underlying_price
+        })
+
+    return chain_side(True), chain_side(False)
+
+def record_market_data(source_provider: MarketDataProvider, directory: str, ticker_ranges: dict, chain_keys: list):
+    """
+    Records market data from the input provider(ex: yfinance) into the input directory, in the format LocalMarketDataProvider reads
+
+    ticker_ranges: Dictionary of ticker -> (start_date, end_date) of the closing prices to record
+    chain_keys: List of (ticker, YYYY-MM-DD expiry) option chains to record
+    """
+    os.makedirs(os.path.join(directory, "closes"), exist_ok=True)
+    os.makedirs(os.path.join(directory, "option_chains"), exist_ok=True)
+
+    for ticker, closing_prices in source_provider.get_closing_prices_batch(ticker_ranges).items():
+        if isinstance(closing_prices, Exception):
+            print(f"Unable to record the closing prices for {ticker}: {closing_prices}")
+            continue
+        with open(os.path.join(directory, "closes", f"{ticker.upper()}.csv"), "w", newline="") as closes_file:
+            writer = csv.writer(closes_file)
+            writer.writerow(["date", "close"])
+            for day in sorted(closing_prices):
+                writer.writerow([day.isoformat(), round(closing_prices[day], 2)])
+
+    for (ticker, expiry), option_chain in source_provider.get_option_chains_batch(chain_keys).items():
+        if isinstance(option_chain, Exception):
+            print(f"Unable to record the option chain for {ticker} expiring on {expiry}: {option_chain}")
+            continue
+        with open(os.path.join(directory, "option_chains", f"{ticker.upper()}_{expiry}.json"), "w") as chain_file:
+            json.dump({
+                "underlying_price": option_chain.underlying_price,
+                "calls": json.loads(option_chain.calls.to_json(orient="split", date_format="iso")),
+                "puts": json.loads(option_chain.puts.to_json(orient="split", date_format="iso"))
+            }, chain_file)
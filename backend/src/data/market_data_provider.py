@@ -0,0 +1,58 @@
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from datetime import date
+
+# Both sides of an option chain along with the price of the underlying security(None when the provider doesn't have it)
+OptionChain = namedtuple("OptionChain", ["calls", "puts", "underlying_price"])
+
+# The purpose of this class is to let data_fetcher get its market data from different sources(ex: Yahoo Finance or local files)
+class MarketDataProvider(ABC):
+    """
+    Interface for the sources of market data.
+
+    Providers only fetch data, caching, rate limiting shared across providers and writing through to the market data store are
+    all handled by data_fetcher. Option chains are DataFrames with at least the strike, lastPrice, bid and ask columns(the
+    same as the ones from yfinance).
+
+    The batch methods have default implementations that call the single versions one at a time, providers that can fetch
+    several items in one request should override them. Batch methods never raise, failed items have the exception as their result.
+    Providers have to implement get_closing_prices and get_option_chain, otherwise they can't be created
+    """
+    name: str
+
+    @abstractmethod
+    def get_closing_prices(self, ticker: str, start_date: date, end_date: date) -> dict:
+        """
+        Returns a dictionary of date -> closing price for the input ticker over [start_date, end_date]. Dates the market was
+        closed on are not present in the returned dictionary
+        """
+
+    @abstractmethod
+    def get_option_chain(self, ticker: str, expiry: str) -> OptionChain:
+        """
+        Returns the option chain for the input ticker and YYYY-MM-DD expiry
+        """
+
+    def get_closing_prices_batch(self, ticker_ranges: dict) -> dict:
+        """
+        Returns a dictionary of ticker -> result of get_closing_prices for the input dictionary of ticker -> (start_date, end_date)
+        """
+        results = {}
+        for ticker, (start_date, end_date) in ticker_ranges.items():
+            try:
+                results[ticker] = self.get_closing_prices(ticker, start_date, end_date)
+            except Exception as e:
+                results[ticker] = e
+        return results
+
+    def get_option_chains_batch(self, chain_keys: list) -> dict:
+        """
+        Returns a dictionary of (ticker, expiry) -> result of get_option_chain for the input list of (ticker, YYYY-MM-DD expiry) pairs
+        """
+        results = {}
+        for ticker, expiry in chain_keys:
+            try:
+                results[(ticker, expiry)] = self.get_option_chain(ticker, expiry)
+            except Exception as e:
+                results[(ticker, expiry)] = e
+        return results
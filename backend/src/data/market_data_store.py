@@ -0,0 +1,107 @@
+import hashlib
+import sqlite3
+import threading
+from datetime import date, datetime
+
+# The purpose of this class is to keep market data that never changes(ex: the closing price on a past date) on disk, so that
+# restarting the server doesn't mean re-downloading all of it
+class MarketDataStore:
+    """
+    SQLite backed store for immutable historical market data.
+
+    Stores the closing prices of securities on past dates and the last snapshot we took of each option chain, which stops
+    changing once the chain's expiration date has passed.
+    """
+    path: str
+    conn: sqlite3.Connection
+
+    def __init__(self, path: str):
+        self.path = path
+        # The connection is shared between the market data worker threads, the lock makes sure only one of them uses it at a time
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        # Maps (ticker, expiry, side) -> digest of the last snapshot written for it, so that unchanged chains aren't rewritten
+        self._snapshot_digests = {}
+        self._init_tables()
+
+    def _init_tables(self):
+        with self._lock, self.conn:
+            self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS historical_closes (
+                ticker TEXT NOT NULL,
+                day TEXT NOT NULL,
+                close REAL NOT NULL,
+                PRIMARY KEY (ticker, day)
+            );
+            """)
+            self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS option_chain_snapshots (
+                ticker TEXT NOT NULL,
+                expiry TEXT NOT NULL,
+                side TEXT NOT NULL,
+                captured_at TEXT NOT NULL,
+                chain TEXT NOT NULL,
+                PRIMARY KEY (ticker, expiry, side)
+            );
+            """)
+
+    def get_closing_prices(self, ticker: str, days: set) -> dict:
+        """
+        Returns a dictionary of date -> closing price for the input ticker and dates. Dates that aren't stored are left out
+        """
+        if not days:
+            return {}
+
+        day_strings = [day.isoformat() for day in days]
+        placeholders = ", ".join("?" for _ in day_strings)
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT day, close FROM historical_closes WHERE ticker = ? AND day IN ({placeholders});",
+                (ticker, *day_strings)
+            ).fetchall()
+
+        return {date.fromisoformat(day): close for day, close in rows}
+
+    def put_closing_prices(self, ticker: str, closing_prices: dict):
+        """
+        Stores the input dictionary of date -> closing price for the input ticker.
+
+        Only dates before today are stored since today's close can still change while the market is open
+        """
+        today = datetime.now().date()
+        rows = [(ticker, day.isoformat(), close) for day, close in closing_prices.items() if day < today]
+        if not rows:
+            return
+
+        with self._lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO historical_closes (ticker, day, close) VALUES (?, ?, ?);", rows)
+
+    def get_option_chain_snapshot(self, ticker: str, expiry: str, side: str) -> str:
+        """
+        Returns the last stored snapshot of the input option chain side as a JSON string, or None if there isn't one
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT chain FROM option_chain_snapshots WHERE ticker = ? AND expiry = ? AND side = ?;",
+                (ticker, expiry, side)
+            ).fetchone()
+
+        return row[0] if row else None
+
+    def put_option_chain_snapshot(self, ticker: str, expiry: str, side: str, chain: str):
+        """
+        Stores the input JSON string as the latest snapshot of the input option chain side, replacing the previous snapshot.
+        Nothing is written if the snapshot is the same as the last one stored by this process
+        """
+        digest = hashlib.sha1(chain.encode()).digest()
+        with self._lock, self.conn:
+            if self._snapshot_digests.get((ticker, expiry, side)) == digest:
+                return
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO option_chain_snapshots (ticker, expiry, side, captured_at, chain)
+                VALUES (?, ?, ?, ?, ?);
+                """,
+                (ticker, expiry, side, datetime.now().isoformat(), chain)
+            )
+            self._snapshot_digests[(ticker, expiry, side)] = digest
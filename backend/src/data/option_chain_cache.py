@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+
+# The purpose of this class is to share downloaded option chains across positions so that a refresh cycle only downloads
+# each (ticker, expiry) chain once, regardless of how many positions are on it
+class OptionChainCache:
+    """
+    Size-bounded LRU cache for option chains with a TTL on each entry.
+
+    Entries are keyed by (ticker, expiry), where expiry is a YYYY-MM-DD string, and hold the entire chain(both sides and the
+    underlying price) so that one chain only ever takes up one entry.
+    Entries older than ttl seconds are treated as misses and evicted, and once max_entries is exceeded the least recently
+    used entry is evicted.
+    """
+    ttl: float
+    max_entries: int
+    entries: OrderedDict
+    hits: int
+    misses: int
+    evictions: int
+
+    def __init__(self, ttl: float, max_entries: int):
+        if not ttl > 0:
+            raise ValueError("The cache TTL must be positive")
+        if not max_entries > 0:
+            raise ValueError("The cache must be able to hold at least one entry")
+
+        self.ttl = ttl # In seconds
+        self.max_entries = max_entries
+        self.entries = OrderedDict() # Maps key -> (inserted_at, value), ordered from least to most recently used
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple):
+        """
+        Returns the cached value for the input key, or None if the key is missing or has expired
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            inserted_at, value = entry
+            if time.monotonic() - inserted_at > self.ttl:
+                # Stale entries are dropped right away so they don't take up room until they get pushed out by the LRU
+                del self.entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: tuple, value):
+        """
+        Adds the input value to the cache, evicting the least recently used entries if the cache is full
+        """
+        with self._lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: tuple = None):
+        """
+        Removes the input key from the cache, or clears the entire cache if no key is provided
+        """
+        with self._lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+    def stats(self) -> dict:
+        """
+        Returns the hit/miss counters and current size of the cache
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "size": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl
+            }
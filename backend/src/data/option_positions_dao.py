@@ -1,8 +1,13 @@
+import csv
+import io
 import os
 import psycopg2
+import psycopg2.extras
 from dotenv import load_dotenv
+from src.data.connection_pool import ConnectionPool
 from src.util.options_position import *
 from src.schema.create_and_migrate_schema import apply_migrations
+from src.util.metrics import MetricFamily, registry, timed_function
 
 # Load environment variables from .env file
 load_dotenv()
@@ -12,17 +17,9 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 
-# Connecting to PostgreSQL server
-conn = psycopg2.connect(
-    dbname=DB_NAME,
-    user=DB_USER,
-    password=DB_PASSWORD,
-    host=DB_HOST,
-    port=DB_PORT
-)
-conn.autocommit = True
-cursor = conn.cursor()
-print("Connected to PostgreSQL!")
+# Pool of DB connections, created by init_db. Each DAO method borrows its own connection and cursor from the pool, so requests
+# being served on different threads don't have to share(or wait on) a single connection
+db_pool = None
 
 # current_position_id Sequence
 # We use a PostgreSQL built-in sequence to keep track of the position_id of the latest created position. This auto-increments
@@ -36,12 +33,69 @@ option_positions_fields = """position_id, ticker, contract_type, quantity, trade
                             is_expired, premium, open_price, open_date, position_status, close_price, profit
 """
 
-# Applying the initial schema and migrations
-apply_migrations(conn, cursor)
+# Fields that we allow the user to update, mapped to their column types(needed to cast the values in bulk updates)
+updatable_fields = {
+    "quantity": "int",
+    "close_price": "numeric",
+    "profit": "numeric",
+    "is_expired": "boolean",
+    "position_status": "text",
+    "trade_direction": "text",
+    "premium": "numeric"
+}
+
+# Number of rows sent to the DB per statement in the bulk methods
+BULK_PAGE_SIZE = 1000
+
+# Number of rows fetched from the DB at a time when streaming positions through a server-side cursor
+POSITION_STREAM_ITERSIZE = int(os.getenv("POSITION_STREAM_ITERSIZE", "2000"))
+
+# option_positions_import Table
+# Temporary staging table that imported positions are COPY'd into before being merged into the option_positions table. It only
+# lives for the duration of the import transaction
+OPTION_POSITIONS_IMPORT_TABLE = "option_positions_import"
+option_positions_import_fields = """line_number, ticker, contract_type, quantity, trade_direction, strike_price, expiration_date,
+                                   is_expired, premium, open_price, open_date, position_status, close_price, profit
+"""
+
+# Number of rows buffered in memory before being sent to the DB during an import
+IMPORT_CHUNK_SIZE = 5000
+
+# Latency of each DAO function, which covers waiting for a pooled connection, the queries themselves and converting the rows
+db_query_duration_seconds = registry.histogram(
+    "db_query_duration_seconds", "Time spent in each DB access function, in seconds", ["function"]
+)
+
+def init_db():
+    """
+    Connects to PostgreSQL and applies any migrations that haven't been applied yet. Called once when the app is created, rather
+    than when this module is imported, and needs to run before any of the other DAO methods are used
+    """
+    global db_pool
+    if db_pool is not None:
+        return
+
+    db_pool = ConnectionPool(
+        minconn=int(os.getenv("DB_POOL_MIN_CONNECTIONS", "1")),
+        maxconn=int(os.getenv("DB_POOL_MAX_CONNECTIONS", "10")),
+        timeout=float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30")),
+        health_check_interval=float(os.getenv("DB_POOL_HEALTH_CHECK_SECONDS", "30")),
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT
+    )
+    print("Connected to PostgreSQL!")
+
+    # Applying the initial schema and migrations
+    with db_pool.connection() as conn:
+        with conn.cursor() as cursor:
+            apply_migrations(conn, cursor)
 
 
 # Helper methods
-def check_position_id_is_valid(position_id: int):
+def check_position_id_is_valid(cursor, position_id: int):
     """
     Helper method to check if the input position_id is valid by checking if it is less than or equal to the current position_id
     """
@@ -50,6 +104,39 @@ def check_position_id_is_valid(position_id: int):
 
     if current_position_id < position_id:
         raise Exception(f"Input position_id {position_id} can not be greater than current position_id {current_position_id}")
+
+def check_updates_are_valid(updates: dict):
+    """
+    Helper method to make sure that no field is duplicated and all fields are valid for updates
+    """
+    fields_to_update = set()
+    for field in updates.keys():
+        if field not in updatable_fields:
+            raise Exception(f"Field {field} is not allowed to be updated")
+        if field in fields_to_update:
+            raise Exception("Can not add multiple of the same field to the updates dictionary")
+        fields_to_update.add(field)
+
+def options_position_to_row(position_id: int, position: OptionsPosition) -> tuple:
+    """
+    Helper method to convert the input position into a row of option_positions_fields values, using the input position_id
+    """
+    return (
+        position_id,
+        position.ticker,
+        position.contract_type.value,
+        position.quantity,
+        position.trade_direction.value,
+        position.strike_price,
+        position.expiration_date,
+        position.is_expired,
+        position.premium,
+        position.open_price,
+        position.open_date,
+        position.position_status.value,
+        position.close_price,
+        position.profit
+    )
     
 def row_to_options_position(row: dict) -> OptionsPosition:
     # Convert row to object and return
@@ -72,91 +159,178 @@ def row_to_options_position(row: dict) -> OptionsPosition:
 
 
 # Read methods
+@timed_function(db_query_duration_seconds)
 def is_position_expired(position_id: int) -> bool:
     """
     Returns whether the OptionsPosition corresponding to the input position_id is expired
     """
-    check_position_id_is_valid(position_id)
-
     try:
         # Use a READ_COMMITTED transaction to get the option position by position_id
-        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED)
-        cursor.execute(f"""
-           SELECT is_expired FROM {OPTION_POSITIONS_TABLE} WHERE position_id = %s            
-        """, (position_id,))
-        row = cursor.fetchone()
-        if not row:
-            # This means that the corresponding position does not exist
-            print(f"Position corresponding to position_id {position_id} does not exist.")
-            return None
-
-        return row[0]
+        with db_pool.transaction(psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED) as cursor:
+            check_position_id_is_valid(cursor, position_id)
+            cursor.execute(f"""
+               SELECT is_expired FROM {OPTION_POSITIONS_TABLE} WHERE position_id = %s            
+            """, (position_id,))
+            row = cursor.fetchone()
     except Exception as e:
-        conn.rollback()
         print(f"Encountered error {e}")
         raise e
 
+    if not row:
+        # This means that the corresponding position does not exist
+        print(f"Position corresponding to position_id {position_id} does not exist.")
+        return None
+
+    return row[0]
+
+@timed_function(db_query_duration_seconds)
 def get_option_position(position_id: int) -> OptionsPosition:
     """
     Returns the OptionsPosition corresponding to the input position_id
     """
-    check_position_id_is_valid(position_id)
-
     try:
         # Use a READ_COMMITTED transaction to get the option position by position_id
-        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED)
-        cursor.execute(f"""
-           SELECT {option_positions_fields} FROM {OPTION_POSITIONS_TABLE} WHERE position_id = %s            
-        """, (position_id))
-        row = cursor.fetchone()
-        if not row:
-            # This means that the corresponding position does not exist
-            print(f"Position corresponding to position_id {position_id} does not exist.")
-            return None
-
-        return row_to_options_position(row)
+        with db_pool.transaction(psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED) as cursor:
+            check_position_id_is_valid(cursor, position_id)
+            cursor.execute(f"""
+               SELECT {option_positions_fields} FROM {OPTION_POSITIONS_TABLE} WHERE position_id = %s            
+            """, (position_id,))
+            row = cursor.fetchone()
     except Exception as e:
-        conn.rollback()
         print(f"Encountered error {e}")
         raise e
 
+    if not row:
+        # This means that the corresponding position does not exist
+        print(f"Position corresponding to position_id {position_id} does not exist.")
+        return None
+
+    return row_to_options_position(row)
+
+@timed_function(db_query_duration_seconds)
 def get_positions(get_active: bool, get_expired: bool) -> list:
     """
     Returns all option positions based on the input arguments.
     If get_active is true, then we'll add active positions to the return list. Same for expired positions if get_expired is true.
     The returned result will be ordered by expiration date
     """
+    return list(iter_positions(get_active, get_expired))
+
+@timed_function(db_query_duration_seconds)
+def iter_positions(get_active: bool, get_expired: bool, itersize: int = POSITION_STREAM_ITERSIZE):
+    """
+    Generator version of get_positions, which yields the option positions one at a time ordered by expiration date.
+
+    Rows are read through a server-side cursor itersize rows at a time, so memory use doesn't grow with the number of positions.
+    The DB connection is held until the generator is exhausted or closed
+    """
     if not get_active and not get_expired:
-        return []
+        return
+
+    conditional_statement = ""
+    if get_active != get_expired:
+        conditional_statement += "WHERE is_expired = "
+        conditional_statement += "false" if get_active else "true"
 
-    rows = None
     try:
-        # Use a READ_COMMITTED transaction to get the option position by position_id
-        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED)
-
-        conditional_statement = ""
-        if get_active != get_expired:
-            conditional_statement += "WHERE is_expired = "
-            conditional_statement += "false" if get_active else "true"
-        
-        cursor.execute(f"""
-        SELECT {option_positions_fields} FROM {OPTION_POSITIONS_TABLE} {conditional_statement} ORDER BY expiration_date  
-        """)
-        rows = cursor.fetchall()
+        # Use a READ_COMMITTED transaction to get the option positions
+        with db_pool.transaction(psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED, cursor_name="iter_positions") as cursor:
+            cursor.itersize = itersize
+            cursor.execute(f"""
+            SELECT {option_positions_fields} FROM {OPTION_POSITIONS_TABLE} {conditional_statement} ORDER BY expiration_date, position_id
+            """)
+            for row in cursor:
+                yield row_to_options_position(row)
+    except Exception as e:
+        print(f"Encountered error {e}")
+        raise e
+
+@timed_function(db_query_duration_seconds)
+def query_positions(filters: dict, limit: int, after: tuple = None) -> list:
+    """
+    Returns up to limit option positions matching the input filters, ordered by (expiration_date, position_id).
+
+    Pagination is keyset based: after is the (expiration_date, position_id) of the last position of the previous page, and only
+    positions that come after it are returned. This keeps every page an index range scan no matter how deep into the results it is.
+
+    Supported filters(all optional): ticker, contract_type, trade_direction, position_status, is_expired, expiration_from,
+    expiration_to, open_from and open_to. Date ranges are inclusive
+    """
+    conditions = []
+    values = []
+
+    # Maps each equality filter to its column
+    equality_filters = {
+        "ticker": "ticker",
+        "contract_type": "contract_type",
+        "trade_direction": "trade_direction",
+        "position_status": "position_status",
+        "is_expired": "is_expired"
+    }
+    for filter_name, column in equality_filters.items():
+        if filters.get(filter_name) is not None:
+            conditions.append(f"{column} = %s")
+            values.append(filters[filter_name])
+
+    # Maps each range filter to its column and comparison
+    range_filters = {
+        "expiration_from": ("expiration_date", ">="),
+        "expiration_to": ("expiration_date", "<="),
+        "open_from": ("open_date", ">="),
+        "open_to": ("open_date", "<=")
+    }
+    for filter_name, (column, comparison) in range_filters.items():
+        if filters.get(filter_name) is not None:
+            conditions.append(f"{column} {comparison} %s")
+            values.append(filters[filter_name])
+
+    if after is not None:
+        conditions.append("(expiration_date, position_id) > (%s, %s)")
+        values.extend(after)
+
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    values.append(limit)
+
+    try:
+        with db_pool.transaction(psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED) as cursor:
+            cursor.execute(f"""
+            SELECT {option_positions_fields} FROM {OPTION_POSITIONS_TABLE} {where_clause}
+            ORDER BY expiration_date, position_id LIMIT %s
+            """, values)
+            rows = cursor.fetchall()
     except Exception as e:
-        conn.rollback()
         print(f"Encountered error {e}")
         raise e
-    
-    result = []
-    if rows:
-        for row in rows:
-            result.append(row_to_options_position(row))
 
-    return result
+    return [row_to_options_position(row) for row in rows]
+
+def get_connection_pool_stats() -> dict:
+    """
+    Returns the utilization and wait time statistics of the DB connection pool, or an empty dictionary before init_db has run
+    """
+    return db_pool.stats() if db_pool is not None else {}
+
+def collect_connection_pool_metrics() -> list:
+    """
+    Returns the connection pool statistics as metrics
+    """
+    if db_pool is None:
+        return []
+    stats = db_pool.stats()
+    return [
+        MetricFamily("db_pool_connections_in_use", "gauge", "Number of DB connections currently borrowed from the pool", [({}, stats["in_use"])]),
+        MetricFamily("db_pool_max_connections", "gauge", "Maximum number of DB connections in the pool", [({}, stats["max_connections"])]),
+        MetricFamily("db_pool_checkouts_total", "counter", "Number of times a DB connection was borrowed", [({}, stats["checkouts"])]),
+        MetricFamily("db_pool_wait_seconds_total", "counter", "Total time spent waiting for a DB connection, in seconds", [({}, stats["total_wait_time"])]),
+        MetricFamily("db_pool_timeouts_total", "counter", "Number of times waiting for a DB connection timed out", [({}, stats["timeouts"])]),
+        MetricFamily("db_pool_reconnects_total", "counter", "Number of dropped DB connections that were replaced", [({}, stats["reconnects"])])
+    ]
+
+registry.add_collector(collect_connection_pool_metrics)
 
 
 # Write methods
+@timed_function(db_query_duration_seconds)
 def add_option_position(position: OptionsPosition) -> int:
     """
     Adds the input option position to the DB and returns the position_id corresponding to this position(for the frontend to use)
@@ -164,67 +338,129 @@ def add_option_position(position: OptionsPosition) -> int:
     position_id = None
     try:
         # We use a SERIALIZABLE transaction here to read from the current_position_id table and increment it by one for our new record
-        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE)
-        cursor.execute(f"SELECT nextval('{CURRENT_POSITION_ID_SEQUENCE}');") # Retrieves the next position_id and increments the sequence
-        position_id = cursor.fetchone()[0] # The id to assign to this current position
-
-        # Now insert the position with the position_id into the option_positions table
-        cursor.execute(f"""
-            INSERT INTO {OPTION_POSITIONS_TABLE} ({option_positions_fields})
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
-        """, (
-            position_id,
-            position.ticker,
-            position.contract_type.value,
-            position.quantity,
-            position.trade_direction.value,
-            position.strike_price,
-            position.expiration_date,
-            position.is_expired,
-            position.premium,
-            position.open_price,
-            position.open_date,
-            position.position_status.value,
-            position.close_price,
-            position.profit
-        ))
-
-        # Commit transaction
-        conn.commit()
+        with db_pool.transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cursor:
+            cursor.execute(f"SELECT nextval('{CURRENT_POSITION_ID_SEQUENCE}');") # Retrieves the next position_id and increments the sequence
+            position_id = cursor.fetchone()[0] # The id to assign to this current position
+
+            # Now insert the position with the position_id into the option_positions table
+            cursor.execute(f"""
+                INSERT INTO {OPTION_POSITIONS_TABLE} ({option_positions_fields})
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+            """, options_position_to_row(position_id, position))
     except Exception as e:
-        conn.rollback()
         print(f"Encountered error {e}")
         raise e
 
     return position_id
 
+@timed_function(db_query_duration_seconds)
+def bulk_add_option_positions(positions: list) -> list:
+    """
+    Adds the input option positions to the DB in a single transaction and returns their position_ids, in the same order as the input
+    """
+    if not positions:
+        return []
+
+    position_ids = None
+    try:
+        with db_pool.transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cursor:
+            # Retrieving all the position_ids we need from the sequence in one query
+            cursor.execute(f"SELECT nextval('{CURRENT_POSITION_ID_SEQUENCE}') FROM generate_series(1, %s);", (len(positions),))
+            position_ids = [row[0] for row in cursor.fetchall()]
+
+            psycopg2.extras.execute_values(
+                cursor,
+                f"INSERT INTO {OPTION_POSITIONS_TABLE} ({option_positions_fields}) VALUES %s;",
+                [options_position_to_row(position_id, position) for position_id, position in zip(position_ids, positions)],
+                page_size=BULK_PAGE_SIZE
+            )
+    except Exception as e:
+        print(f"Encountered error {e}")
+        raise e
+
+    print(f"Successfully added {len(position_ids)} positions")
+    return position_ids
+
+@timed_function(db_query_duration_seconds)
+def import_option_positions(numbered_positions) -> dict:
+    """
+    Imports the input positions into the DB in a single transaction and returns a dictionary of line_number -> position_id.
+
+    Positions are stored as active, reconciling them(ex: settling the ones that are already expired) is left to the caller.
+
+    numbered_positions is an iterable of (line_number, OptionsPosition) pairs, where line_number identifies where the position came
+    from(ex: the line in a CSV file). It is consumed lazily and COPY'd into a staging table in chunks, so the positions never all
+    have to be held in memory at once. The staging table is then merged into the option_positions table
+    """
+    try:
+        with db_pool.transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cursor:
+            cursor.execute(f"""
+                CREATE TEMP TABLE {OPTION_POSITIONS_IMPORT_TABLE} (
+                    line_number INT NOT NULL,
+                    position_id INT,
+                    ticker TEXT NOT NULL,
+                    contract_type TEXT NOT NULL,
+                    quantity INT NOT NULL,
+                    trade_direction TEXT NOT NULL,
+                    strike_price NUMERIC(10, 2) NOT NULL,
+                    expiration_date DATE NOT NULL,
+                    is_expired BOOLEAN NOT NULL,
+                    premium NUMERIC(10, 2) NOT NULL,
+                    open_price NUMERIC(10, 2) NOT NULL,
+                    open_date DATE NOT NULL,
+                    position_status TEXT NOT NULL,
+                    close_price NUMERIC(10, 2),
+                    profit NUMERIC(10, 2)
+                ) ON COMMIT DROP;
+            """)
+
+            def copy_chunk(buffer: io.StringIO):
+                buffer.seek(0)
+                cursor.copy_expert(f"COPY {OPTION_POSITIONS_IMPORT_TABLE} ({option_positions_import_fields}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            num_buffered_rows = 0
+            for line_number, position in numbered_positions:
+                # Replacing the position_id with the line_number, the real position_ids are assigned during the merge. Positions are
+                # imported as active(the same way blindly created positions are before their market data is reconciled), since the
+                # is_expired field is only set once the position gets settled
+                row = options_position_to_row(position.position_id, position)
+                writer.writerow((line_number, *row[1:7], False, *row[8:]))
+                num_buffered_rows += 1
+
+                if num_buffered_rows == IMPORT_CHUNK_SIZE:
+                    copy_chunk(buffer)
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    num_buffered_rows = 0
+
+            if num_buffered_rows:
+                copy_chunk(buffer)
+
+            # Merging the staging table into the option_positions table
+            cursor.execute(f"UPDATE {OPTION_POSITIONS_IMPORT_TABLE} SET position_id = nextval('{CURRENT_POSITION_ID_SEQUENCE}');")
+            cursor.execute(f"""
+                INSERT INTO {OPTION_POSITIONS_TABLE} ({option_positions_fields})
+                SELECT {option_positions_fields} FROM {OPTION_POSITIONS_IMPORT_TABLE};
+            """)
+            cursor.execute(f"SELECT line_number, position_id FROM {OPTION_POSITIONS_IMPORT_TABLE};")
+            position_ids = {line_number: position_id for line_number, position_id in cursor.fetchall()}
+    except Exception as e:
+        print(f"Encountered error {e}")
+        raise e
+
+    print(f"Successfully imported {len(position_ids)} positions")
+    return position_ids
+
+@timed_function(db_query_duration_seconds)
 def update_option_position(position_id: int, updates: dict):
     """
     Updates the fields in updates for the input position
     """
     if not updates: return
 
-    check_position_id_is_valid(position_id)
-    
-    # Fields that we allow the user to update
-    valid_fields = {
-        "quantity",
-        "close_price",
-        "profit",
-        "is_expired",
-        "position_status",
-        "trade_direction",
-        "premium"
-    }
-
-    # Making sure that no field is duplicated and all fields are valid for updates
-    fields_to_update = set()
-    for field in updates.keys():
-        if field not in valid_fields:
-            raise Exception(f"Field {field} is not allowed to be updated")
-        if field in fields_to_update:
-            raise Exception("Can not add multiple of the same field to the updates dictionary")
-        fields_to_update.add(field)
+    check_updates_are_valid(updates)
 
     # Constructing the query
     set_clause = ", ".join([f"{key} = %s" for key in updates.keys()])
@@ -238,31 +474,73 @@ def update_option_position(position_id: int, updates: dict):
 
     # Executing the command
     try:
-        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE)
-        cursor.execute(command, values)
-        conn.commit()
+        with db_pool.transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cursor:
+            check_position_id_is_valid(cursor, position_id)
+            cursor.execute(command, values)
     except Exception as e:
-        conn.rollback()
         print(f"Encountered error {e}")
         raise e
 
     print(f"Successfully updated position corresponding to position_id {position_id}")
 
+@timed_function(db_query_duration_seconds)
+def bulk_update_option_positions(position_updates: list):
+    """
+    Applies the input list of (position_id, updates) pairs in a single transaction, where each updates dictionary has the same
+    format as the one for update_option_position.
+
+    Updates that change the same set of fields are sent together as one UPDATE ... FROM (VALUES ...) statement
+    """
+    position_updates = [(position_id, updates) for position_id, updates in position_updates if updates]
+    if not position_updates:
+        return
+
+    # Grouping the updates by the fields that they change, since each statement can only set one set of columns
+    updates_by_fields = {}
+    for position_id, updates in position_updates:
+        check_updates_are_valid(updates)
+        fields = tuple(sorted(updates.keys()))
+        updates_by_fields.setdefault(fields, []).append((position_id, *[updates[field] for field in fields]))
+
+    try:
+        with db_pool.transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cursor:
+            check_position_id_is_valid(cursor, max(position_id for position_id, _ in position_updates))
+
+            for fields, rows in updates_by_fields.items():
+                set_clause = ", ".join([f"{field} = v.{field}" for field in fields])
+                # The VALUES list has no column types of its own, so we cast each value to the type of its column
+                template = "(" + ", ".join(["%s::int"] + [f"%s::{updatable_fields[field]}" for field in fields]) + ")"
+                psycopg2.extras.execute_values(
+                    cursor,
+                    f"""
+                    UPDATE {OPTION_POSITIONS_TABLE} AS t
+                    SET {set_clause}
+                    FROM (VALUES %s) AS v(position_id, {", ".join(fields)})
+                    WHERE t.position_id = v.position_id
+                    """,
+                    rows,
+                    template=template,
+                    page_size=BULK_PAGE_SIZE
+                )
+    except Exception as e:
+        print(f"Encountered error {e}")
+        raise e
+
+    print(f"Successfully updated {len(position_updates)} positions")
+
+@timed_function(db_query_duration_seconds)
 def delete_option_position(position_id: int):
     """
     Deletes the position corresponding to the input position_id from the table
     """
-    check_position_id_is_valid(position_id)
-    
     try:
-        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE)
-        cursor.execute(
-            f"""DELETE FROM {OPTION_POSITIONS_TABLE} where position_id = %s;""",
-            (position_id,) 
-        )
-        conn.commit()
+        with db_pool.transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cursor:
+            check_position_id_is_valid(cursor, position_id)
+            cursor.execute(
+                f"""DELETE FROM {OPTION_POSITIONS_TABLE} where position_id = %s;""",
+                (position_id,) 
+            )
     except Exception as e:
-        conn.rollback()
         print(f"Encountered error {e}")
         raise e
     
@@ -0,0 +1,46 @@
+import threading
+from concurrent.futures import Future
+
+# The purpose of this class is to collapse concurrent fetches of the same data into a single upstream call
+class SingleFlight:
+    """
+    Makes sure that only one call per key is in flight at a time.
+
+    The first caller for a key runs the function, and any callers that come in for the same key while it is running wait for
+    it and share its result(or its exception) instead of making their own call.
+    """
+    in_flight: dict
+    shared_calls: int
+
+    def __init__(self):
+        self.in_flight = {} # Maps key -> Future for the call that is currently running
+        self.shared_calls = 0 # Number of calls that were served by another caller's fetch
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Returns func(*args, **kwargs), sharing the call with any concurrent callers for the same key
+        """
+        with self._lock:
+            future = self.in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self.in_flight[key] = future
+            else:
+                self.shared_calls += 1
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            result = func(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            # Removing the key once the call is done so that later callers make a fresh call
+            with self._lock:
+                del self.in_flight[key]
@@ -0,0 +1,53 @@
+from datetime import date, datetime, timedelta
+import yfinance as yf
+from src.data.market_data_provider import MarketDataProvider, OptionChain
+from src.data.single_flight import SingleFlight
+
+class YFinanceProvider(MarketDataProvider):
+    """
+    Market data from Yahoo Finance through yfinance. Every call to Yahoo goes through the input rate limiter
+    """
+    name = "yfinance"
+
+    def __init__(self, rate_limiter):
+        self.rate_limiter = rate_limiter
+        # Dictionary containing the tickers we've already instantiated(computing power for memory tradeoff)
+        self.tickers = {}
+        self._single_flight = SingleFlight()
+
+    def get_ticker_object(self, ticker: str) -> yf.Ticker:
+        """
+        Returns the Ticker object for the input ticker string
+
+        TODO: Check if exception is thrown when the ticker doesn't exist
+        """
+        if ticker in self.tickers:
+            return self.tickers[ticker]
+
+        return self._single_flight.do(ticker, self._create_ticker_object, ticker)
+
+    def _create_ticker_object(self, ticker: str) -> yf.Ticker:
+        security = self.rate_limiter.call(yf.Ticker, ticker)
+        self.tickers[ticker] = security
+        return security
+
+    def get_closing_prices(self, ticker: str, start_date: date, end_date: date) -> dict:
+        security = self.get_ticker_object(ticker)
+
+        # The end of the history range is exclusive, so we fetch up to the day after end_date
+        start_day = datetime.combine(start_date, datetime.min.time())
+        end_day = datetime.combine(end_date, datetime.min.time()) + timedelta(days=1)
+        historical_data = self.rate_limiter.call_endpoint("history", security.history, start=start_day, end=end_day)
+        return {timestamp.date(): float(close) for timestamp, close in historical_data['Close'].items()}
+
+    def get_option_chain(self, ticker: str, expiry: str) -> OptionChain:
+        security = self.get_ticker_object(ticker)
+        entire_option_chain = self.rate_limiter.call_endpoint("option_chain", security.option_chain, date=expiry)
+
+        # Older versions of yfinance don't return the underlying quote with the chain
+        underlying_price = (getattr(entire_option_chain, "underlying", None) or {}).get("regularMarketPrice")
+        return OptionChain(
+            entire_option_chain.calls,
+            entire_option_chain.puts,
+            None if underlying_price is None else float(underlying_price)
+        )
@@ -1,4 +1,5 @@
 import os
+import psycopg2.errors
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 migrations_folder_name = "migrations"
@@ -28,8 +29,26 @@ def get_applied_migrations(cursor):
     
     return applied_migrations
 
+def has_pending_migrations(conn, cursor) -> bool:
+    """Check with a single query whether any migration file hasn't been applied yet."""
+    try:
+        applied_migrations = get_applied_migrations(cursor)
+    except psycopg2.errors.UndefinedTable:
+        # Fresh DB, schema_migrations gets created by apply_migrations
+        conn.rollback()
+        return True
+    conn.commit()
+
+    return any(migration_file not in applied_migrations for migration_file in migration_files)
+
 def apply_migrations(conn, cursor):
     """Apply new migration files in order."""
+    # A startup with nothing pending only needs this one query, a startup that finds a pending migration goes on to the full
+    # migration path below
+    if not has_pending_migrations(conn, cursor):
+        print("🎉 Schema is up to date, no migrations to apply")
+        return
+
     init_migrations_table(conn, cursor)
     
     applied_migrations = get_applied_migrations(cursor)
@@ -0,0 +1,3 @@
+CREATE INDEX IF NOT EXISTS idx_expiration_date_position_id ON option_positions (expiration_date, position_id);
+CREATE INDEX IF NOT EXISTS idx_ticker_expiration_date_position_id ON option_positions (ticker, expiration_date, position_id);
+CREATE INDEX IF NOT EXISTS idx_is_expired_expiration_date_position_id ON option_positions (is_expired, expiration_date, position_id);
@@ -0,0 +1,294 @@
+from datetime import datetime
+import numpy as np
+from .options_position import ContractType, TradeDirection
+from .scheduler import MARKET_CLOSE, MARKET_TIMEZONE
+
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60
+
+# Bounds on the volatilities the implied volatility solver searches between
+MIN_VOLATILITY = 1e-4
+MAX_VOLATILITY = 5.0
+
+# Maximum number of (position, scenario) values computed at once when broadcasting scenarios over the positions
+SCENARIO_CHUNK_ELEMENTS = 100_000
+
+# Time to expiry(in years) used for scenarios at or past the expiration, small enough that options are worth their exercise value
+MIN_YEARS_TO_EXPIRY = 1e-12
+
+def norm_pdf(x: np.ndarray) -> np.ndarray:
+    """
+    Returns the standard normal probability density at each of the input values
+    """
+    return np.exp(-0.5 * x * x) / np.sqrt(2 * np.pi)
+
+def norm_cdf(x: np.ndarray) -> np.ndarray:
+    """
+    Returns the standard normal cumulative probability at each of the input values.
+
+    Uses the Abramowitz and Stegun 7.1.26 approximation of erf, which is accurate to about 1e-7 and avoids needing SciPy
+    """
+    z = np.abs(x) / np.sqrt(2)
+    t = 1 / (1 + 0.3275911 * z)
+    polynomial = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1 - polynomial * np.exp(-z * z)
+    return 0.5 * (1 + np.sign(x) * erf)
+
+def _d1_d2(underlying_prices, strike_prices, years_to_expiry, rate, volatilities) -> tuple:
+    volatility_sqrt_time = volatilities * np.sqrt(years_to_expiry)
+    d1 = (np.log(underlying_prices / strike_prices) + (rate + 0.5 * volatilities * volatilities) * years_to_expiry) / volatility_sqrt_time
+    return d1, d1 - volatility_sqrt_time
+
+def option_prices(
+    underlying_prices: np.ndarray,
+    strike_prices: np.ndarray,
+    years_to_expiry: np.ndarray,
+    rate: float,
+    volatilities: np.ndarray,
+    is_call: np.ndarray
+) -> np.ndarray:
+    """
+    Returns the Black-Scholes prices of the input options(European exercise, no dividends)
+    """
+    d1, d2 = _d1_d2(underlying_prices, strike_prices, years_to_expiry, rate, volatilities)
+    discounted_strikes = strike_prices * np.exp(-rate * years_to_expiry)
+    call_prices = underlying_prices * norm_cdf(d1) - discounted_strikes * norm_cdf(d2)
+    put_prices = discounted_strikes * norm_cdf(-d2) - underlying_prices * norm_cdf(-d1)
+    return np.where(is_call, call_prices, put_prices)
+
+def option_greeks(
+    underlying_prices: np.ndarray,
+    strike_prices: np.ndarray,
+    years_to_expiry: np.ndarray,
+    rate: float,
+    volatilities: np.ndarray,
+    is_call: np.ndarray
+) -> dict:
+    """
+    Returns a dictionary of greek -> array of the Black-Scholes greeks of the input options, per share of the underlying security.
+
+    Theta is per calendar day and vega is per volatility point(1%)
+    """
+    d1, d2 = _d1_d2(underlying_prices, strike_prices, years_to_expiry, rate, volatilities)
+    sqrt_time = np.sqrt(years_to_expiry)
+    discounted_strikes = strike_prices * np.exp(-rate * years_to_expiry)
+    pdf_d1 = norm_pdf(d1)
+
+    decay = -underlying_prices * pdf_d1 * volatilities / (2 * sqrt_time)
+    call_theta = decay - rate * discounted_strikes * norm_cdf(d2)
+    put_theta = decay + rate * discounted_strikes * norm_cdf(-d2)
+    return {
+        "delta": np.where(is_call, norm_cdf(d1), norm_cdf(d1) - 1),
+        "gamma": pdf_d1 / (underlying_prices * volatilities * sqrt_time),
+        "theta": np.where(is_call, call_theta, put_theta) / 365,
+        "vega": underlying_prices * pdf_d1 * sqrt_time / 100
+    }
+
+def implied_volatilities(
+    market_prices: np.ndarray,
+    underlying_prices: np.ndarray,
+    strike_prices: np.ndarray,
+    years_to_expiry: np.ndarray,
+    rate: float,
+    is_call: np.ndarray,
+    tolerance: float = 1e-6,
+    max_iterations: int = 100
+) -> np.ndarray:
+    """
+    Returns the volatilities at which the Black-Scholes prices of the input options match their market prices.
+
+    Every option is solved at once using Newton's method, falling back to a bisection step for the options whose Newton step
+    would leave the [MIN_VOLATILITY, MAX_VOLATILITY] bracket(ex: when vega is close to 0). Options whose market price is outside
+    the range of possible Black-Scholes prices, or that haven't converged after max_iterations, get NaN
+    """
+    volatilities = np.full(market_prices.shape, 0.3)
+    lower = np.full(market_prices.shape, MIN_VOLATILITY)
+    upper = np.full(market_prices.shape, MAX_VOLATILITY)
+
+    # Options that can't be solved are marked as done from the start
+    with np.errstate(invalid="ignore"):
+        lowest_prices = option_prices(underlying_prices, strike_prices, years_to_expiry, rate, lower, is_call)
+        highest_prices = option_prices(underlying_prices, strike_prices, years_to_expiry, rate, upper, is_call)
+        solvable = (market_prices > lowest_prices) & (market_prices < highest_prices) & (years_to_expiry > 0)
+    converged = ~solvable
+
+    for _ in range(max_iterations):
+        active = ~converged
+        if not active.any():
+            break
+
+        # Only the options that are still being solved are repriced
+        prices = option_prices(
+            underlying_prices[active], strike_prices[active], years_to_expiry[active], rate, volatilities[active], is_call[active]
+        )
+        vegas = option_greeks(
+            underlying_prices[active], strike_prices[active], years_to_expiry[active], rate, volatilities[active], is_call[active]
+        )["vega"] * 100
+        differences = prices - market_prices[active]
+
+        # Prices increase with volatility, so the sign of the difference tells us which side of the root we're on
+        current = volatilities[active]
+        lower[active] = np.where(differences < 0, current, lower[active])
+        upper[active] = np.where(differences > 0, current, upper[active])
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            newton_steps = current - differences / vegas
+        in_bracket = (newton_steps > lower[active]) & (newton_steps < upper[active])
+        volatilities[active] = np.where(in_bracket, newton_steps, (lower[active] + upper[active]) / 2)
+
+        newly_converged = np.abs(differences) < tolerance
+        converged[np.flatnonzero(active)[newly_converged]] = True
+
+    return np.where(solvable & converged, volatilities, np.nan)
+
+def calculate_position_greeks(positions: list, market_data: dict, rate: float, now: datetime = None) -> dict:
+    """
+    Returns the implied volatility and greeks of each of the input active positions along with the greek totals per ticker.
+
+    market_data is the dictionary of position_id -> (underlying price, bid, ask, last price) from get_options_market_data. Options
+    are priced at the middle of the bid and ask when there is a valid quote and at the last price otherwise. The position greeks
+    are the per share greeks times the number of shares the position controls, negated for short positions.
+
+    Positions without market data are left out, and positions whose implied volatility couldn't be solved for have None greeks
+    and are left out of the totals
+    """
+    now = now or datetime.now(MARKET_TIMEZONE)
+    positions = [position for position in positions if position.position_id in market_data]
+    quotes = np.array([market_data[position.position_id] for position in positions], dtype=np.float64).reshape(-1, 4)
+    underlying_prices, bids, asks, last_prices = quotes.T
+
+    strike_prices = np.array([position.strike_price for position in positions], dtype=np.float64)
+    is_call = np.array([position.contract_type == ContractType.CALL for position in positions], dtype=bool)
+    # Options stop trading at the close on their expiration date. Positions share a handful of expiration dates, so each date is
+    # only converted once
+    expiration_dates = {position.expiration_date for position in positions}
+    years_to_expiry_by_date = {
+        expiration_date: (datetime.combine(expiration_date, MARKET_CLOSE, tzinfo=MARKET_TIMEZONE) - now).total_seconds() / SECONDS_PER_YEAR
+        for expiration_date in expiration_dates
+    }
+    years_to_expiry = np.array([years_to_expiry_by_date[position.expiration_date] for position in positions], dtype=np.float64)
+    shares = np.array([
+        position.quantity * 100 * (1 if position.trade_direction == TradeDirection.LONG else -1) for position in positions
+    ], dtype=np.float64)
+
+    with np.errstate(invalid="ignore"):
+        has_valid_quote = (bids > 0) & (asks >= bids)
+    market_prices = np.where(has_valid_quote, (bids + asks) / 2, last_prices)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        volatilities = implied_volatilities(market_prices, underlying_prices, strike_prices, years_to_expiry, rate, is_call)
+        greeks = {greek: values * shares for greek, values in option_greeks(
+            underlying_prices, strike_prices, years_to_expiry, rate, volatilities, is_call
+        ).items()}
+    solved = ~np.isnan(volatilities)
+
+    tickers, ticker_codes = np.unique(np.array([position.ticker for position in positions], dtype=str), return_inverse=True)
+    by_ticker = {str(ticker): {"positions": 0} for ticker in tickers}
+    for ticker, count in zip(tickers, np.bincount(ticker_codes[solved], minlength=len(tickers))):
+        by_ticker[str(ticker)]["positions"] = int(count)
+    for greek, values in greeks.items():
+        totals = np.bincount(ticker_codes[solved], weights=values[solved], minlength=len(tickers))
+        for ticker, total in zip(tickers, totals):
+            by_ticker[str(ticker)][greek] = float(total)
+
+    # Converting the columns to lists once is much faster than reading the arrays one element at a time
+    def to_list(values: np.ndarray) -> list:
+        return np.where(np.isnan(values), None, values).tolist()
+
+    columns = {
+        "underlying_price": to_list(underlying_prices),
+        "option_price": to_list(market_prices),
+        "implied_volatility": to_list(volatilities),
+        **{greek: to_list(values) for greek, values in greeks.items()}
+    }
+    position_greeks = [
+        {"position_id": position.position_id, "ticker": position.ticker, **{column: values[i] for column, values in columns.items()}}
+        for i, position in enumerate(positions)
+    ]
+
+    return {
+        "positions": position_greeks,
+        "by_ticker": by_ticker,
+        "unsolved_positions": int((~solved).sum())
+    }
+
+def calculate_scenario_profits(
+    positions: list,
+    underlying_prices: np.ndarray,
+    volatilities: np.ndarray,
+    price_moves: np.ndarray,
+    volatility_shifts: np.ndarray,
+    days_forward: np.ndarray,
+    rate: float,
+    now: datetime = None
+) -> np.ndarray:
+    """
+    Returns the total profit of the input active positions under every combination of the input scenarios, as an array with the
+    shape (len(price_moves), len(volatility_shifts), len(days_forward)).
+
+    In each scenario the underlying prices are moved by price_moves(ex: 0.05 for +5%), the volatilities are shifted by
+    volatility_shifts(ex: 0.02 for +2 volatility points) and the clock is moved days_forward calendar days ahead. Options are
+    valued with Black-Scholes, which comes out to their exercise value(the same as update_position_at_maturity) once the scenario
+    is past their expiration. The profit of each position is computed the same way as calculate_profit does for open positions.
+
+    To keep the work down:
+        Positions on the same contract have the same value in every scenario, so each contract is only valued once and weighted
+            by the net number of shares held on it
+        Only the call values are computed over the whole grid, the puts are valued off of them using put-call parity, whose
+            extra terms don't depend on the volatility and are summed over the positions before being broadcast
+        The grid is broadcast over SCENARIO_CHUNK_ELEMENTS values at a time, so memory use stays bounded for large grids
+    """
+    now = now or datetime.now(MARKET_TIMEZONE)
+    grid_shape = (len(price_moves), len(volatility_shifts), len(days_forward))
+    chunk_size = max(1, SCENARIO_CHUNK_ELEMENTS // max(grid_shape[0] * grid_shape[1] * grid_shape[2], 1))
+
+    shares = np.array([
+        position.quantity * 100 * (1 if position.trade_direction == TradeDirection.LONG else -1) for position in positions
+    ], dtype=np.float64)
+    premium_cost = float((np.array([position.premium for position in positions], dtype=np.float64) * shares).sum())
+
+    contract_indexes = {}
+    position_contracts = np.array([
+        contract_indexes.setdefault((position.ticker, position.expiration_date, position.strike_price, position.contract_type), len(contract_indexes))
+        for position in positions
+    ], dtype=np.int64)
+    net_shares = np.bincount(position_contracts, weights=shares, minlength=len(contract_indexes))
+    # Index of the first position on each contract, which the contract's market data is taken from
+    _, first_positions = np.unique(position_contracts, return_index=True)
+    contracts = [positions[i] for i in first_positions]
+
+    strike_prices = np.array([contract.strike_price for contract in contracts], dtype=np.float64)
+    is_call = np.array([contract.contract_type == ContractType.CALL for contract in contracts], dtype=bool)
+    expiration_dates = {contract.expiration_date for contract in contracts}
+    years_to_expiry_by_date = {
+        expiration_date: (datetime.combine(expiration_date, MARKET_CLOSE, tzinfo=MARKET_TIMEZONE) - now).total_seconds() / SECONDS_PER_YEAR
+        for expiration_date in expiration_dates
+    }
+    years_to_expiry = np.array([years_to_expiry_by_date[contract.expiration_date] for contract in contracts], dtype=np.float64)
+    underlying_prices = underlying_prices[first_positions]
+    volatilities = volatilities[first_positions]
+
+    profits = np.zeros(grid_shape)
+    for start in range(0, len(contracts), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        chunk_shares = net_shares[chunk, None]
+        # Each input only varies along some of the (contract, price move, volatility shift, days forward) axes
+        scenario_underlying_prices = underlying_prices[chunk, None] * (1 + price_moves[None, :])
+        scenario_volatilities = np.maximum(volatilities[chunk, None] + volatility_shifts[None, :], MIN_VOLATILITY)
+        # Scenarios past the expiration are valued an instant before it, where the Black-Scholes value is the exercise value
+        scenario_years = np.maximum(years_to_expiry[chunk, None] - days_forward[None, :] / 365, MIN_YEARS_TO_EXPIRY)
+        discounted_strikes = strike_prices[chunk, None] * np.exp(-rate * scenario_years)
+
+        volatility_sqrt_time = (scenario_volatilities[:, :, None] * np.sqrt(scenario_years)[:, None, :])[:, None, :, :]
+        drift = (np.log(scenario_underlying_prices / strike_prices[chunk, None])[:, :, None] + rate * scenario_years[:, None, :])[:, :, None, :]
+        d1 = drift / volatility_sqrt_time + 0.5 * volatility_sqrt_time
+        d2 = d1 - volatility_sqrt_time
+
+        profits += np.einsum("cm,cmvd->mvd", chunk_shares * scenario_underlying_prices, norm_cdf(d1))
+        profits -= np.einsum("cd,cmvd->mvd", chunk_shares * discounted_strikes, norm_cdf(d2))
+
+        # Put value = call value - underlying price + discounted strike
+        put_shares = np.where(is_call[chunk, None], 0, chunk_shares)
+        profits -= (put_shares * scenario_underlying_prices).sum(axis=0)[:, None, None]
+        profits += (put_shares * discounted_strikes).sum(axis=0)[None, None, :]
+
+    return profits - premium_cost
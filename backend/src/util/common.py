@@ -7,8 +7,10 @@ def get_sort_key():
     """
     Provides the sort key we use for our OptionsPositions. Purpose of method is so that the sort key will be consistent
     across all files and changes only need to be made here
+
+    The position_id breaks ties between positions with the same expiration date, so that every position has a unique sort key
     """
-    return lambda x: x.expiration_date
+    return lambda x: (x.expiration_date, x.position_id)
 
 def add_position_to_list(position: OptionsPosition, positions_list: list):
     """
@@ -23,10 +25,10 @@ def compare_options_position_dict_and_object(options_position_dict: dict, option
     """
     # These are the fields that are objects in the OptionsPosition class
     special_fields = ["contract_type", "position_status"]
-    for field, value in vars(options_position).items():
+    for field in OptionsPosition.__slots__:
         if field in special_fields:
             continue
-        if value != options_position_dict[field]:
+        if getattr(options_position, field) != options_position_dict[field]:
             return False
 
     for special_field in special_fields:
@@ -0,0 +1,72 @@
+import heapq
+import threading
+from datetime import date, datetime, time as time_of_day
+from .scheduler import MARKET_TIMEZONE
+
+# The purpose of this class is to move positions over to expired as their expiration dates pass, without having to rescan every position
+class ExpiryEngine:
+    """
+    Min-heap of (settle time, position_id) entries for the active positions.
+
+    A position is due to be settled at settle_time(market time) on its expiration date, which should be late enough after the
+    close for the closing price to be available. Checking for due positions only looks at the top of the heap, so it is O(1)
+    when nothing is due and O(k log n) for k due positions.
+
+    Entries are never removed from the middle of the heap, so positions that were deleted or already settled are still popped
+    and it is up to the caller to skip them.
+    """
+    settle_time: time_of_day
+
+    def __init__(self, settle_time: time_of_day):
+        self.settle_time = settle_time
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def get_settle_at(self, expiration_date: date) -> datetime:
+        """
+        Returns the time that positions expiring on the input date are due to be settled
+        """
+        return datetime.combine(expiration_date, self.settle_time, tzinfo=MARKET_TIMEZONE)
+
+    def load(self, positions: list):
+        """
+        Replaces the scheduled positions with the input active positions
+        """
+        heap = [(self.get_settle_at(position.expiration_date), position.position_id) for position in positions]
+        heapq.heapify(heap)
+        with self._lock:
+            self._heap = heap
+
+    def schedule(self, position_id: int, expiration_date: date):
+        """
+        Schedules the position to be settled on its expiration date
+        """
+        self.schedule_at(position_id, self.get_settle_at(expiration_date))
+
+    def schedule_at(self, position_id: int, settle_at: datetime):
+        """
+        Schedules the position to be settled at the input time(ex: to retry a position whose closing price wasn't available yet)
+        """
+        with self._lock:
+            heapq.heappush(self._heap, (settle_at, position_id))
+
+    def pop_due(self, now: datetime = None) -> list:
+        """
+        Removes and returns the position_ids of every position whose settle time is at or before the input time(defaults to now)
+        """
+        now = now or datetime.now(MARKET_TIMEZONE)
+        due_position_ids = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due_position_ids.append(heapq.heappop(self._heap)[1])
+        return due_position_ids
+
+    def next_settle_at(self) -> datetime:
+        """
+        Returns the earliest scheduled settle time, or None if nothing is scheduled
+        """
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def __len__(self) -> int:
+        return len(self._heap)
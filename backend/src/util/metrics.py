@@ -0,0 +1,216 @@
+import inspect
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import wraps
+
+# Default histogram buckets(in seconds), from 1ms up to 10s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# A metric read at scrape time by a collector, where samples is a list of (labels dictionary, value)
+MetricFamily = namedtuple("MetricFamily", ["name", "type", "help", "samples"])
+
+def format_labels(labels: dict) -> str:
+    """
+    Returns the input labels in the Prometheus text format(ex: {route="/metrics",method="GET"}), or an empty string if there are none
+    """
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in labels.items()) + "}"
+
+def escape_label_value(value) -> str:
+    """
+    Escapes the backslashes, double quotes and newlines in the input label value
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+class Counter:
+    """
+    Monotonically increasing count, with a separate count for each combination of label values
+    """
+    name: str
+    help: str
+    label_names: tuple
+
+    def __init__(self, name: str, help: str, label_names: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.values = {} # Maps label values -> count
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        """
+        Increments the count for the input labels
+        """
+        key = tuple(labels[label_name] for label_name in self.label_names)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            values = list(self.values.items())
+        return [
+            f"{self.name}{format_labels(dict(zip(self.label_names, key)))} {format_value(value)}"
+            for key, value in values
+        ]
+
+class Histogram:
+    """
+    Distribution of observed values(ex: latencies in seconds) over fixed buckets, with a separate distribution for each
+    combination of label values. Along with the buckets, the sum and count of the observations are kept
+    """
+    name: str
+    help: str
+    label_names: tuple
+    buckets: tuple # Upper bounds, in increasing order
+
+    def __init__(self, name: str, help: str, label_names: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.values = {} # Maps label values -> [bucket counts(not cumulative) + overflow count, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        """
+        Records the input value for the input labels
+        """
+        key = tuple(labels[label_name] for label_name in self.label_names)
+        # Buckets are few, so a linear scan is about as fast as bisect
+        bucket = next((i for i, upper_bound in enumerate(self.buckets) if value <= upper_bound), len(self.buckets))
+        with self._lock:
+            distribution = self.values.get(key)
+            if distribution is None:
+                distribution = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self.values[key] = distribution
+            distribution[0][bucket] += 1
+            distribution[1] += value
+            distribution[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Records how long the with block took(in seconds), whether or not it raised
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list:
+        with self._lock:
+            values = [(key, (list(bucket_counts), total, count)) for key, (bucket_counts, total, count) in self.values.items()]
+
+        lines = []
+        for key, (bucket_counts, total, count) in values:
+            labels = dict(zip(self.label_names, key))
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative_count += bucket_count
+                lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': format_value(upper_bound)})} {cumulative_count}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+        return lines
+
+# The purpose of this class is to collect the app's metrics in one place so they can all be served from a single endpoint
+class MetricsRegistry:
+    """
+    Holds the counters and histograms that are updated as the app runs, along with collectors that read statistics that are
+    already being kept elsewhere(ex: cache and rate limiter stats) at scrape time. Renders everything in the Prometheus text format
+    """
+    def __init__(self):
+        self.metrics = {} # Maps name -> Counter or Histogram
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def _get_or_add(self, metric_class, name: str, *args, **kwargs):
+        # Metrics are created when modules are imported, so asking for the same metric twice returns the existing one
+        with self._lock:
+            if name not in self.metrics:
+                self.metrics[name] = metric_class(name, *args, **kwargs)
+            return self.metrics[name]
+
+    def counter(self, name: str, help: str, label_names: tuple = ()) -> Counter:
+        """
+        Returns the counter with the input name, creating it if it doesn't exist yet
+        """
+        return self._get_or_add(Counter, name, help, label_names)
+
+    def histogram(self, name: str, help: str, label_names: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        """
+        Returns the histogram with the input name, creating it if it doesn't exist yet
+        """
+        return self._get_or_add(Histogram, name, help, label_names, buckets)
+
+    def add_collector(self, collector):
+        """
+        Adds a function that returns a list of MetricFamily, which is called every time the metrics are rendered
+        """
+        with self._lock:
+            self.collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format
+        """
+        with self._lock:
+            metrics = list(self.metrics.values())
+            collectors = list(self.collectors)
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {'counter' if isinstance(metric, Counter) else 'histogram'}")
+            lines.extend(metric.render())
+
+        for collector in collectors:
+            try:
+                metric_families = collector()
+            except Exception as e:
+                # One broken collector shouldn't take down the rest of the metrics
+                print(f"Unable to collect metrics from {collector}: {e}")
+                continue
+
+            for metric_family in metric_families:
+                lines.append(f"# HELP {metric_family.name} {metric_family.help}")
+                lines.append(f"# TYPE {metric_family.name} {metric_family.type}")
+                for labels, value in metric_family.samples:
+                    lines.append(f"{metric_family.name}{format_labels(labels)} {format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+def timed_function(histogram: Histogram, label_name: str = "function"):
+    """
+    Decorator that records how long each call to the decorated function takes in the input histogram, labelled with the
+    function's name. For generator functions, the time is from the first item being requested until the generator is exhausted
+    or closed
+    """
+    def decorator(func):
+        labels = {label_name: func.__name__}
+
+        if inspect.isgeneratorfunction(func):
+            @wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                with histogram.time(**labels):
+                    yield from func(*args, **kwargs)
+            return generator_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+# Registry for all of the app's metrics
+registry = MetricsRegistry()
@@ -1,6 +1,8 @@
+import sys
 from datetime import date, datetime
 from enum import Enum
 from src.data.data_fetcher import *
+from src.data.market_data_provider import OptionChain
 
 class ContractType(Enum):
     """
@@ -43,8 +45,10 @@ class OptionsPosition:
         position_status (PositionStatus): The status of the options position
         close_price (float): The price of the underlying security when the contract closed, set to -1 when the contract is still active
         profit (float): The total profit from this position, set to -1 when the contract is still active(change when we support current prices)
-        current_price (float): The current price of the option, set to -1 for expired contracts
-        blind_init (bool): Indicates if we are creating the option blind, which means we have to retrieve information like current price, underlying asset price, etc
+        current_price (float): The current price of the option, set to -1 for expired contracts and for active contracts that haven't been priced yet
+        priced_at (datetime): When current_price was last retrieved, set to None when the position has not been priced
+        blind_init (bool): Indicates if we are creating the option blind, which means we have to retrieve information like current price, underlying asset price, etc.
+            Non-blind creation(ex: from the DB) never touches the network
 
     Attributes that are retrieved during blind init(don't use blind init if you are setting any of these):
         position_status
@@ -54,7 +58,29 @@ class OptionsPosition:
 
     Attributes in the object but not stored in the DB:
         current_price
+        priced_at
+
+    The class uses __slots__ and shares equal tickers and dates between positions to keep the memory per position down, since
+    the whole history of positions gets loaded into memory
     """
+    __slots__ = (
+        "position_id",
+        "ticker",
+        "contract_type",
+        "quantity",
+        "trade_direction",
+        "strike_price",
+        "expiration_date",
+        "is_expired",
+        "premium",
+        "open_price",
+        "open_date",
+        "position_status",
+        "close_price",
+        "profit",
+        "current_price",
+        "priced_at"
+    )
 
     position_id: int
     ticker: str
@@ -71,6 +97,7 @@ class OptionsPosition:
     close_price: float
     profit: float
     current_price: float
+    priced_at: datetime
 
     def __init__(
         self,
@@ -99,22 +126,22 @@ class OptionsPosition:
             raise Exception("Quantity must be positive")
 
         self.position_id = position_id
-        self.ticker = ticker.upper()
+        self.ticker = sys.intern(ticker.upper())
         self.contract_type = contract_type
         self.quantity = quantity
         self.trade_direction = trade_direction
         self.strike_price = strike_price
-        self.expiration_date = expiration_date
+        self.expiration_date = intern_date(expiration_date)
         self.is_expired = datetime.now().date() > expiration_date
         self.premium = premium
         self.open_price = open_price
-        self.open_date = open_date
+        self.open_date = intern_date(open_date)
 
-        # Fields that are not stored in the DB, needs to be set first, otherwise objects created using the DB will have these fields set to None
-        if not self.is_expired:
-            self.current_price = get_current_option_price(self.ticker, self.expiration_date, self.strike_price, self.contract_type == ContractType.CALL)
-        else:
-            self.current_price = -1
+        # Fields that are not stored in the DB, needs to be set first, otherwise objects created using the DB will have these fields set to None.
+        # Objects created from the DB are hydrated without touching the network, so active positions keep current_price at -1 until
+        # they get priced using price_options_positions
+        self.current_price = current_price
+        self.priced_at = None
 
         # Fields that are stored in the DB
         if not blind_init:
@@ -146,7 +173,8 @@ class OptionsPosition:
             "position_status": self.position_status.name,
             "close_price": self.close_price,
             "profit": self.profit,
-            "current_price": self.current_price
+            "current_price": self.current_price,
+            "priced_at": self.priced_at.isoformat() if self.priced_at else None
         }
     
     def update_position_id(self, position_id: int):
@@ -156,12 +184,18 @@ class OptionsPosition:
         print(f"Updating the position_id of {self.position_id} to {position_id}")
         self.position_id = position_id
 
-    def update_active_contract(self):
+    def update_active_contract(self, entire_option_chain: OptionChain = None):
         """
-        Retrieves the current price of the active contract and updates the position accordingly
+        Retrieves the current price of the active contract and updates the position accordingly. The price is looked up in the
+        input option chain when one is provided
         """
+        # The price is fetched first so that the position is left untouched if it can't be priced
+        current_price = get_current_option_price(
+            self.ticker, self.expiration_date, self.strike_price, self.contract_type == ContractType.CALL, entire_option_chain
+        )
         self.position_status = PositionStatus.OPEN
-        self.current_price = get_current_option_price(self.ticker, self.expiration_date, self.strike_price, self.contract_type == ContractType.CALL)
+        self.current_price = current_price
+        self.priced_at = datetime.now().astimezone()
         self.profit = self.calculate_profit()
         self.close_price = -1
     
@@ -178,6 +212,7 @@ class OptionsPosition:
         self.close_price = underlying_expiration_price
         self.profit = self.calculate_profit()
         self.current_price = -1 # Setting current price to -1 for expired contracts
+        self.priced_at = None
     
     def calculate_profit(self) -> float:
         """
@@ -200,6 +235,117 @@ class OptionsPosition:
         # Rounding to 2 decimal points to prevent floating point errors
         return round(self.quantity * profit_per_underlying * 100 * (1 if self.trade_direction == TradeDirection.LONG else -1), 2)
 
+def get_option_chain_keys(positions: list) -> set:
+    """
+    Returns the set of (ticker, expiration_date) option chains that the input positions need to be priced, expired positions are
+    skipped since they don't have a current price
+    """
+    return {(position.ticker, position.expiration_date) for position in positions if not position.is_expired}
+
+def price_options_positions(positions: list, option_chains: dict = None) -> list:
+    """
+    Retrieves the current prices for the input positions in one batch and updates the active ones accordingly.
+
+    Positions are grouped by (ticker, expiration_date) so that each group is priced off of a single option chain download,
+    expired positions are skipped since they don't have a current price. The chains for the groups are downloaded concurrently
+    (unless option_chains, the result of get_option_chains, is provided) and the prices are then applied to the positions in one pass.
+
+    Returns the list of positions that were priced, positions whose option chain couldn't be retrieved(or whose strike isn't in
+    the chain) are left untouched
+    """
+    groups = {}
+    for position in positions:
+        if position.is_expired:
+            continue
+        groups.setdefault((position.ticker, position.expiration_date), []).append(position)
+
+    if option_chains is None:
+        option_chains = get_option_chains(set(groups.keys()))
+
+    priced_positions = []
+    for (ticker, expiration_date), group in groups.items():
+        option_chain = option_chains.get((ticker, expiration_date))
+        if not isinstance(option_chain, OptionChain):
+            print(f"Unable to get the option chain for {ticker} expiring on {expiration_date}: {option_chain}")
+            continue
+
+        # Every position in the group shares the same option chain
+        for position in group:
+            try:
+                position.update_active_contract(option_chain)
+            except Exception as e:
+                print(f"Unable to price position {position.position_id}: {e}")
+                continue
+            priced_positions.append(position)
+
+    return priced_positions
+
+def get_options_market_data(positions: list, option_chains: dict = None) -> dict:
+    """
+    Returns a dictionary of position_id -> (underlying price, bid, ask, last price) for the input active positions.
+
+    The option chains are downloaded concurrently unless option_chains(the result of get_option_chains) is provided. Quotes are
+    looked up one option chain side at a time, so each (ticker, expiration_date, contract_type) group only does one lookup in
+    its option chain. Groups whose option chain or underlying price couldn't be retrieved are left out
+    """
+    groups = {}
+    for position in positions:
+        if position.is_expired:
+            continue
+        groups.setdefault((position.ticker, position.expiration_date, position.contract_type), []).append(position)
+
+    if option_chains is None:
+        option_chains = get_option_chains(get_option_chain_keys(positions))
+
+    market_data = {}
+    for (ticker, expiration_date, contract_type), group in groups.items():
+        option_chain = option_chains.get((ticker, expiration_date))
+        try:
+            if not isinstance(option_chain, OptionChain):
+                raise option_chain or ValueError("The option chain wasn't fetched")
+            underlying_price = get_underlying_price(ticker, expiration_date, option_chain)
+            quotes = get_option_quotes(
+                ticker, expiration_date, [position.strike_price for position in group], contract_type == ContractType.CALL, option_chain
+            )
+        except Exception as e:
+            print(f"Unable to get the market data for {ticker} expiring on {expiration_date}: {e}")
+            continue
+
+        for position, (bid, ask, last_price) in zip(group, quotes.itertuples(index=False)):
+            market_data[position.position_id] = (underlying_price, bid, ask, last_price)
+
+    return market_data
+
+def settle_options_positions(positions: list) -> list:
+    """
+    Updates the input expired positions at maturity using the closing prices of their underlying securities, which are all
+    fetched in one batch.
+
+    Returns the list of positions that were settled, positions whose closing price couldn't be retrieved are left untouched
+    """
+    ticker_dates = {(position.ticker, position.expiration_date) for position in positions}
+    closing_prices = get_security_closing_prices(ticker_dates)
+
+    settled_positions = []
+    for position in positions:
+        underlying_price = closing_prices.get((position.ticker, position.expiration_date))
+        if underlying_price is None:
+            continue
+
+        position.update_position_at_maturity(underlying_price)
+        settled_positions.append(position)
+
+    return settled_positions
+
+# Shared date objects, so that positions with the same dates don't each hold their own copy
+interned_dates = {}
+
+def intern_date(day: date) -> date:
+    """
+    Returns the shared date object equal to the input date
+    """
+    return interned_dates.setdefault(day, day)
+
 # TODO: I just slapped this in here since I can't put it into common, since it'll create a circular dependency
 # figure out where to put it
 def string_to_date(date_str: str) -> date:
@@ -218,6 +364,14 @@ def blind_create_options_position(inputs: dict) -> OptionsPosition:
 
     This should be used over OptionsPosition(**inputs) because the constructor has some special checks.
     """
+    return OptionsPosition(**parse_options_position_inputs(inputs), blind_init = True)
+
+def parse_options_position_inputs(inputs: dict) -> dict:
+    """
+    Converts the input dictionary(ex: from a JSON request or a CSV row) into the keyword arguments for the OptionsPosition constructor.
+
+    A KeyError will be thrown if a required field is missing and a ValueError if a field is not able to be converted
+    """
     position_id = -1 if "position_id" not in inputs.keys() else inputs["position_id"]
     expiration_date = string_to_date(inputs["expiration_date"])
     open_date = string_to_date(inputs["open_date"])
@@ -248,16 +402,15 @@ def blind_create_options_position(inputs: dict) -> OptionsPosition:
     if isinstance(premium, str):
         premium = float(premium)
 
-    return OptionsPosition(
-        position_id,
-        inputs["ticker"],
-        contract_type,
-        quantity,
-        trade_direction,
-        strike_price,
-        expiration_date,
-        premium,
-        open_price,
-        open_date,
-        blind_init = True
-    )
+    return {
+        "position_id": position_id,
+        "ticker": inputs["ticker"],
+        "contract_type": contract_type,
+        "quantity": quantity,
+        "trade_direction": trade_direction,
+        "strike_price": strike_price,
+        "expiration_date": expiration_date,
+        "premium": premium,
+        "open_price": open_price,
+        "open_date": open_date
+    }
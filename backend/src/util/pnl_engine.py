@@ -0,0 +1,146 @@
+from datetime import date
+import numpy as np
+from .options_position import ContractType, PositionStatus, TradeDirection
+from .position_records import CONTRACT_TYPES, POSITION_STATUSES, TRADE_DIRECTIONS
+
+UNIX_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# The purpose of this class is to compute the profit of a whole portfolio at once instead of one OptionsPosition at a time
+class PnlEngine:
+    """
+    Columnar(NumPy array) copy of a list of positions, used to compute their profits and profit totals in vectorized passes.
+
+    The per-position profits are identical to OptionsPosition.calculate_profit, since the same floating point operations are done
+    in the same order and the rounding matches Python's round. The engine is a snapshot, so it needs to be rebuilt whenever the
+    positions change.
+
+    Unrealized profit comes from the open positions and realized profit from the expired and exercised ones. Open positions that
+    haven't been priced yet(current_price of -1) are left out of the totals.
+    """
+    position_ids: np.ndarray
+    tickers: np.ndarray # Unique tickers, indexed by ticker_codes
+    ticker_codes: np.ndarray
+    expiry_months: np.ndarray # datetime64[M]
+    strike_prices: np.ndarray
+    premiums: np.ndarray
+    quantities: np.ndarray
+    direction_signs: np.ndarray # 1 for long, -1 for short
+    is_call: np.ndarray
+    is_open: np.ndarray
+    close_prices: np.ndarray # NaN for open positions
+    current_prices: np.ndarray
+    profits: np.ndarray
+
+    def __init__(self, positions: list, expired_columns: dict = None):
+        """
+        positions are OptionsPosition objects, and expired_columns optionally adds the expired positions of a PositionRecords store
+        straight from its columns(see PositionRecords.columns), without having to go through a view of each position
+        """
+        position_ids = [np.array([position.position_id for position in positions], dtype=np.int64)]
+        tickers = [np.array([position.ticker for position in positions], dtype=str)]
+        # Converting the dates to month numbers ourselves is much faster than having NumPy parse date objects
+        expiry_months = [np.array(
+            [(position.expiration_date.year - 1970) * 12 + position.expiration_date.month - 1 for position in positions], dtype=np.int64
+        ).astype("datetime64[M]")]
+        strike_prices = [np.array([position.strike_price for position in positions], dtype=np.float64)]
+        premiums = [np.array([position.premium for position in positions], dtype=np.float64)]
+        quantities = [np.array([position.quantity for position in positions], dtype=np.float64)]
+        direction_signs = [np.array([1 if position.trade_direction == TradeDirection.LONG else -1 for position in positions], dtype=np.float64)]
+        is_call = [np.array([position.contract_type == ContractType.CALL for position in positions], dtype=bool)]
+        is_open = [np.array([position.position_status == PositionStatus.OPEN for position in positions], dtype=bool)]
+        close_prices = [np.array([np.nan if position.close_price is None else position.close_price for position in positions], dtype=np.float64)]
+        current_prices = [np.array([position.current_price for position in positions], dtype=np.float64)]
+
+        if expired_columns is not None:
+            position_ids.append(expired_columns["position_ids"])
+            tickers.append(expired_columns["tickers"])
+            expiry_months.append((expired_columns["expiration_days"] - UNIX_EPOCH_ORDINAL).astype("datetime64[D]").astype("datetime64[M]"))
+            strike_prices.append(expired_columns["strike_prices"])
+            premiums.append(expired_columns["premiums"])
+            quantities.append(expired_columns["quantities"].astype(np.float64))
+            direction_signs.append(np.where(expired_columns["trade_directions"] == TRADE_DIRECTIONS.index(TradeDirection.LONG), 1.0, -1.0))
+            is_call.append(expired_columns["contract_types"] == CONTRACT_TYPES.index(ContractType.CALL))
+            is_open.append(expired_columns["position_statuses"] == POSITION_STATUSES.index(PositionStatus.OPEN))
+            close_prices.append(expired_columns["close_prices"])
+            current_prices.append(np.full(len(expired_columns["position_ids"]), -1.0))
+
+        self.position_ids = np.concatenate(position_ids)
+        self.tickers, self.ticker_codes = np.unique(np.concatenate(tickers), return_inverse=True)
+        self.expiry_months = np.concatenate(expiry_months)
+        self.strike_prices = np.concatenate(strike_prices)
+        self.premiums = np.concatenate(premiums)
+        self.quantities = np.concatenate(quantities)
+        self.direction_signs = np.concatenate(direction_signs)
+        self.is_call = np.concatenate(is_call)
+        self.is_open = np.concatenate(is_open)
+        self.close_prices = np.concatenate(close_prices)
+        self.current_prices = np.concatenate(current_prices)
+        self.profits = self.calculate_profits()
+
+    def calculate_profits(self) -> np.ndarray:
+        """
+        Returns the total profit of every position, computed the same way as OptionsPosition.calculate_profit
+        """
+        with np.errstate(invalid="ignore"):
+            price_diffs = self.close_prices - self.strike_prices
+            payoffs = np.where(self.is_call, np.maximum(price_diffs, 0), np.maximum(-1 * price_diffs, 0))
+            profit_per_underlying = np.where(self.is_open, self.current_prices - self.premiums, -1 * self.premiums + payoffs)
+        return round_to_cents(self.quantities * profit_per_underlying * 100 * self.direction_signs)
+
+    def _included(self) -> np.ndarray:
+        # Open positions that haven't been priced yet don't have a meaningful profit
+        return ~(self.is_open & (self.current_prices < 0))
+
+    def _grouped_totals(self, codes: np.ndarray, num_groups: int) -> np.ndarray:
+        included = self._included()
+        return np.bincount(codes[included], weights=self.profits[included], minlength=num_groups)
+
+    def totals(self) -> dict:
+        """
+        Returns the total, realized and unrealized profit, along with the number of positions that were left out for not being priced
+        """
+        included = self._included()
+        realized = self.profits[included & ~self.is_open].sum()
+        unrealized = self.profits[included & self.is_open].sum()
+        return {
+            "total_profit": round(float(realized + unrealized), 2),
+            "realized_profit": round(float(realized), 2),
+            "unrealized_profit": round(float(unrealized), 2),
+            "positions": len(self.position_ids),
+            "unpriced_positions": int((~included).sum())
+        }
+
+    def totals_by_ticker(self) -> dict:
+        """
+        Returns a dictionary of ticker -> total profit
+        """
+        totals = self._grouped_totals(self.ticker_codes, len(self.tickers))
+        return {str(ticker): round(float(total), 2) for ticker, total in zip(self.tickers, totals)}
+
+    def totals_by_expiry_month(self) -> dict:
+        """
+        Returns a dictionary of expiry month(YYYY-MM) -> total profit
+        """
+        months, month_codes = np.unique(self.expiry_months, return_inverse=True)
+        totals = self._grouped_totals(month_codes, len(months))
+        return {str(month): round(float(total), 2) for month, total in zip(months, totals)}
+
+    def profit_by_position_id(self) -> dict:
+        """
+        Returns a dictionary of position_id -> total profit
+        """
+        return dict(zip(self.position_ids.tolist(), self.profits.tolist()))
+
+def round_to_cents(values: np.ndarray) -> np.ndarray:
+    """
+    Rounds the input values to 2 decimal points, with the same results as Python's round(value, 2).
+
+    np.round scales by 100 first, which can round the wrong way for values within floating point error of a half cent, so those
+    values are rounded with Python's round instead
+    """
+    scaled = values * 100
+    rounded = np.round(scaled) / 100
+    near_half = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_half):
+        rounded[i] = round(float(values[i]), 2)
+    return rounded
@@ -0,0 +1,240 @@
+import threading
+from datetime import date
+from sortedcontainers import SortedKeyList
+from .common import get_sort_key
+from .options_position import OptionsPosition
+from .position_records import PositionRecords
+
+# Fields of an active position that change when it is priced or settled
+MARKET_FIELDS = ["position_status", "close_price", "profit", "current_price", "priced_at", "is_expired"]
+
+class PositionBook:
+    """
+    In-memory store of the active and expired options positions.
+
+    Active positions are OptionsPosition objects indexed by position_id(O(1) lookups), by expiration date(kept in a sorted
+    container ordered by the sort key, so inserts and removals are O(log n)) and by ticker.
+
+    Expired positions make up most of the history and rarely change, so they are kept in a compact PositionRecords store instead
+    and read through PositionView objects, which have the same attributes as OptionsPosition. Whether a position is active or
+    expired is tracked by which of the two it is in, which means status lookups don't need to go to the DB.
+
+    The active and expired positions each have a version number that is incremented whenever they change, which lets callers
+    cache anything derived from them(ex: serialized responses) until the version changes.
+    """
+    positions_by_id: dict # Active positions only
+    active: SortedKeyList
+    expired: PositionRecords
+    position_ids_by_ticker: dict # Active positions only
+    active_version: int
+    expired_version: int
+
+    def __init__(self):
+        self.positions_by_id = {}
+        self.active = SortedKeyList(key=get_sort_key())
+        self.expired = PositionRecords()
+        self.position_ids_by_ticker = {}
+        self._lock = threading.RLock()
+        self.active_version = 0
+        self.expired_version = 0
+
+    def load(self, active_positions: list, expired_positions: list):
+        """
+        Replaces the contents of the book with the input active and expired positions
+        """
+        with self._lock:
+            self.positions_by_id = {}
+            self.active = SortedKeyList(active_positions, key=get_sort_key())
+            self.expired = PositionRecords(capacity=max(len(expired_positions), 1024))
+            self.expired.extend(expired_positions)
+            self.position_ids_by_ticker = {}
+
+            for position in active_positions:
+                self.positions_by_id[position.position_id] = position
+                self.position_ids_by_ticker.setdefault(position.ticker, set()).add(position.position_id)
+
+            self.mark_changed(active=True, expired=True)
+
+    def add(self, position: OptionsPosition, expired: bool):
+        """
+        Adds the input position to the book as either an active or an expired position
+        """
+        with self._lock:
+            if self.is_expired(position.position_id) is not None:
+                raise Exception(f"Position with position_id {position.position_id} is already in the book")
+
+            if expired:
+                self.expired.append(position)
+            else:
+                self.positions_by_id[position.position_id] = position
+                self.position_ids_by_ticker.setdefault(position.ticker, set()).add(position.position_id)
+                self.active.add(position)
+            self.mark_changed(active=not expired, expired=expired)
+
+    def remove(self, position_id: int) -> OptionsPosition:
+        """
+        Removes the position corresponding to the input position_id from the book and returns it, or None if it isn't in the book
+        """
+        with self._lock:
+            position = self._remove_active(position_id)
+            if position is not None:
+                self.mark_changed(active=True)
+                return position
+
+            row = self.expired.find_row(position_id)
+            if row is None:
+                return None
+            self.expired.remove(row)
+            self.mark_changed(expired=True)
+            # The row keeps its data after being removed, so the view can still be read. Compacting replaces the store rather than
+            # changing it, so that holds for this view and any other views of the old store too
+            removed_position = self.expired.view(row)
+            if self.expired.should_compact():
+                self.expired = self.expired.compact()
+            return removed_position
+
+    def _remove_active(self, position_id: int) -> OptionsPosition:
+        position = self.positions_by_id.pop(position_id, None)
+        if position is None:
+            return None
+
+        ticker_position_ids = self.position_ids_by_ticker[position.ticker]
+        ticker_position_ids.discard(position_id)
+        if not ticker_position_ids:
+            del self.position_ids_by_ticker[position.ticker]
+        self.active.remove(position)
+        return position
+
+    def move_to_expired(self, position_id: int):
+        """
+        Moves the active position corresponding to the input position_id over to the expired positions
+        """
+        with self._lock:
+            position = self._remove_active(position_id)
+            # The position is already expired or was removed from the book
+            if position is None:
+                return
+
+            self.expired.append(position)
+            self.mark_changed(active=True, expired=True)
+
+    def update_active(self, updated_positions: list, expire: bool = False) -> list:
+        """
+        Copies the MARKET_FIELDS of the input positions, which are updated copies of active positions, over to the positions in the
+        book in one step under the lock, so that anything reading the positions under the lock never sees a mix of old and new
+        values(see active_positions_json and to_json). With expire, the positions are then moved over to the expired positions.
+
+        Returns the positions in the book that were updated, positions that are no longer active(ex: they were deleted in the
+        meantime) are skipped
+        """
+        with self._lock:
+            positions = []
+            for updated_position in updated_positions:
+                position = self.positions_by_id.get(updated_position.position_id)
+                if position is None:
+                    continue
+
+                for field in MARKET_FIELDS:
+                    setattr(position, field, getattr(updated_position, field))
+                positions.append(position)
+                if expire:
+                    self.move_to_expired(position.position_id)
+
+            self.mark_changed(active=True, expired=expire)
+            return positions
+
+    def mark_changed(self, active: bool = False, expired: bool = False):
+        """
+        Increments the version of the active and/or expired positions. Besides being called by the book itself, this needs to be
+        called whenever positions are updated in place(ex: when their prices are refreshed)
+        """
+        with self._lock:
+            if active:
+                self.active_version += 1
+            if expired:
+                self.expired_version += 1
+
+    def get(self, position_id: int) -> OptionsPosition:
+        """
+        Returns the position corresponding to the input position_id(a PositionView for expired positions), or None if it isn't in
+        the book
+        """
+        with self._lock:
+            position = self.positions_by_id.get(position_id)
+            if position is not None:
+                return position
+
+            row = self.expired.find_row(position_id)
+            return None if row is None else self.expired.view(row)
+
+    def is_expired(self, position_id: int) -> bool:
+        """
+        Returns whether the position corresponding to the input position_id is expired, or None if it isn't in the book
+        """
+        with self._lock:
+            if position_id in self.positions_by_id:
+                return False
+            return None if self.expired.find_row(position_id) is None else True
+
+    def active_positions(self) -> list:
+        """
+        Returns the active positions ordered by the sort key
+        """
+        with self._lock:
+            return list(self.active)
+
+    def active_positions_json(self) -> list:
+        """
+        Returns the __json__ dictionaries of the active positions ordered by the sort key, serialized under the lock so that none of
+        them is caught halfway through an update(see update_active)
+        """
+        with self._lock:
+            return [position.__json__() for position in self.active]
+
+    def to_json(self, positions: list) -> list:
+        """
+        Returns the __json__ dictionaries of the input positions(ex: positions returned by get), serialized under the lock so that
+        none of them is caught halfway through an update(see update_active)
+        """
+        with self._lock:
+            return [position.__json__() for position in positions]
+
+    def expired_positions(self) -> list:
+        """
+        Returns views of the expired positions ordered by the sort key
+        """
+        with self._lock:
+            return [self.expired.view(row) for row in self.expired.sorted_rows().tolist()]
+
+    def expired_positions_json(self) -> list:
+        """
+        Returns the __json__ dictionaries of the expired positions ordered by the sort key, without creating a view for each of them
+        """
+        with self._lock:
+            return self.expired.to_json(self.expired.sorted_rows())
+
+    def expired_columns(self) -> dict:
+        """
+        Returns the expired positions as a dictionary of column -> array(see PositionRecords.columns)
+        """
+        with self._lock:
+            return self.expired.columns(self.expired.live_rows())
+
+    def positions_for_ticker(self, ticker: str) -> list:
+        """
+        Returns all the positions(active and expired) for the input ticker
+        """
+        ticker = ticker.upper()
+        with self._lock:
+            active_positions = [self.positions_by_id[position_id] for position_id in self.position_ids_by_ticker.get(ticker, ())]
+            return active_positions + [self.expired.view(row) for row in self.expired.rows_for_ticker(ticker).tolist()]
+
+    def active_positions_expiring_by(self, expiration_date: date) -> list:
+        """
+        Returns the active positions expiring on or before the input date, ordered by the sort key
+        """
+        with self._lock:
+            return list(self.active.irange_key(max_key=(expiration_date, float("inf"))))
+
+    def __len__(self) -> int:
+        return len(self.positions_by_id) + len(self.expired)
@@ -0,0 +1,376 @@
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+import numpy as np
+from .options_position import ContractType, OptionsPosition, PositionStatus, TradeDirection
+
+# Enum members in the order of their codes in PositionRecords
+CONTRACT_TYPES = list(ContractType)
+TRADE_DIRECTIONS = list(TradeDirection)
+POSITION_STATUSES = list(PositionStatus)
+
+# Stored in place of close_price and profit when they are None
+MISSING_CENTS = np.iinfo(np.int64).min
+
+# Number of rows that can be added before they are merged into the sorted position_id index, until then they are looked up in a
+# dictionary. Merging is O(n), so this spreads its cost over many appends
+ROW_INDEX_MERGE_ROWS = 4096
+
+# Removed rows take up room until the store is compacted, which happens once they make up this share of the rows(and there are
+# at least COMPACT_MIN_REMOVED_ROWS of them, so that small stores aren't compacted over and over)
+COMPACT_REMOVED_SHARE = 0.25
+COMPACT_MIN_REMOVED_ROWS = 1024
+
+def to_cents(value: float) -> int:
+    """
+    Converts the input price into integer cents, rounding half cents up the same way the DB's NUMERIC(10, 2) columns do
+    """
+    if value is None:
+        return MISSING_CENTS
+    return int(Decimal(str(value)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) * 100)
+
+def from_cents(cents: int) -> float:
+    """
+    Converts the input integer cents back into a price
+    """
+    return None if cents == MISSING_CENTS else cents / 100
+
+# The purpose of this class is to hold large numbers of expired positions in a fraction of the memory that OptionsPosition objects take
+class PositionRecords:
+    """
+    Columnar(NumPy array) store of expired positions.
+
+    Prices are stored as integer cents, which is the same precision as the DB, dates as ordinal days and the tickers and enums
+    as small integer codes. Each position takes up about 70 bytes, compared to a few hundred for an
+    OptionsPosition object.
+
+    Positions are read through PositionView objects, which read straight from the arrays and have the same attributes and
+    methods as OptionsPosition. Removed positions are only marked as removed, so the row of a position never changes within a
+    store. Once enough of them have been removed the store should be replaced by a compacted copy(see compact), which leaves
+    views of the old store readable.
+
+    Rows are found by position_id through a sorted index, plus a dictionary of the rows added since the index was last merged,
+    so lookups are O(log n) without the index having to be rebuilt after every append.
+    """
+    tickers: list # Ticker for each ticker code
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.num_removed = 0
+        self.tickers = []
+        self._ticker_codes = {}
+        # (sorted position_ids, rows) used to find the row of a position_id, covers the rows before _indexed_size
+        self._row_index = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        self._indexed_size = 0
+        self._unindexed_rows = {} # Maps position_id -> latest row, for the rows that aren't in _row_index yet
+        self._sorted_rows = None # Result of sorted_rows, cleared whenever rows are added or removed
+
+        self.position_ids = np.zeros(capacity, dtype=np.int64)
+        self.ticker_codes = np.zeros(capacity, dtype=np.int32)
+        self.contract_types = np.zeros(capacity, dtype=np.int8)
+        self.trade_directions = np.zeros(capacity, dtype=np.int8)
+        self.position_statuses = np.zeros(capacity, dtype=np.int8)
+        self.quantities = np.zeros(capacity, dtype=np.int32)
+        self.strike_prices = np.zeros(capacity, dtype=np.int64)
+        self.premiums = np.zeros(capacity, dtype=np.int64)
+        self.open_prices = np.zeros(capacity, dtype=np.int64)
+        self.close_prices = np.zeros(capacity, dtype=np.int64)
+        self.profits = np.zeros(capacity, dtype=np.int64)
+        self.expiration_days = np.zeros(capacity, dtype=np.int32)
+        self.open_days = np.zeros(capacity, dtype=np.int32)
+        self.removed = np.zeros(capacity, dtype=bool)
+
+    _column_names = [
+        "position_ids", "ticker_codes", "contract_types", "trade_directions", "position_statuses", "quantities", "strike_prices",
+        "premiums", "open_prices", "close_prices", "profits", "expiration_days", "open_days", "removed"
+    ]
+
+    def _reserve(self, num_rows: int):
+        capacity = len(self.position_ids)
+        if self.size + num_rows <= capacity:
+            return
+
+        # Growing geometrically keeps appends amortized O(1)
+        new_capacity = max(capacity * 2, self.size + num_rows)
+        for column_name in self._column_names:
+            column = getattr(self, column_name)
+            new_column = np.zeros(new_capacity, dtype=column.dtype)
+            new_column[:self.size] = column[:self.size]
+            setattr(self, column_name, new_column)
+
+    def _get_ticker_code(self, ticker: str) -> int:
+        if ticker not in self._ticker_codes:
+            self._ticker_codes[ticker] = len(self.tickers)
+            self.tickers.append(ticker)
+        return self._ticker_codes[ticker]
+
+    def extend(self, positions: list):
+        """
+        Adds the input expired positions to the store
+        """
+        self._reserve(len(positions))
+        rows = slice(self.size, self.size + len(positions))
+        self.position_ids[rows] = [position.position_id for position in positions]
+        self.ticker_codes[rows] = [self._get_ticker_code(position.ticker) for position in positions]
+        self.contract_types[rows] = [CONTRACT_TYPES.index(position.contract_type) for position in positions]
+        self.trade_directions[rows] = [TRADE_DIRECTIONS.index(position.trade_direction) for position in positions]
+        self.position_statuses[rows] = [POSITION_STATUSES.index(position.position_status) for position in positions]
+        self.quantities[rows] = [position.quantity for position in positions]
+        self.strike_prices[rows] = [to_cents(position.strike_price) for position in positions]
+        self.premiums[rows] = [to_cents(position.premium) for position in positions]
+        self.open_prices[rows] = [to_cents(position.open_price) for position in positions]
+        self.close_prices[rows] = [to_cents(position.close_price) for position in positions]
+        self.profits[rows] = [to_cents(position.profit) for position in positions]
+        self.expiration_days[rows] = [position.expiration_date.toordinal() for position in positions]
+        self.open_days[rows] = [position.open_date.toordinal() for position in positions]
+        self.removed[rows] = False
+        self.size += len(positions)
+        self._sorted_rows = None
+
+        if self.size - self._indexed_size > ROW_INDEX_MERGE_ROWS:
+            self._merge_row_index()
+        else:
+            for row in range(rows.start, rows.stop):
+                self._unindexed_rows[int(self.position_ids[row])] = row
+
+    def append(self, position: OptionsPosition):
+        """
+        Adds the input expired position to the store
+        """
+        self.extend([position])
+
+    def find_row(self, position_id: int) -> int:
+        """
+        Returns the row of the position corresponding to the input position_id, or None if it isn't in the store
+        """
+        # Rows that aren't in the index yet were added last, so they take precedence
+        row = self._unindexed_rows.get(position_id)
+        if row is not None:
+            return None if self.removed[row] else row
+
+        sorted_position_ids, rows = self._row_index
+        i = np.searchsorted(sorted_position_ids, position_id)
+        # A position_id can appear more than once if it was removed and added back, the last row is the current one
+        while i + 1 < len(sorted_position_ids) and sorted_position_ids[i + 1] == position_id:
+            i += 1
+        if i < len(sorted_position_ids) and sorted_position_ids[i] == position_id and not self.removed[rows[i]]:
+            return int(rows[i])
+        return None
+
+    def _merge_row_index(self):
+        # Merges the rows added since the last merge into the sorted index, after any existing rows with the same position_id
+        new_rows = np.arange(self._indexed_size, self.size)
+        new_rows = new_rows[np.argsort(self.position_ids[new_rows], kind="stable")]
+        new_position_ids = self.position_ids[new_rows]
+
+        sorted_position_ids, rows = self._row_index
+        insert_at = np.searchsorted(sorted_position_ids, new_position_ids, side="right")
+        self._row_index = (np.insert(sorted_position_ids, insert_at, new_position_ids), np.insert(rows, insert_at, new_rows))
+        self._indexed_size = self.size
+        self._unindexed_rows = {}
+
+    def remove(self, row: int):
+        """
+        Marks the position in the input row as removed
+        """
+        self.removed[row] = True
+        self.num_removed += 1
+        self._sorted_rows = None
+
+    def should_compact(self) -> bool:
+        """
+        Returns whether enough positions have been removed that the store should be compacted
+        """
+        return self.num_removed >= COMPACT_MIN_REMOVED_ROWS and self.num_removed >= COMPACT_REMOVED_SHARE * self.size
+
+    def compact(self) -> "PositionRecords":
+        """
+        Returns a new store with only the positions that haven't been removed. This store is left as it is, so existing views of it
+        can still be read
+        """
+        rows = self.live_rows()
+        records = PositionRecords(capacity=max(len(rows), 1024))
+        for column_name in self._column_names:
+            getattr(records, column_name)[:len(rows)] = getattr(self, column_name)[rows]
+        records.tickers = list(self.tickers)
+        records._ticker_codes = dict(self._ticker_codes)
+        records.size = len(rows)
+        records._merge_row_index()
+        return records
+
+    def view(self, row: int) -> "PositionView":
+        """
+        Returns a view of the position in the input row
+        """
+        return PositionView(self, row)
+
+    def live_rows(self) -> np.ndarray:
+        """
+        Returns the rows of the positions that haven't been removed
+        """
+        return np.flatnonzero(~self.removed[:self.size])
+
+    def sorted_rows(self) -> np.ndarray:
+        """
+        Returns the rows of the positions that haven't been removed, ordered by the sort key(expiration date, then position_id).
+        The order is cached until rows are added or removed, so the returned array must not be modified
+        """
+        if self._sorted_rows is None:
+            rows = self.live_rows()
+            self._sorted_rows = rows[np.lexsort((self.position_ids[rows], self.expiration_days[rows]))]
+        return self._sorted_rows
+
+    def rows_for_ticker(self, ticker: str) -> np.ndarray:
+        """
+        Returns the rows of the positions for the input ticker that haven't been removed
+        """
+        if ticker not in self._ticker_codes:
+            return np.array([], dtype=np.int64)
+        return np.flatnonzero((self.ticker_codes[:self.size] == self._ticker_codes[ticker]) & ~self.removed[:self.size])
+
+    def columns(self, rows: np.ndarray) -> dict:
+        """
+        Returns a dictionary of column -> array for the positions in the input rows, with the prices converted back from cents
+        (NaN where they are missing) and the enums left as codes in the order of CONTRACT_TYPES, TRADE_DIRECTIONS and POSITION_STATUSES
+        """
+        def prices(column: np.ndarray) -> np.ndarray:
+            cents = column[rows]
+            return np.where(cents == MISSING_CENTS, np.nan, cents / 100)
+
+        return {
+            "position_ids": self.position_ids[rows],
+            "tickers": np.array(self.tickers, dtype=str)[self.ticker_codes[rows]] if len(rows) else np.array([], dtype=str),
+            "contract_types": self.contract_types[rows],
+            "trade_directions": self.trade_directions[rows],
+            "position_statuses": self.position_statuses[rows],
+            "quantities": self.quantities[rows],
+            "strike_prices": prices(self.strike_prices),
+            "premiums": prices(self.premiums),
+            "open_prices": prices(self.open_prices),
+            "close_prices": prices(self.close_prices),
+            "profits": prices(self.profits),
+            "expiration_days": self.expiration_days[rows],
+            "open_days": self.open_days[rows]
+        }
+
+    def to_json(self, rows: np.ndarray) -> list:
+        """
+        Returns the __json__ dictionaries of the positions in the input rows. Reading each column once is much faster than
+        calling __json__ on a view of every position
+        """
+        columns = {column_name: values.tolist() for column_name, values in self.columns(rows).items()}
+        for price_column in ["strike_prices", "premiums", "open_prices", "close_prices", "profits"]:
+            columns[price_column] = [None if price != price else price for price in columns[price_column]] # NaN != NaN
+
+        # Dates and enum names are shared between positions, so each distinct value is only converted once
+        day_strings = {}
+        def day_string(day: int) -> str:
+            if day not in day_strings:
+                day_strings[day] = date.fromordinal(day).isoformat()
+            return day_strings[day]
+
+        return [
+            {
+                "position_id": columns["position_ids"][i],
+                "ticker": columns["tickers"][i],
+                "contract_type": CONTRACT_TYPES[columns["contract_types"][i]].name,
+                "quantity": columns["quantities"][i],
+                "trade_direction": TRADE_DIRECTIONS[columns["trade_directions"][i]].name,
+                "strike_price": columns["strike_prices"][i],
+                "expiration_date": day_string(columns["expiration_days"][i]),
+                "is_expired": True,
+                "premium": columns["premiums"][i],
+                "open_price": columns["open_prices"][i],
+                "open_date": day_string(columns["open_days"][i]),
+                "position_status": POSITION_STATUSES[columns["position_statuses"][i]].name,
+                "close_price": columns["close_prices"][i],
+                "profit": columns["profits"][i],
+                "current_price": -1,
+                "priced_at": None
+            }
+            for i in range(len(rows))
+        ]
+
+    def nbytes(self) -> int:
+        """
+        Returns the number of bytes used by the arrays of the store
+        """
+        return sum(getattr(self, column_name).nbytes for column_name in self._column_names)
+
+    def __len__(self) -> int:
+        return self.size - self.num_removed
+
+# The purpose of this class is to let code written against OptionsPosition read the positions in PositionRecords without copying them
+class PositionView(OptionsPosition):
+    """
+    Read-only view of a single position in a PositionRecords store. Every attribute is read from the store's arrays when it is
+    accessed, so views are cheap to create and don't hold any data of their own. Expired positions don't have a current price
+    """
+    __slots__ = ("_records", "_row")
+
+    def __init__(self, records: PositionRecords, row: int):
+        self._records = records
+        self._row = row
+
+    @property
+    def position_id(self) -> int:
+        return int(self._records.position_ids[self._row])
+
+    @property
+    def ticker(self) -> str:
+        return self._records.tickers[self._records.ticker_codes[self._row]]
+
+    @property
+    def contract_type(self) -> ContractType:
+        return CONTRACT_TYPES[self._records.contract_types[self._row]]
+
+    @property
+    def quantity(self) -> int:
+        return int(self._records.quantities[self._row])
+
+    @property
+    def trade_direction(self) -> TradeDirection:
+        return TRADE_DIRECTIONS[self._records.trade_directions[self._row]]
+
+    @property
+    def strike_price(self) -> float:
+        return from_cents(int(self._records.strike_prices[self._row]))
+
+    @property
+    def expiration_date(self) -> date:
+        return date.fromordinal(int(self._records.expiration_days[self._row]))
+
+    @property
+    def is_expired(self) -> bool:
+        return True
+
+    @property
+    def premium(self) -> float:
+        return from_cents(int(self._records.premiums[self._row]))
+
+    @property
+    def open_price(self) -> float:
+        return from_cents(int(self._records.open_prices[self._row]))
+
+    @property
+    def open_date(self) -> date:
+        return date.fromordinal(int(self._records.open_days[self._row]))
+
+    @property
+    def position_status(self) -> PositionStatus:
+        return POSITION_STATUSES[self._records.position_statuses[self._row]]
+
+    @property
+    def close_price(self) -> float:
+        return from_cents(int(self._records.close_prices[self._row]))
+
+    @property
+    def profit(self) -> float:
+        return from_cents(int(self._records.profits[self._row]))
+
+    @property
+    def current_price(self) -> float:
+        return -1
+
+    @property
+    def priced_at(self):
+        return None
@@ -0,0 +1,180 @@
+import cProfile
+import json
+import os
+import pstats
+import re
+import socketserver
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+import flask
+import werkzeug
+
+# Number of functions listed in profile summaries and slow-request log entries
+TOP_FUNCTIONS = 15
+
+# Code that every request runs through(the server and Flask's dispatching), which is left out of the summaries since it would
+# always be at the top of the cumulative times without saying anything about what made a request slow
+ignored_paths = [
+    os.path.abspath(__file__),
+    os.path.abspath(threading.__file__),
+    os.path.abspath(socketserver.__file__),
+    os.path.dirname(os.path.abspath(flask.__file__)),
+    os.path.dirname(os.path.abspath(werkzeug.__file__))
+]
+
+def is_ignored_path(path: str) -> bool:
+    return any(path.startswith(ignored_path) for ignored_path in ignored_paths)
+
+def format_function(path: str, line: int, name: str) -> str:
+    return f"{path}:{line}({name})"
+
+def summarize_profile(profiler: cProfile.Profile, top: int = TOP_FUNCTIONS) -> list:
+    """
+    Returns the functions with the highest cumulative time in the input profile, as dictionaries with their call count, own time
+    and cumulative time
+    """
+    stats = pstats.Stats(profiler).sort_stats("cumulative")
+    summary = []
+    for function in stats.fcn_list:
+        path, line, name = function
+        if is_ignored_path(path):
+            continue
+        _, calls, total_time, cumulative_time, _ = stats.stats[function]
+        summary.append({
+            "function": format_function(path, line, name),
+            "calls": calls,
+            "own_seconds": round(total_time, 6),
+            "cumulative_seconds": round(cumulative_time, 6)
+        })
+        if len(summary) == top:
+            break
+    return summary
+
+def write_profile(profiler: cProfile.Profile, output_dir: str, name: str) -> str:
+    """
+    Writes the input profile to a .prof file(readable with pstats or snakeviz) in the input directory and returns its path
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    file_name = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}_{re.sub(r'[^A-Za-z0-9]+', '_', name).strip('_')}.prof"
+    path = os.path.join(output_dir, file_name)
+    profiler.dump_stats(path)
+    return path
+
+def start_profiler() -> cProfile.Profile:
+    """
+    Returns a running profiler for the calling thread, or None if another profiler is already running(only one can run at a
+    time on Python 3.12+)
+    """
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        print(f"Unable to start the profiler: {e}")
+        return None
+    return profiler
+
+@contextmanager
+def profile_block(name: str, output_dir: str, enabled: bool = True):
+    """
+    Profiles the with block with cProfile when enabled, then writes the profile to the output directory and prints its top
+    cumulative functions
+    """
+    profiler = start_profiler() if enabled else None
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            path = write_profile(profiler, output_dir, name)
+            print(json.dumps({"event": "profile", "name": name, "profile_path": path, "top_functions": summarize_profile(profiler)}))
+
+# The purpose of this class is to find out where slow requests spend their time without paying the overhead of profiling every request
+class StackSampler:
+    """
+    Sampling profiler for the threads that register with it.
+
+    A background thread records the call stack of every registered thread each interval seconds, and the functions are then
+    ranked by how many samples they showed up in. A function that shows up in half of a thread's samples took about half of its
+    time(including the functions it called). The background thread only wakes up while threads are registered
+    """
+    interval: float
+
+    def __init__(self, interval: float):
+        self.interval = interval # In seconds
+        self._samples = {} # Maps thread id -> [number of samples, Counter of (path, line, name) -> samples it showed up in]
+        self._lock = threading.Lock()
+        self._has_threads = threading.Event()
+        self._thread = None
+
+    def register(self, thread_id: int):
+        """
+        Starts sampling the input thread
+        """
+        with self._lock:
+            self._samples[thread_id] = [0, Counter()]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack_sampler", daemon=True)
+                self._thread.start()
+            self._has_threads.set()
+
+    def unregister(self, thread_id: int) -> tuple:
+        """
+        Stops sampling the input thread and returns its (number of samples, Counter of function -> samples it showed up in)
+        """
+        with self._lock:
+            samples = self._samples.pop(thread_id, [0, Counter()])
+            if not self._samples:
+                self._has_threads.clear()
+        return tuple(samples)
+
+    def _run(self):
+        while True:
+            self._has_threads.wait()
+            time.sleep(self.interval)
+
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, samples in self._samples.items():
+                    frame = frames.get(thread_id)
+                    # Recursive functions are only counted once per sample
+                    functions = set()
+                    while frame is not None:
+                        code = frame.f_code
+                        functions.add((code.co_filename, code.co_firstlineno, code.co_name))
+                        frame = frame.f_back
+                    samples[0] += 1
+                    samples[1].update(functions)
+
+def summarize_samples(sample_count: int, function_samples: Counter, duration: float, top: int = TOP_FUNCTIONS) -> list:
+    """
+    Returns the functions that showed up in the most samples, with their estimated cumulative time out of the input duration
+    """
+    if sample_count == 0:
+        return []
+
+    summary = []
+    for (path, line, name), samples in function_samples.most_common():
+        if is_ignored_path(path):
+            continue
+        summary.append({
+            "function": format_function(path, line, name),
+            "samples": samples,
+            "cumulative_seconds": round(duration * samples / sample_count, 6)
+        })
+        if len(summary) == top:
+            break
+    return summary
+
+def log_slow_request(entry: dict, log_path: str = None):
+    """
+    Prints the input slow request log entry as a line of JSON, and appends it to the log file if there is one
+    """
+    line = json.dumps({"event": "slow_request", **entry})
+    print(line)
+    if log_path:
+        with open(log_path, "a") as log_file:
+            log_file.write(line + "\n")
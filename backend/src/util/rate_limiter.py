@@ -1,32 +1,185 @@
+import asyncio
+import inspect
+import threading
 import time
-from collections import deque
+
+class TokenBucket:
+    """
+    Token bucket that refills at rate tokens per second up to capacity tokens.
+
+    Callers reserve tokens up front, so the bucket can go negative. A negative balance represents the callers queued up behind
+    each other, and each caller waits until its own reservation is covered by the refill. This keeps the limiter fair(first come
+    first served) and means the lock is never held while a caller waits.
+    """
+    rate: float
+    capacity: float
+    tokens: float
+    last_refill: float
+
+    def __init__(self, rate: float, capacity: float):
+        if not rate > 0:
+            raise ValueError("The token bucket rate must be positive")
+        if not capacity >= 1:
+            raise ValueError("The token bucket capacity must be at least 1")
+
+        self.rate = rate # Tokens per second, fractional rates are supported
+        self.capacity = capacity # Maximum burst size
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.calls = 0
+        self.waited_calls = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.queue_depth = 0 # Number of callers currently waiting on this bucket
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        Reserves the input number of tokens and returns how long the caller must wait(in seconds) before using them
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.tokens -= tokens
+
+            wait_time = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.calls += 1
+            if wait_time > 0:
+                self.queue_depth += 1
+            return wait_time
+
+    def record_wait(self, wait_time: float):
+        """
+        Records that a caller has finished waiting wait_time seconds for its reservation
+        """
+        if wait_time <= 0:
+            return
+
+        with self._lock:
+            self.queue_depth -= 1
+            self.waited_calls += 1
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Blocks until the input number of tokens are available and returns how long we waited
+        """
+        wait_time = self.reserve(tokens)
+        if wait_time > 0:
+            time.sleep(wait_time)
+            self.record_wait(wait_time)
+        return wait_time
+
+    async def acquire_async(self, tokens: float = 1) -> float:
+        """
+        Awaits until the input number of tokens are available and returns how long we waited
+        """
+        wait_time = self.reserve(tokens)
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+            self.record_wait(wait_time)
+        return wait_time
+
+    def stats(self) -> dict:
+        """
+        Returns the call, queue depth and wait time statistics of the bucket
+        """
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "capacity": self.capacity,
+                "calls": self.calls,
+                "waited_calls": self.waited_calls,
+                "queue_depth": self.queue_depth,
+                "total_wait_time": self.total_wait_time,
+                "average_wait_time": self.total_wait_time / self.waited_calls if self.waited_calls else 0.0,
+                "max_wait_time": self.max_wait_time
+            }
 
 # The purpose of this class is to limit the rate at which we make calls to APIs so that we don't get throttled
 class RateLimitedExecutor:
-    max_calls_per_period: int
+    """
+    Rate limits calls using a shared token bucket, plus an optional token bucket per endpoint so that different kinds of calls
+    (ex: history and option_chain) can be given their own budgets on top of the shared one.
+
+    endpoint_limits maps an endpoint name to a (max_calls_per_period, period) or (max_calls_per_period, period, burst) tuple
+    """
+    max_calls_per_period: float
     period: float
-    call_times: deque
+    bucket: TokenBucket
+    endpoint_buckets: dict
 
-    def __init__(self, max_calls_per_period, period):
-        self.max_calls_per_period = max_calls_per_period # Fractional not supported
+    def __init__(self, max_calls_per_period: float, period: float, burst: float = None, endpoint_limits: dict = None):
+        self.max_calls_per_period = max_calls_per_period
         self.period = period # In seconds
-        self.call_times = deque()
+        self.bucket = TokenBucket(max_calls_per_period / period, burst or max(1, max_calls_per_period))
+        self.endpoint_buckets = {}
+        for endpoint, limit in (endpoint_limits or {}).items():
+            endpoint_max_calls, endpoint_period = limit[0], limit[1]
+            endpoint_burst = limit[2] if len(limit) > 2 else max(1, endpoint_max_calls)
+            self.endpoint_buckets[endpoint] = TokenBucket(endpoint_max_calls / endpoint_period, endpoint_burst)
 
-    def _apply_rate_limit(self):
-        now = time.monotonic()
+    def _reserve(self, endpoint: str = None) -> tuple:
+        buckets = [self.bucket]
+        if endpoint is not None and endpoint in self.endpoint_buckets:
+            buckets.append(self.endpoint_buckets[endpoint])
 
-        # Remove older timestamps from the deque
-        while self.call_times and now - self.call_times[0] > self.period:
-            self.call_times.popleft()
+        # We have to wait for whichever bucket is the most backed up. Only the buckets that had to queue the caller record a wait,
+        # and each of them records its own wait rather than the overall one, so that the statistics show which bucket is the bottleneck
+        bucket_wait_times = [(bucket, bucket.reserve()) for bucket in buckets]
+        wait_time = max(bucket_wait_time for _, bucket_wait_time in bucket_wait_times)
+        return [(bucket, bucket_wait_time) for bucket, bucket_wait_time in bucket_wait_times if bucket_wait_time > 0], wait_time
 
-        # If we have made max calls in this period, just wait
-        if len(self.call_times) >= self.max_calls_per_period:
-            wait_time = self.period - (now - self.call_times[0])
+    def acquire(self, endpoint: str = None) -> float:
+        """
+        Blocks until a call to the input endpoint is allowed and returns how long we waited
+        """
+        waiting_buckets, wait_time = self._reserve(endpoint)
+        if wait_time > 0:
             time.sleep(wait_time)
+            for bucket, bucket_wait_time in waiting_buckets:
+                bucket.record_wait(bucket_wait_time)
+        return wait_time
 
-        self.call_times.append(now)
+    async def acquire_async(self, endpoint: str = None) -> float:
+        """
+        Awaits until a call to the input endpoint is allowed and returns how long we waited. Unlike acquire, this doesn't block
+        the thread while waiting
+        """
+        waiting_buckets, wait_time = self._reserve(endpoint)
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+            for bucket, bucket_wait_time in waiting_buckets:
+                bucket.record_wait(bucket_wait_time)
+        return wait_time
 
     # Calls the function using the rate limiter
     def call(self, func, *args, **kwargs):
-        self._apply_rate_limit()
+        self.acquire()
         return func(*args, **kwargs)
+
+    # Calls the function using the rate limiter and the budget of the input endpoint
+    def call_endpoint(self, endpoint: str, func, *args, **kwargs):
+        self.acquire(endpoint)
+        return func(*args, **kwargs)
+
+    # Calls the function using the rate limiter and the budget of the input endpoint, awaiting the result if func is async
+    async def call_async(self, endpoint: str, func, *args, **kwargs):
+        await self.acquire_async(endpoint)
+        result = func(*args, **kwargs)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    def stats(self) -> dict:
+        """
+        Returns the statistics of the shared bucket and of each endpoint bucket
+        """
+        return {
+            "shared": self.bucket.stats(),
+            "endpoints": {endpoint: bucket.stats() for endpoint, bucket in self.endpoint_buckets.items()}
+        }
@@ -0,0 +1,113 @@
+import threading
+import time
+from datetime import datetime, time as time_of_day
+from zoneinfo import ZoneInfo
+
+# Regular trading hours of the US options exchanges
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+MARKET_OPEN = time_of_day(9, 30)
+MARKET_CLOSE = time_of_day(16, 0)
+
+def is_market_open(now: datetime = None) -> bool:
+    """
+    Returns whether the input time(defaults to now) is within the regular trading hours on a weekday. Market holidays aren't
+    accounted for
+    """
+    now = (now or datetime.now(MARKET_TIMEZONE)).astimezone(MARKET_TIMEZONE)
+    return now.weekday() < 5 and MARKET_OPEN <= now.time() < MARKET_CLOSE
+
+# The purpose of this class is to run background work(ex: refreshing prices) on a fixed cadence off of the request path
+class PeriodicTask:
+    """
+    Runs func every interval seconds on a daemon thread.
+
+    If should_run is provided, it is checked before every run and the run is skipped when it returns False. Exceptions raised by
+    func are printed and recorded instead of stopping the task.
+    """
+    name: str
+    interval: float
+    runs: int
+    skipped_runs: int
+    failed_runs: int
+    last_run_at: datetime
+    last_duration: float
+    last_error: str
+
+    def __init__(self, name: str, interval: float, func, should_run=None):
+        self.name = name
+        self.interval = interval # In seconds
+        self.func = func
+        self.should_run = should_run
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        # Statistics
+        self.runs = 0
+        self.skipped_runs = 0
+        self.failed_runs = 0
+        self.last_run_at = None
+        self.last_duration = None
+        self.last_error = None
+
+    def start(self):
+        """
+        Starts running the task in the background, the first run happens after one interval
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_loop, name=self.name, daemon=True)
+        self._thread.start()
+        print(f"Started the {self.name} task, running every {self.interval} seconds")
+
+    def stop(self, timeout: float = None):
+        """
+        Stops the task, waiting up to timeout seconds for a run in progress to finish
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_once(self):
+        """
+        Runs the task right away on the calling thread
+        """
+        if self.should_run is not None and not self.should_run():
+            self.skipped_runs += 1
+            return
+
+        start = time.monotonic()
+        self.last_run_at = datetime.now().astimezone()
+        try:
+            self.func()
+            self.last_error = None
+        except Exception as e:
+            self.failed_runs += 1
+            self.last_error = str(e)
+            print(f"The {self.name} task failed: {e}")
+        finally:
+            self.runs += 1
+            self.last_duration = time.monotonic() - start
+
+    def _run_loop(self):
+        # wait() returns True once the task is stopped
+        while not self._stop_event.wait(self.interval):
+            self.run_once()
+
+    def stats(self) -> dict:
+        """
+        Returns the run statistics of the task
+        """
+        return {
+            "name": self.name,
+            "interval": self.interval,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "runs": self.runs,
+            "skipped_runs": self.skipped_runs,
+            "failed_runs": self.failed_runs,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error
+        }
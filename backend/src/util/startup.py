@@ -0,0 +1,61 @@
+import threading
+import time
+
+# The purpose of this class is to let the server start answering requests while it is still warming up, and to report how far along it is
+class StartupProgress:
+    """
+    Tracks the stage the server is at while starting up(ex: loading -> pricing -> ready), how long each stage took and the error
+    if a stage failed. A failed startup can be retried by advancing to a stage again, which clears the error.
+
+    Stages are advanced by the thread doing the startup work and read by the threads serving requests
+    """
+    stage: str
+    error: str
+    failures: int
+
+    def __init__(self, stage: str = "starting"):
+        self.stage = stage
+        self.error = None
+        self.failures = 0
+        self._started_at = time.perf_counter()
+        self._stage_started_at = self._started_at
+        self._stage_durations = {} # Maps stage -> how long it took, in seconds
+        self._lock = threading.Lock()
+
+    def advance(self, stage: str):
+        """
+        Ends the current stage and starts the input stage
+        """
+        with self._lock:
+            now = time.perf_counter()
+            self._stage_durations[self.stage] = now - self._stage_started_at
+            self.stage = stage
+            self._stage_started_at = now
+            if stage != "failed":
+                self.error = None
+
+    def fail(self, error: Exception):
+        """
+        Ends the current stage with the input error
+        """
+        error = f"{self.stage}: {error}"
+        self.advance("failed")
+        with self._lock:
+            self.error = error
+            self.failures += 1
+
+    def stats(self) -> dict:
+        """
+        Returns the current stage, how long it has been running, how long the finished stages took, the error if the current
+        stage is failed and the number of failures so far
+        """
+        with self._lock:
+            now = time.perf_counter()
+            return {
+                "stage": self.stage,
+                "error": self.error,
+                "failures": self.failures,
+                "stage_seconds": round(now - self._stage_started_at, 6),
+                "seconds_since_start": round(now - self._started_at, 6),
+                "stage_durations": {stage: round(duration, 6) for stage, duration in self._stage_durations.items()}
+            }
@@ -0,0 +1,270 @@
+"""
+Benchmarks for the hot paths of the options positions API, run against synthetic books of positions.
+
+The DB is replaced with an in-memory stand-in and the market data comes from the local provider(synthetic data, or recorded data
+if MARKET_DATA_LOCAL_DIR is set), so the timings only measure our own code and are repeatable between runs. Results are written
+as JSON, and passing the results of a previous run as the baseline reports any benchmarks that got slower.
+
+Run from the backend directory:
+    python -m test.benchmark --sizes 1000 10000 100000 --output results.json --baseline previous_results.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+# The benchmarks always run offline, so these have to be set before the app modules are imported
+os.environ["MARKET_DATA_PROVIDER"] = "local"
+os.environ.setdefault("MARKET_DATA_STORE_PATH", os.path.join(tempfile.mkdtemp(), "benchmark_market_data.sqlite3"))
+os.environ["PRICE_REFRESH_INTERVAL_SECONDS"] = "0"
+
+import psycopg2
+from test.in_memory_database import InMemoryDatabase
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+TICKERS = [
+    "AAPL", "MSFT", "AMZN", "GOOGL", "META", "NVDA", "TSLA", "AMD", "NFLX", "INTC",
+    "JPM", "BAC", "XOM", "CVX", "KO", "PEP", "DIS", "WMT", "SPY", "QQQ"
+]
+
+# Number of future monthly expirations the active positions are spread over
+ACTIVE_EXPIRY_MONTHS = 12
+
+# Share of the synthetic positions that are expired, books accumulate expired positions over time
+EXPIRED_SHARE = 0.7
+
+# Number of positions added(and then deleted) one request at a time in the add/delete benchmarks
+ADD_DELETE_OPERATIONS = 100
+
+database = InMemoryDatabase()
+psycopg2.connect = database.connect
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from flask import Flask
+    import src.api.options_positions as options_positions
+    from src.api.metrics import metrics_api
+    from src.api.profiling import profiling_api
+    from src.data.data_fetcher import get_market_data_provider, option_chain_cache
+    from src.data.local_market_data_provider import synthetic_strike_step
+    from src.data.option_positions_dao import get_positions, init_db
+    from src.util.pnl_engine import PnlEngine
+    init_db()
+
+def get_monthly_expirations(start: date, months: int) -> list:
+    """
+    Returns the third Friday of each of the input number of months, starting with the month of the input date
+    """
+    expirations = []
+    year, month = start.year, start.month
+    for _ in range(months):
+        first_day = date(year, month, 1)
+        expirations.append(first_day + timedelta(days=(4 - first_day.weekday()) % 7 + 14))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return expirations
+
+def generate_position_rows(size: int, today: date, seed: int = 0) -> list:
+    """
+    Returns the DB rows of a synthetic book with the input number of positions. Active positions have strikes that are in the
+    local provider's synthetic option chains, so all of them can be priced
+    """
+    rng = random.Random(seed)
+    active_expirations = [expiration for expiration in get_monthly_expirations(today, ACTIVE_EXPIRY_MONTHS + 1) if expiration > today]
+    expired_expirations = [expiration for expiration in get_monthly_expirations(today - timedelta(days=730), 24) if expiration < today]
+
+    underlying_prices = {}
+    for ticker in TICKERS:
+        closes = get_market_data_provider().get_closing_prices(ticker, today - timedelta(days=7), today)
+        underlying_prices[ticker] = closes[max(closes)]
+
+    rows = []
+    for position_id in range(1, size + 1):
+        ticker = rng.choice(TICKERS)
+        is_expired = rng.random() < EXPIRED_SHARE
+        expiration_date = rng.choice(expired_expirations if is_expired else active_expirations)
+        underlying_price = underlying_prices[ticker]
+        step = synthetic_strike_step(underlying_price)
+        strike_price = round(underlying_price * rng.uniform(0.8, 1.2) / step) * step
+        premium = round(rng.uniform(0.5, 0.1 * underlying_price), 2)
+        quantity = rng.randint(1, 10)
+
+        position_status, close_price, profit = "open", None, None
+        if is_expired:
+            close_price = round(underlying_price * rng.uniform(0.8, 1.2), 2)
+            position_status = rng.choice(["expired", "exercised"])
+            profit = round(-premium * quantity * 100, 2)
+
+        rows.append((
+            position_id,
+            ticker,
+            rng.choice(["call", "put"]),
+            quantity,
+            rng.choice(["long", "short"]),
+            Decimal(f"{strike_price:.2f}"),
+            expiration_date,
+            is_expired,
+            Decimal(f"{premium:.2f}"),
+            Decimal(f"{underlying_price:.2f}"),
+            expiration_date - timedelta(days=rng.randint(7, 120)),
+            position_status,
+            None if close_price is None else Decimal(f"{close_price:.2f}"),
+            None if profit is None else Decimal(f"{profit:.2f}")
+        ))
+
+    return rows
+
+def time_calls(func, repeats: int, setup=None) -> list:
+    """
+    Returns the number of seconds each of the input number of calls to func took. setup is called before each call, untimed
+    """
+    timings = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    return timings
+
+def summarize(benchmark: str, size: int, timings: list) -> dict:
+    return {
+        "benchmark": benchmark,
+        "size": size,
+        "repeats": len(timings),
+        "min_seconds": min(timings),
+        "median_seconds": statistics.median(timings),
+        "max_seconds": max(timings)
+    }
+
+def run_benchmarks(size: int, repeats: int, today: date) -> list:
+    """
+    Runs every benchmark against a synthetic book with the input number of positions and returns their results
+    """
+    database.load(generate_position_rows(size, today))
+    app = Flask(__name__)
+    app.register_blueprint(options_positions.options_positions_api)
+    app.register_blueprint(metrics_api)
+    app.register_blueprint(profiling_api)
+    client = app.test_client()
+    api_header = options_positions.api_header
+    position_book = options_positions.position_book
+    results = []
+
+    # Each startup fetches its option chains from scratch, the same as after a restart. Loading is all that happens before the
+    # positions can be served in background startup mode
+    timings = time_calls(options_positions.load_options_positions, repeats)
+    results.append(summarize("load_options_positions", size, timings))
+    timings = time_calls(options_positions.initialize_options_positions, repeats, setup=option_chain_cache.invalidate)
+    results.append(summarize("initialize_options_positions", size, timings))
+
+    timings = time_calls(lambda: get_positions(True, True), repeats)
+    results.append(summarize("get_positions", size, timings))
+
+    for listing, endpoint in [("active", "get_active_position"), ("expired", "get_expired_position")]:
+        # Cold requests have to serialize the listing, warm requests are served from the cached response
+        mark_changed = lambda: position_book.mark_changed(active=listing == "active", expired=listing == "expired")
+        timings = time_calls(lambda: client.get(f"{api_header}/{endpoint}"), repeats, setup=mark_changed)
+        results.append(summarize(f"{endpoint}_cold", size, timings))
+        timings = time_calls(lambda: client.get(f"{api_header}/{endpoint}"), repeats)
+        results.append(summarize(f"{endpoint}_warm", size, timings))
+
+    positions = get_positions(True, True)
+    timings = time_calls(lambda: [position.calculate_profit() for position in positions], repeats)
+    results.append(summarize("calculate_profit", size, timings))
+
+    timings = time_calls(lambda: PnlEngine(position_book.active_positions(), position_book.expired_columns()).totals(), repeats)
+    results.append(summarize("pnl_engine_totals", size, timings))
+
+    # Adding positions on the chains that are already cached, the same as a user adding positions to their existing tickers
+    template = next(position for position in positions if not position.is_expired)
+    new_position = {
+        "ticker": template.ticker,
+        "contract_type": template.contract_type.value,
+        "quantity": 1,
+        "trade_direction": template.trade_direction.value,
+        "strike_price": template.strike_price,
+        "expiration_date": template.expiration_date.isoformat(),
+        "premium": 1.0,
+        "open_price": template.open_price,
+        "open_date": today.isoformat()
+    }
+    timings = time_calls(lambda: client.post(f"{api_header}/add_position", json=new_position), ADD_DELETE_OPERATIONS)
+    results.append(summarize("add_position", size, timings))
+
+    added_position_ids = list(range(database.last_position_id - ADD_DELETE_OPERATIONS + 1, database.last_position_id + 1))
+    timings = time_calls(lambda: client.post(f"{api_header}/delete_position", json={"position_id": added_position_ids.pop()}), ADD_DELETE_OPERATIONS)
+    results.append(summarize("delete_position", size, timings))
+
+    return results
+
+def get_git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def find_regressions(results: list, baseline_results: list, threshold: float) -> list:
+    """
+    Returns the (result, baseline result) pairs whose median time is more than threshold(ex: 0.2 for 20%) slower than the baseline
+    """
+    baseline = {(result["benchmark"], result["size"]): result for result in baseline_results}
+    regressions = []
+    for result in results:
+        baseline_result = baseline.get((result["benchmark"], result["size"]))
+        if baseline_result is not None and result["median_seconds"] > baseline_result["median_seconds"] * (1 + threshold):
+            regressions.append((result, baseline_result))
+    return regressions
+
+def main(args: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks the options positions API against synthetic books of positions")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Numbers of positions in the synthetic books")
+    parser.add_argument("--repeats", type=int, default=5, help="Number of times each benchmark is run")
+    parser.add_argument("--output", default="benchmark_results.json", help="File the JSON results are written to")
+    parser.add_argument("--baseline", help="Results of a previous run to check for regressions against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Slowdown over the baseline that counts as a regression")
+    parsed_args = parser.parse_args(args)
+
+    today = date.today()
+    results = []
+    for size in parsed_args.sizes:
+        print(f"Benchmarking a book of {size} positions...")
+        for result in run_benchmarks(size, parsed_args.repeats, today):
+            print(f"  {result['benchmark']:<32} median {result['median_seconds'] * 1000:10.3f} ms  min {result['min_seconds'] * 1000:10.3f} ms")
+            results.append(result)
+
+    with open(parsed_args.output, "w") as output_file:
+        json.dump({
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_commit": get_git_commit(),
+            "python_version": platform.python_version(),
+            "platform": platform.platform(),
+            "market_data_provider": get_market_data_provider().name,
+            "results": results
+        }, output_file, indent=2)
+    print(f"Results written to {parsed_args.output}")
+
+    if parsed_args.baseline is None:
+        return 0
+
+    with open(parsed_args.baseline) as baseline_file:
+        regressions = find_regressions(results, json.load(baseline_file)["results"], parsed_args.threshold)
+    for result, baseline_result in regressions:
+        print(
+            f"Regression: {result['benchmark']} with {result['size']} positions took {result['median_seconds'] * 1000:.3f} ms, "
+            f"up from {baseline_result['median_seconds'] * 1000:.3f} ms"
+        )
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
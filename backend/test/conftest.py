@@ -0,0 +1,26 @@
+import threading
+import pytest
+from flask import Flask
+import src.api.options_positions as options_positions
+from src.util.position_book import PositionBook
+
+@pytest.fixture
+def position_book(monkeypatch) -> PositionBook:
+    """
+    Empty position book that the options positions API serves from for the duration of a test
+    """
+    position_book = PositionBook()
+    monkeypatch.setattr(options_positions, "position_book", position_book)
+    return position_book
+
+@pytest.fixture
+def client(monkeypatch):
+    """
+    Test client for the options positions API, with the positions marked as loaded
+    """
+    loaded = threading.Event()
+    loaded.set()
+    monkeypatch.setattr(options_positions, "positions_loaded", loaded)
+    app = Flask(__name__)
+    app.register_blueprint(options_positions.options_positions_api)
+    return app.test_client()
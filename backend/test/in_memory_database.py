@@ -0,0 +1,137 @@
+"""
+In-memory stand-in for the PostgreSQL connections used by the DAO, shared by the benchmarks and the tests. Install it with
+psycopg2.connect = InMemoryDatabase().connect before the connection pool is created
+"""
+import re
+import psycopg2
+
+# The purpose of this class is to stand in for PostgreSQL so that the benchmarks and tests exercise the app rather than the DB
+class InMemoryDatabase:
+    """
+    Serves the statements the DAO sends to the option_positions table from a dictionary of rows. Statements it doesn't know about
+    (ex: the schema migrations and bulk updates) are accepted and ignored.
+
+    Statements run through psycopg2.extras.execute_values get the list of mogrified rows as their params(see InMemoryCursor)
+    """
+    rows: dict # Maps position_id -> row of option_positions_fields values
+
+    def __init__(self):
+        self.rows = {}
+        self.applied_migrations = set()
+        self.last_position_id = 0
+        self._sorted_rows = {} # Maps the is_expired filter -> rows ordered by (expiration_date, position_id), cleared on writes
+
+    def load(self, rows: list):
+        """
+        Replaces the rows of the table with the input rows
+        """
+        self.rows = {row[0]: row for row in rows}
+        self.last_position_id = max(self.rows, default=0)
+        self._sorted_rows = {}
+
+    def get_rows(self, is_expired: bool = None) -> list:
+        """
+        Returns the rows ordered by (expiration_date, position_id), optionally only the ones with the input is_expired
+        """
+        if is_expired not in self._sorted_rows:
+            rows = [row for row in self.rows.values() if is_expired is None or row[7] == is_expired]
+            rows.sort(key=lambda row: (row[6], row[0]))
+            self._sorted_rows[is_expired] = rows
+        return self._sorted_rows[is_expired]
+
+    def execute(self, sql: str, params) -> list:
+        """
+        Runs the input statement and returns its result rows
+        """
+        statement = " ".join(sql.split())
+        if statement.startswith("SELECT migration FROM schema_migrations"):
+            return [(migration,) for migration in self.applied_migrations]
+        if statement.startswith("INSERT INTO schema_migrations"):
+            self.applied_migrations.add(params[0])
+        elif statement.startswith("SELECT 1"):
+            return [(1,)]
+        elif statement.startswith("SELECT last_value FROM current_position_id"):
+            return [(self.last_position_id,)]
+        elif statement.startswith("SELECT nextval('current_position_id') FROM generate_series"):
+            first_position_id = self.last_position_id + 1
+            self.last_position_id += params[0]
+            return [(position_id,) for position_id in range(first_position_id, self.last_position_id + 1)]
+        elif statement.startswith("SELECT nextval('current_position_id')"):
+            self.last_position_id += 1
+            return [(self.last_position_id,)]
+        elif statement.startswith("INSERT INTO option_positions "):
+            for row in params if isinstance(params, list) else [params]:
+                self.rows[row[0]] = tuple(row)
+            self._sorted_rows = {}
+        elif statement.startswith("DELETE FROM option_positions"):
+            self.rows.pop(params[0], None)
+            self._sorted_rows = {}
+        elif statement.startswith("SELECT position_id, ticker") and "FROM option_positions" in statement:
+            is_expired = re.search(r"WHERE is_expired = (true|false)", statement)
+            return list(self.get_rows(None if is_expired is None else is_expired.group(1) == "true"))
+        return []
+
+    def connect(self, *args, **kwargs) -> "InMemoryConnection":
+        return InMemoryConnection(self)
+
+class InMemoryCursor:
+    def __init__(self, connection: "InMemoryConnection"):
+        self.connection = connection
+        self.itersize = 2000
+        self._rows = []
+        self._mogrified_rows = []
+
+    def execute(self, sql, params=None):
+        # execute_values mogrifies the rows into the statement itself, so they are handed over as the params instead
+        if params is None and self._mogrified_rows:
+            params, self._mogrified_rows = self._mogrified_rows, []
+        self._rows = self.connection.database.execute(sql.decode() if isinstance(sql, bytes) else sql, params)
+
+    def mogrify(self, template, args) -> bytes:
+        self._mogrified_rows.append(tuple(args))
+        return repr(tuple(args)).encode()
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self) -> list:
+        return self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class InMemoryConnection:
+    class Info:
+        transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    closed = 0
+    autocommit = False
+    encoding = "UTF8"
+    info = Info()
+
+    def __init__(self, database: InMemoryDatabase):
+        self.database = database
+
+    def cursor(self, name: str = None, **kwargs) -> InMemoryCursor:
+        return InMemoryCursor(self)
+
+    def set_isolation_level(self, isolation_level: int):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
@@ -0,0 +1,43 @@
+"""
+Synthetic positions shared by the tests
+"""
+import random
+from datetime import date, timedelta
+from src.util.options_position import ContractType, OptionsPosition, PositionStatus, TradeDirection
+
+TICKERS = ["AAPL", "MSFT", "SPY", "TSLA"]
+
+def generate_positions(size: int, expired: bool, seed: int = 0, first_position_id: int = 1) -> list:
+    """
+    Returns the input number of positions with random(but repeatable) fields. Expired positions are settled at a random underlying
+    price and active positions are given a random current price, or left unpriced(current_price of -1) now and then. The
+    position_ids are consecutive, starting at first_position_id
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    positions = []
+    for position_id in range(first_position_id, first_position_id + size):
+        expiration_date = today + timedelta(days=rng.randint(-720, -1) if expired else rng.randint(1, 365))
+        strike_price = round(rng.uniform(50, 500), 2)
+        position = OptionsPosition(
+            position_id,
+            rng.choice(TICKERS),
+            rng.choice(list(ContractType)),
+            rng.randint(1, 10),
+            rng.choice(list(TradeDirection)),
+            strike_price,
+            expiration_date,
+            round(rng.uniform(0.05, 20), 2),
+            round(strike_price * rng.uniform(0.8, 1.2), 2),
+            expiration_date - timedelta(days=rng.randint(1, 120)),
+            blind_init=False
+        )
+        if expired:
+            position.update_position_at_maturity(round(strike_price * rng.uniform(0.8, 1.2), 2))
+        else:
+            position.position_status = PositionStatus.OPEN
+            position.current_price = -1 if rng.random() < 0.1 else round(rng.uniform(0.01, 30), 2)
+            position.close_price = None
+            position.profit = position.calculate_profit()
+        positions.append(position)
+    return positions
@@ -0,0 +1,91 @@
+"""
+Checks the vectorized Black-Scholes prices, greeks and implied volatility solver against known values.
+
+Run from the backend directory:
+    python -m pytest -q test
+"""
+from datetime import date, datetime, timedelta
+import numpy as np
+from src.util.black_scholes import calculate_position_greeks, implied_volatilities, option_greeks, option_prices
+from src.util.options_position import ContractType, OptionsPosition, TradeDirection
+from src.util.scheduler import MARKET_CLOSE, MARKET_TIMEZONE
+
+RATE = 0.05
+
+# At the money call and put with a year to go at 20% volatility, whose values are listed in most references on Black-Scholes
+UNDERLYING_PRICES = np.array([100.0, 100.0])
+STRIKE_PRICES = np.array([100.0, 100.0])
+YEARS_TO_EXPIRY = np.array([1.0, 1.0])
+VOLATILITIES = np.array([0.2, 0.2])
+IS_CALL = np.array([True, False])
+
+def test_option_prices():
+    prices = option_prices(UNDERLYING_PRICES, STRIKE_PRICES, YEARS_TO_EXPIRY, RATE, VOLATILITIES, IS_CALL)
+    np.testing.assert_allclose(prices, [10.4506, 5.5735], atol=1e-4)
+    # Put-call parity
+    assert abs(prices[0] - prices[1] - (100 - 100 * np.exp(-RATE))) < 1e-6
+
+def test_option_greeks():
+    greeks = option_greeks(UNDERLYING_PRICES, STRIKE_PRICES, YEARS_TO_EXPIRY, RATE, VOLATILITIES, IS_CALL)
+    np.testing.assert_allclose(greeks["delta"], [0.6368, -0.3632], atol=1e-4)
+    np.testing.assert_allclose(greeks["gamma"], [0.018762, 0.018762], atol=1e-6)
+    # Vega is per volatility point and theta is per calendar day
+    np.testing.assert_allclose(greeks["vega"], [0.37524, 0.37524], atol=1e-5)
+    np.testing.assert_allclose(greeks["theta"], [-6.4140 / 365, -1.6579 / 365], atol=1e-4 / 365)
+
+def test_implied_volatilities_recover_the_pricing_volatility():
+    rng = np.random.default_rng(0)
+    size = 1000
+    underlying_prices = rng.uniform(50, 150, size)
+    strike_prices = underlying_prices * rng.uniform(0.7, 1.3, size)
+    years_to_expiry = rng.uniform(0.05, 2, size)
+    volatilities = rng.uniform(0.1, 1.5, size)
+    is_call = rng.random(size) < 0.5
+    prices = option_prices(underlying_prices, strike_prices, years_to_expiry, RATE, volatilities, is_call)
+
+    solved = implied_volatilities(prices, underlying_prices, strike_prices, years_to_expiry, RATE, is_call)
+
+    # Deep out of the money options barely move with volatility, so only the ones worth solving for are checked
+    vegas = option_greeks(underlying_prices, strike_prices, years_to_expiry, RATE, volatilities, is_call)["vega"]
+    solvable = vegas > 1e-3
+    assert solvable.sum() > size / 2
+    np.testing.assert_allclose(solved[solvable], volatilities[solvable], atol=1e-4)
+
+def test_implied_volatilities_of_impossible_prices_are_nan():
+    # Below the intrinsic value, above the underlying price, and past the expiration
+    market_prices = np.array([5.0, 150.0, 10.0])
+    underlying_prices = np.array([120.0, 100.0, 100.0])
+    strike_prices = np.array([100.0, 100.0, 100.0])
+    years_to_expiry = np.array([1.0, 1.0, -0.01])
+    is_call = np.array([True, True, True])
+
+    solved = implied_volatilities(market_prices, underlying_prices, strike_prices, years_to_expiry, RATE, is_call)
+    assert np.isnan(solved).all()
+
+def test_position_greeks_scale_with_the_shares_held():
+    now = datetime(2026, 1, 2, 10, tzinfo=MARKET_TIMEZONE)
+    expiration_date = date(2026, 1, 2) + timedelta(days=365)
+    years_to_expiry = (datetime.combine(expiration_date, MARKET_CLOSE, tzinfo=MARKET_TIMEZONE) - now).total_seconds() / (365 * 24 * 60 * 60)
+    price = option_prices(np.array([100.0]), np.array([100.0]), np.array([years_to_expiry]), RATE, np.array([0.2]), np.array([True]))[0]
+    positions = [
+        OptionsPosition(
+            position_id, "AAPL", ContractType.CALL, quantity, trade_direction, strike_price=100.0, expiration_date=expiration_date,
+            premium=5.0, open_price=100.0, open_date=date(2026, 1, 2), profit=0.0, blind_init=False
+        )
+        for position_id, trade_direction, quantity in [(1, TradeDirection.LONG, 2), (2, TradeDirection.SHORT, 1), (3, TradeDirection.LONG, 1)]
+    ]
+    market_data = {
+        1: (100.0, price, price, price),
+        2: (100.0, 0.0, 0.0, price), # No valid quote, so the last price is used
+        3: (100.0, 0.0, 0.0, 0.0) # Worth less than any volatility allows
+    }
+
+    greeks = calculate_position_greeks(positions, market_data, RATE, now)
+
+    long_position, short_position, unsolved_position = greeks["positions"]
+    assert abs(long_position["implied_volatility"] - 0.2) < 1e-4
+    assert abs(short_position["delta"] + long_position["delta"] / 2) < 1e-6
+    assert unsolved_position["implied_volatility"] is None and unsolved_position["delta"] is None
+    assert greeks["unsolved_positions"] == 1
+    assert greeks["by_ticker"]["AAPL"]["positions"] == 2
+    assert abs(greeks["by_ticker"]["AAPL"]["delta"] - long_position["delta"] / 2) < 1e-6
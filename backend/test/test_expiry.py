@@ -0,0 +1,102 @@
+"""
+Checks that positions are settled as they come due, and that a position whose settlement couldn't be written to the DB is left
+as it was and retried later.
+
+Run from the backend directory:
+    python -m pytest -q test
+"""
+from datetime import date, datetime, time as time_of_day, timedelta
+import pytest
+import src.api.options_positions as options_positions
+import src.util.options_position as options_position
+from src.util.expiry_engine import ExpiryEngine
+from src.util.options_position import PositionStatus
+from src.util.position_book import PositionBook
+from src.util.scheduler import MARKET_TIMEZONE
+from test.positions import generate_positions
+
+SETTLE_TIME = time_of_day(16, 30)
+
+def test_expiry_engine_pops_due_positions_in_order():
+    engine = ExpiryEngine(SETTLE_TIME)
+    today = date(2026, 1, 16)
+    engine.load([])
+    engine.schedule(3, today + timedelta(days=1))
+    engine.schedule(1, today)
+    engine.schedule(2, today)
+    engine.schedule(4, today + timedelta(days=7))
+
+    assert engine.next_settle_at() == datetime.combine(today, SETTLE_TIME, tzinfo=MARKET_TIMEZONE)
+    # Nothing is due before the settle time on the expiration date
+    assert engine.pop_due(datetime.combine(today, time_of_day(16, 29), tzinfo=MARKET_TIMEZONE)) == []
+    assert engine.pop_due(datetime.combine(today + timedelta(days=1), SETTLE_TIME, tzinfo=MARKET_TIMEZONE)) == [1, 2, 3]
+    assert len(engine) == 1
+
+    # A position that is put back at a later time comes due again at that time
+    retry_at = datetime.combine(today + timedelta(days=2), time_of_day(9), tzinfo=MARKET_TIMEZONE)
+    engine.schedule_at(2, retry_at)
+    assert engine.next_settle_at() == retry_at
+    assert engine.pop_due(retry_at) == [2]
+    assert engine.pop_due(datetime.max.replace(tzinfo=MARKET_TIMEZONE)) == [4]
+    assert engine.next_settle_at() is None
+
+@pytest.fixture
+def due_positions(monkeypatch) -> list:
+    """
+    Puts active positions that have just expired in a fresh position book and expiry engine, and makes their closing prices
+    available without fetching them
+    """
+    positions = generate_positions(20, expired=False)
+    yesterday = date.today() - timedelta(days=1)
+    for position in positions:
+        position.expiration_date = yesterday
+        position.open_date = yesterday - timedelta(days=30)
+
+    book = PositionBook()
+    book.load(positions, [])
+    engine = ExpiryEngine(SETTLE_TIME)
+    engine.load(positions)
+    monkeypatch.setattr(options_positions, "position_book", book)
+    monkeypatch.setattr(options_positions, "expiry_engine", engine)
+    monkeypatch.setattr(
+        options_position, "get_security_closing_prices",
+        lambda ticker_dates: {ticker_date: 100.0 for ticker_date in ticker_dates}
+    )
+    return positions
+
+def test_expire_due_positions(monkeypatch, due_positions):
+    updates = []
+    monkeypatch.setattr(options_positions, "bulk_update_option_positions", updates.extend)
+
+    options_positions.expire_due_positions()
+
+    book = options_positions.position_book
+    assert sorted(position_id for position_id, _ in updates) == sorted(position.position_id for position in due_positions)
+    assert all(position_updates['is_expired'] for _, position_updates in updates)
+    assert book.positions_by_id == {}
+    for position in due_positions:
+        view = book.get(position.position_id)
+        assert view.is_expired
+        assert view.position_status in (PositionStatus.EXPIRED, PositionStatus.EXERCISED)
+        assert view.close_price == 100.0
+    assert len(options_positions.expiry_engine) == 0
+
+def test_expire_due_positions_db_failure(monkeypatch, due_positions):
+    def fail_update(position_updates):
+        raise ConnectionError("The DB is down")
+    monkeypatch.setattr(options_positions, "bulk_update_option_positions", fail_update)
+    before = [position.__json__() for position in due_positions]
+
+    with pytest.raises(ConnectionError):
+        options_positions.expire_due_positions()
+
+    # The positions in the book are left untouched, since the DB still has them as active
+    book = options_positions.position_book
+    assert [book.get(position.position_id).__json__() for position in due_positions] == before
+    assert all(book.is_expired(position.position_id) is False for position in due_positions)
+
+    # They are put back on the schedule to be retried after EXPIRY_RETRY_SECONDS
+    engine = options_positions.expiry_engine
+    assert len(engine) == len(due_positions)
+    assert engine.next_settle_at() > datetime.now().astimezone() + timedelta(seconds=options_positions.EXPIRY_RETRY_SECONDS - 60)
+    assert engine.pop_due() == []
@@ -0,0 +1,71 @@
+"""
+Checks that the option chain cache expires entries after their TTL, evicts the least recently used entry once it is full, and
+keeps count of its hits, misses and evictions.
+
+Run from the backend directory:
+    python -m pytest -q test
+"""
+from types import SimpleNamespace
+import pytest
+import src.data.option_chain_cache as option_chain_cache
+from src.data.option_chain_cache import OptionChainCache
+
+@pytest.fixture
+def clock(monkeypatch) -> SimpleNamespace:
+    """
+    Replaces the clock of the cache with one that only moves when the test moves it
+    """
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(option_chain_cache, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = OptionChainCache(ttl=60, max_entries=8)
+    cache.put(("AAPL", "2026-01-16"), "chain")
+
+    clock.now += 60
+    assert cache.get(("AAPL", "2026-01-16")) == "chain"
+    clock.now += 1
+    assert cache.get(("AAPL", "2026-01-16")) is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 1, "hit_ratio": 0.5, "size": 0, "max_entries": 8, "ttl": 60}
+
+    # Putting the chain again restarts its TTL
+    cache.put(("AAPL", "2026-01-16"), "new chain")
+    clock.now += 30
+    assert cache.get(("AAPL", "2026-01-16")) == "new chain"
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = OptionChainCache(ttl=60, max_entries=3)
+    for ticker in ["AAPL", "MSFT", "NVDA"]:
+        cache.put((ticker, "2026-01-16"), f"{ticker} chain")
+
+    # Reading AAPL makes MSFT the least recently used entry
+    assert cache.get(("AAPL", "2026-01-16")) == "AAPL chain"
+    cache.put(("TSLA", "2026-01-16"), "TSLA chain")
+    assert list(cache.entries) == [("NVDA", "2026-01-16"), ("AAPL", "2026-01-16"), ("TSLA", "2026-01-16")]
+    assert cache.get(("MSFT", "2026-01-16")) is None
+
+    # Overwriting an entry doesn't evict anything
+    cache.put(("NVDA", "2026-01-16"), "new NVDA chain")
+    assert len(cache.entries) == 3
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 1, 1)
+    assert stats["hit_ratio"] == 0.5
+
+def test_invalidate(clock):
+    cache = OptionChainCache(ttl=60, max_entries=8)
+    cache.put(("AAPL", "2026-01-16"), "AAPL chain")
+    cache.put(("MSFT", "2026-01-16"), "MSFT chain")
+
+    cache.invalidate(("AAPL", "2026-01-16"))
+    cache.invalidate(("AAPL", "2026-01-16")) # Missing keys are ignored
+    assert cache.get(("AAPL", "2026-01-16")) is None
+    assert cache.get(("MSFT", "2026-01-16")) == "MSFT chain"
+
+    cache.invalidate()
+    assert cache.stats()["size"] == 0
+
+@pytest.mark.parametrize("ttl, max_entries", [(0, 8), (60, 0)])
+def test_invalid_settings(ttl, max_entries):
+    with pytest.raises(ValueError):
+        OptionChainCache(ttl, max_entries)
@@ -0,0 +1,37 @@
+"""
+Checks the bulk write path of the DAO against the in-memory stand-in for PostgreSQL.
+
+Run from the backend directory:
+    python -m pytest -q test
+"""
+import psycopg2
+import pytest
+import src.data.option_positions_dao as option_positions_dao
+from test.in_memory_database import InMemoryDatabase
+from test.positions import generate_positions
+
+@pytest.fixture
+def database(monkeypatch) -> InMemoryDatabase:
+    database = InMemoryDatabase()
+    monkeypatch.setattr(psycopg2, "connect", database.connect)
+    monkeypatch.setattr(option_positions_dao, "db_pool", None)
+    option_positions_dao.init_db()
+    return database
+
+def test_bulk_add_option_positions(database):
+    database.last_position_id = 41
+    positions = generate_positions(2 * option_positions_dao.BULK_PAGE_SIZE + 5, expired=False) # Spans several pages
+
+    position_ids = option_positions_dao.bulk_add_option_positions(positions)
+
+    # The position_ids come from the sequence in one query and are returned in the same order as the input
+    assert position_ids == list(range(42, 42 + len(positions)))
+    assert database.last_position_id == 41 + len(positions)
+    assert database.rows == {
+        position_id: option_positions_dao.options_position_to_row(position_id, position) for position_id, position in zip(position_ids, positions)
+    }
+
+def test_bulk_add_option_positions_without_positions(database):
+    assert option_positions_dao.bulk_add_option_positions([]) == []
+    assert database.rows == {}
+    assert database.last_position_id == 0
@@ -0,0 +1,132 @@
+"""
+Checks the responses of the options positions API endpoints.
+
+Run from the backend directory:
+    python -m pytest -q test
+"""
+import pytest
+import src.api.options_positions as options_positions
+from test.positions import generate_positions
+
+DELETE_URL = f"{options_positions.api_header}/delete_position"
+QUERY_URL = f"{options_positions.api_header}/query_positions"
+ACTIVE_URL = f"{options_positions.api_header}/get_active_position"
+
+def test_delete_position(monkeypatch, client, position_book):
+    active_positions = generate_positions(3, expired=False)
+    position_book.load(active_positions, [])
+    deleted_position_ids = []
+    monkeypatch.setattr(options_positions, "delete_option_position", deleted_position_ids.append)
+
+    response = client.post(DELETE_URL, json={"position_id": active_positions[0].position_id})
+
+    assert response.status_code == 200
+    assert response.get_json()["expired"] is False
+    assert deleted_position_ids == [active_positions[0].position_id]
+    assert position_book.get(active_positions[0].position_id) is None
+
+def test_delete_unknown_position(monkeypatch, client, position_book):
+    monkeypatch.setattr(options_positions, "delete_option_position", lambda position_id: None)
+
+    response = client.post(DELETE_URL, json={"position_id": 12345})
+
+    assert response.status_code == 404
+    assert "error" in response.get_json()
+
+def test_delete_position_db_failure(monkeypatch, client, position_book):
+    active_positions = generate_positions(1, expired=False)
+    position_book.load(active_positions, [])
+    def fail_delete(position_id):
+        raise ConnectionError("The DB is down")
+    monkeypatch.setattr(options_positions, "delete_option_position", fail_delete)
+
+    response = client.post(DELETE_URL, json={"position_id": active_positions[0].position_id})
+
+    assert response.status_code == 500
+    assert "error" in response.get_json()
+    # The position is still in the DB, so it stays in the book too
+    assert position_book.get(active_positions[0].position_id) is active_positions[0]
+
+def test_position_cursor_round_trip():
+    position = generate_positions(1, expired=False)[0]
+    cursor = options_positions.format_position_cursor(position)
+
+    assert cursor == f"{position.expiration_date.isoformat()}_{position.position_id}"
+    assert options_positions.parse_position_cursor(cursor) == (position.expiration_date, position.position_id)
+
+@pytest.mark.parametrize("cursor", ["", "2026-01-16", "2026-01-16_", "2026-01-16_x", "2026-13-01_1", "2026-01-16_1_2"])
+def test_parse_malformed_position_cursor(cursor):
+    with pytest.raises(ValueError):
+        options_positions.parse_position_cursor(cursor)
+
+@pytest.fixture
+def queryable_positions(monkeypatch, position_book) -> list:
+    """
+    Active and expired positions served by a query_positions that pages through them like the DB does, with the active ones also
+    in the position book
+    """
+    active_positions = generate_positions(40, expired=False)
+    expired_positions = generate_positions(40, expired=True, seed=1, first_position_id=1001)
+    position_book.load(active_positions, expired_positions)
+    positions = sorted(active_positions + expired_positions, key=lambda position: (position.expiration_date, position.position_id))
+
+    def query_positions(filters, limit, after=None):
+        matching = [
+            position for position in positions
+            if (filters['ticker'] is None or position.ticker == filters['ticker'])
+            and (after is None or (position.expiration_date, position.position_id) > after)
+        ]
+        return matching[:limit]
+    monkeypatch.setattr(options_positions, "query_positions", query_positions)
+    return positions
+
+@pytest.mark.parametrize("ticker", [None, "aapl"])
+def test_query_positions_pages_through_every_position_once(client, queryable_positions, ticker):
+    expected = [position for position in queryable_positions if ticker is None or position.ticker == ticker.upper()]
+    params = {'limit': 7} | ({'ticker': ticker} if ticker else {})
+
+    position_ids = []
+    pages = 0
+    cursor = None
+    while True:
+        response = client.get(QUERY_URL, query_string=params | ({'cursor': cursor} if cursor else {}))
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page['positions']) <= 7
+        position_ids += [position['position_id'] for position in page['positions']]
+        pages += 1
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert position_ids == [position.position_id for position in expected]
+    assert pages == max(-(-len(expected) // 7), 1)
+
+def test_query_positions_rejects_invalid_cursor(client, queryable_positions):
+    response = client.get(QUERY_URL, query_string={'cursor': 'page-2'})
+
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+def test_active_listing_is_not_modified_until_the_book_changes(monkeypatch, client, position_book):
+    monkeypatch.setattr(options_positions, "listing_response_cache", {})
+    active_positions = generate_positions(10, expired=False)
+    position_book.load(active_positions[:5], [])
+
+    response = client.get(ACTIVE_URL)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert [position['position_id'] for position in response.get_json()] == [position.position_id for position in position_book.active_positions()]
+
+    response = client.get(ACTIVE_URL, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers['ETag'] == etag
+    # A stale ETag gets the whole listing
+    assert client.get(ACTIVE_URL, headers={'If-None-Match': '"stale"'}).status_code == 200
+
+    position_book.add(active_positions[5], False)
+    response = client.get(ACTIVE_URL, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert len(response.get_json()) == 6
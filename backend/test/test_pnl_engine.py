@@ -0,0 +1,42 @@
+"""
+Checks that the PnlEngine gives the same profits and totals as the OptionsPosition objects it stands in for.
+
+Run from the backend directory:
+    python -m pytest -q test
+"""
+import pytest
+from src.util.options_position import PositionStatus
+from src.util.pnl_engine import PnlEngine
+from src.util.position_records import PositionRecords
+from test.positions import generate_positions
+
+@pytest.fixture
+def expired_positions() -> list:
+    return generate_positions(500, expired=True)
+
+@pytest.fixture
+def active_positions() -> list:
+    return generate_positions(500, expired=False, seed=1)
+
+def test_pnl_engine_matches_calculate_profit(active_positions, expired_positions):
+    positions = active_positions + expired_positions
+    engine = PnlEngine(positions)
+
+    assert engine.profit_by_position_id() == {position.position_id: position.calculate_profit() for position in positions}
+
+    priced_positions = [position for position in positions if position.position_status != PositionStatus.OPEN or position.current_price >= 0]
+    totals = engine.totals()
+    assert totals["total_profit"] == round(sum(position.calculate_profit() for position in priced_positions), 2)
+    assert totals["unpriced_positions"] == len(positions) - len(priced_positions)
+
+def test_pnl_engine_expired_columns_match_positions(active_positions, expired_positions):
+    records = PositionRecords()
+    records.extend(expired_positions)
+
+    from_columns = PnlEngine(active_positions, records.columns(records.live_rows()))
+    from_positions = PnlEngine(active_positions + expired_positions)
+
+    assert from_columns.profit_by_position_id() == from_positions.profit_by_position_id()
+    assert from_columns.totals() == from_positions.totals()
+    assert from_columns.totals_by_ticker() == from_positions.totals_by_ticker()
+    assert from_columns.totals_by_expiry_month() == from_positions.totals_by_expiry_month()
@@ -0,0 +1,139 @@
+"""
+Checks that the indexes of the PositionBook(by position_id, by expiration date and by ticker) stay consistent with each other as
+positions are added, removed and moved over to the expired positions, and that updated prices are swapped into the book in one
+step.
+
+Run from the backend directory:
+    python -m pytest -q test
+"""
+import copy
+import random
+import src.api.options_positions as options_positions
+from src.util.position_book import PositionBook
+from test.positions import TICKERS, generate_positions
+
+def assert_book_is_consistent(book: PositionBook, active_position_ids: set, expired_position_ids: set):
+    """
+    Asserts that every index of the book holds exactly the input active and expired positions
+    """
+    assert set(book.positions_by_id) == active_position_ids
+    assert [position.position_id for position in book.active] == \
+        [position.position_id for position in sorted(book.positions_by_id.values(), key=lambda position: (position.expiration_date, position.position_id))]
+    assert {position_id for position_ids in book.position_ids_by_ticker.values() for position_id in position_ids} == active_position_ids
+    assert all(position_ids for position_ids in book.position_ids_by_ticker.values()) # Tickers without positions are dropped
+    assert {view.position_id for view in book.expired_positions()} == expired_position_ids
+    assert len(book) == len(active_position_ids) + len(expired_position_ids)
+
+    for ticker in TICKERS:
+        ticker_positions = book.positions_for_ticker(ticker.lower())
+        assert all(position.ticker == ticker for position in ticker_positions)
+        assert len({position.position_id for position in ticker_positions}) == len(ticker_positions)
+    assert sum(len(book.positions_for_ticker(ticker)) for ticker in TICKERS) == len(book)
+
+    for position_id in active_position_ids:
+        assert book.is_expired(position_id) is False
+    for position_id in expired_position_ids:
+        assert book.is_expired(position_id) is True
+
+def test_position_book_indexes_stay_consistent():
+    active_positions = generate_positions(200, expired=False)
+    expired_positions = generate_positions(200, expired=True, seed=1, first_position_id=1001)
+    book = PositionBook()
+    book.load(active_positions[:100], expired_positions[:100])
+    active_position_ids = {position.position_id for position in active_positions[:100]}
+    expired_position_ids = {position.position_id for position in expired_positions[:100]}
+    assert_book_is_consistent(book, active_position_ids, expired_position_ids)
+
+    for position in active_positions[100:]:
+        book.add(position, False)
+        active_position_ids.add(position.position_id)
+    for position in expired_positions[100:]:
+        book.add(position, True)
+        expired_position_ids.add(position.position_id)
+    assert_book_is_consistent(book, active_position_ids, expired_position_ids)
+
+    rng = random.Random(0)
+    for position_id in rng.sample(sorted(active_position_ids), 50):
+        book.move_to_expired(position_id)
+        active_position_ids.remove(position_id)
+        expired_position_ids.add(position_id)
+    assert_book_is_consistent(book, active_position_ids, expired_position_ids)
+
+    for position_id in rng.sample(sorted(active_position_ids), 50) + rng.sample(sorted(expired_position_ids), 50):
+        assert book.remove(position_id).position_id == position_id
+        active_position_ids.discard(position_id)
+        expired_position_ids.discard(position_id)
+    assert_book_is_consistent(book, active_position_ids, expired_position_ids)
+
+    # Positions that aren't in the book(anymore) are ignored
+    assert book.remove(position_id) is None
+    book.move_to_expired(position_id)
+    assert_book_is_consistent(book, active_position_ids, expired_position_ids)
+
+def test_active_positions_expiring_by():
+    active_positions = generate_positions(200, expired=False)
+    book = PositionBook()
+    book.load(active_positions, [])
+
+    cutoff = sorted(position.expiration_date for position in active_positions)[100]
+    expected = sorted(
+        (position for position in active_positions if position.expiration_date <= cutoff),
+        key=lambda position: (position.expiration_date, position.position_id)
+    )
+    assert book.active_positions_expiring_by(cutoff) == expected
+
+def test_update_active_swaps_in_the_updated_values():
+    active_positions = generate_positions(20, expired=False)
+    book = PositionBook()
+    book.load(active_positions, [])
+    updated_positions = [copy.copy(position) for position in active_positions]
+    for updated_position in updated_positions:
+        updated_position.current_price += 1
+        updated_position.profit = updated_position.calculate_profit()
+    book.remove(active_positions[0].position_id)
+    version = book.active_version
+
+    # Positions that left the book in the meantime are skipped
+    assert book.update_active(updated_positions) == active_positions[1:]
+    assert book.active_version > version
+    assert [position.__json__() for position in active_positions[1:]] == [position.__json__() for position in updated_positions[1:]]
+    assert active_positions[0].current_price == updated_positions[0].current_price - 1
+
+    book.update_active(updated_positions[1:6], expire=True)
+    assert all(book.is_expired(position.position_id) for position in updated_positions[1:6])
+    assert len(book.positions_by_id) == len(active_positions) - 6
+
+def test_refresh_active_prices_swaps_in_priced_copies(monkeypatch):
+    active_positions = generate_positions(20, expired=False)
+    previous_profits = {position.position_id: position.profit for position in active_positions}
+    book = PositionBook()
+    book.load(active_positions, [])
+    monkeypatch.setattr(options_positions, "position_book", book)
+    monkeypatch.setattr(options_positions, "get_option_chains", lambda chain_keys: {})
+    monkeypatch.setattr(options_positions, "get_options_market_data", lambda positions, option_chains=None: {})
+    monkeypatch.setattr(options_positions, "get_position_greeks", lambda: None)
+    updates = []
+    monkeypatch.setattr(options_positions, "bulk_update_option_positions", updates.extend)
+
+    def price_options_positions(positions, option_chains=None):
+        # The positions in the book must not change while they are being priced
+        assert not any(position is book.get(position.position_id) for position in positions)
+        priced_positions = positions[::2]
+        for position in priced_positions:
+            position.current_price = 12.34
+            position.profit = position.calculate_profit()
+        return priced_positions
+    monkeypatch.setattr(options_positions, "price_options_positions", price_options_positions)
+
+    options_positions.refresh_active_prices()
+
+    priced_position_ids = {position.position_id for position in book.active_positions()[::2]}
+    for position_json in book.active_positions_json():
+        if position_json['position_id'] in priced_position_ids:
+            assert position_json['current_price'] == 12.34
+        else:
+            assert position_json['profit'] == previous_profits[position_json['position_id']]
+    # Only the profits that changed are written
+    assert {position_id for position_id, _ in updates} == {
+        position_id for position_id in priced_position_ids if book.get(position_id).profit != previous_profits[position_id]
+    }
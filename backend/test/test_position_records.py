@@ -0,0 +1,120 @@
+"""
+Checks that the compact PositionRecords store gives back the positions put into it, and that its row index, cached sort order
+and compaction stay correct as positions are added and removed.
+
+Run from the backend directory:
+    python -m pytest -q test
+"""
+import random
+import pytest
+import src.util.position_records as position_records
+from src.util.position_book import PositionBook
+from src.util.position_records import PositionRecords
+from test.positions import generate_positions
+
+def sort_key(position) -> tuple:
+    return position.expiration_date, position.position_id
+
+@pytest.fixture
+def expired_positions() -> list:
+    return generate_positions(500, expired=True)
+
+def test_position_records_round_trip(expired_positions):
+    records = PositionRecords(capacity=16) # Small capacity so that the arrays have to grow
+    records.extend(expired_positions[:250])
+    for position in expired_positions[250:]:
+        records.append(position)
+
+    assert len(records) == len(expired_positions)
+    for position in expired_positions:
+        view = records.view(records.find_row(position.position_id))
+        assert view.__json__() == position.__json__()
+
+def test_position_records_remove(expired_positions):
+    records = PositionRecords()
+    records.extend(expired_positions)
+    removed_position_id = expired_positions[0].position_id
+    records.remove(records.find_row(removed_position_id))
+
+    assert len(records) == len(expired_positions) - 1
+    assert records.find_row(removed_position_id) is None
+    assert removed_position_id not in records.columns(records.live_rows())["position_ids"]
+
+def test_expired_positions_json_matches_views(expired_positions):
+    book = PositionBook()
+    book.load([], expired_positions)
+
+    assert book.expired_positions_json() == [view.__json__() for view in book.expired_positions()]
+    assert [position["position_id"] for position in book.expired_positions_json()] == \
+        [position.position_id for position in sorted(expired_positions, key=lambda position: (position.expiration_date, position.position_id))]
+
+def test_position_records_find_row_after_appends(monkeypatch):
+    # A small merge size makes the appends below go through both the dictionary of new rows and merges into the sorted index
+    monkeypatch.setattr(position_records, "ROW_INDEX_MERGE_ROWS", 16)
+    positions = generate_positions(300, expired=True)
+    random.Random(0).shuffle(positions) # Positions expire out of position_id order
+    records = PositionRecords()
+    records.extend(positions[:100])
+    for position in positions[100:]:
+        records.append(position)
+
+    for position in positions:
+        assert records.view(records.find_row(position.position_id)).position_id == position.position_id
+    assert records.find_row(0) is None
+    assert records.find_row(10 ** 9) is None
+
+    # A removed position that is added back is found in its new row
+    for position in positions[::7]:
+        records.remove(records.find_row(position.position_id))
+        assert records.find_row(position.position_id) is None
+        records.append(position)
+        assert records.find_row(position.position_id) == records.size - 1
+    assert len(records) == len(positions)
+
+def test_position_records_sorted_rows_follow_changes(expired_positions):
+    records = PositionRecords()
+    records.extend(expired_positions[:400])
+    assert [records.view(row).position_id for row in records.sorted_rows()] == \
+        [position.position_id for position in sorted(expired_positions[:400], key=sort_key)]
+
+    for position in expired_positions[400:]:
+        records.append(position)
+    for position in expired_positions[:50]:
+        records.remove(records.find_row(position.position_id))
+    assert [records.view(row).position_id for row in records.sorted_rows()] == \
+        [position.position_id for position in sorted(expired_positions[50:], key=sort_key)]
+
+def test_position_records_compact(expired_positions):
+    records = PositionRecords()
+    records.extend(expired_positions)
+    old_view = records.view(records.find_row(expired_positions[0].position_id))
+    for position in expired_positions[:200]:
+        records.remove(records.find_row(position.position_id))
+
+    compacted = records.compact()
+
+    assert compacted.size == len(compacted) == len(expired_positions) - 200
+    assert compacted.num_removed == 0
+    for position in expired_positions[:200]:
+        assert compacted.find_row(position.position_id) is None
+    for position in expired_positions[200:]:
+        assert compacted.view(compacted.find_row(position.position_id)).__json__() == position.__json__()
+    # The old store is left as it is, so views of it still read the same position
+    assert old_view.__json__() == expired_positions[0].__json__()
+
+def test_position_book_compacts_expired_positions(monkeypatch, expired_positions):
+    monkeypatch.setattr(position_records, "COMPACT_MIN_REMOVED_ROWS", 10)
+    book = PositionBook()
+    book.load([], expired_positions)
+    store = book.expired
+
+    removed_positions = [book.remove(position.position_id) for position in expired_positions[:200]]
+
+    assert book.expired is not store
+    # Compacted whenever the removed positions reached a quarter of the rows
+    assert book.expired.num_removed < position_records.COMPACT_REMOVED_SHARE * book.expired.size
+    assert len(book.expired) == len(expired_positions) - 200
+    assert [view.position_id for view in book.expired_positions()] == \
+        [position.position_id for position in sorted(expired_positions[200:], key=sort_key)]
+    # The views returned by remove can still be read after the store they came from was replaced
+    assert [view.__json__() for view in removed_positions] == [position.__json__() for position in expired_positions[:200]]
@@ -0,0 +1,82 @@
+"""
+Checks that RateLimitedExecutor keeps concurrent callers(threads and coroutines) within their budgets, and that each token bucket
+keeps its own wait statistics.
+
+Run from the backend directory:
+    python -m pytest -q test
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src.util.rate_limiter import RateLimitedExecutor
+
+NUM_CALLERS = 8
+
+def test_rate_limited_executor_limits_concurrent_calls():
+    rate = 50 # Calls per second, with a burst of 1 so that every call after the first has to wait its turn
+    rate_limiter = RateLimitedExecutor(rate, 1, burst=1)
+    call_times = []
+    call_times_lock = threading.Lock()
+
+    def call():
+        with call_times_lock:
+            call_times.append(time.monotonic())
+
+    with ThreadPoolExecutor(NUM_CALLERS) as executor:
+        for future in [executor.submit(rate_limiter.call, call) for _ in range(2 * NUM_CALLERS)]:
+            future.result(timeout=5)
+
+    call_times.sort()
+    assert len(call_times) == 2 * NUM_CALLERS
+    # Allowing some scheduling jitter, but the calls can't come in much faster than the rate
+    assert call_times[-1] - call_times[0] >= 0.9 * (len(call_times) - 1) / rate
+
+    stats = rate_limiter.stats()["shared"]
+    assert stats["calls"] == 2 * NUM_CALLERS
+    assert stats["waited_calls"] == 2 * NUM_CALLERS - 1
+    assert stats["queue_depth"] == 0
+
+def test_rate_limited_executor_endpoint_budget():
+    # The shared budget is generous, so only the endpoint's own budget should make callers wait
+    rate_limiter = RateLimitedExecutor(1000, 1, endpoint_limits={"option_chain": (20, 1, 1)})
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(NUM_CALLERS) as executor:
+        list(executor.map(lambda _: rate_limiter.call_endpoint("option_chain", lambda: None), range(NUM_CALLERS)))
+    elapsed = time.monotonic() - start
+
+    assert elapsed >= 0.9 * (NUM_CALLERS - 1) / 20
+    stats = rate_limiter.stats()
+    assert stats["shared"]["waited_calls"] == 0
+    assert stats["endpoints"]["option_chain"]["waited_calls"] == NUM_CALLERS - 1
+
+def test_rate_limited_executor_async_calls():
+    rate = 50
+    rate_limiter = RateLimitedExecutor(rate, 1, burst=1)
+
+    async def fetch(i):
+        return i
+
+    async def run() -> list:
+        return await asyncio.gather(*[rate_limiter.call_async("option_chain", fetch, i) for i in range(NUM_CALLERS)])
+
+    start = time.monotonic()
+    results = asyncio.run(run())
+    elapsed = time.monotonic() - start
+
+    assert results == list(range(NUM_CALLERS))
+    assert elapsed >= 0.9 * (NUM_CALLERS - 1) / rate
+
+def test_rate_limited_executor_records_each_buckets_own_wait():
+    # The endpoint bucket refills ten times slower than the shared one, so a caller waits 0.1 seconds on it but only 0.01 on the
+    # shared bucket. The shared bucket must not be charged for the endpoint's wait
+    rate_limiter = RateLimitedExecutor(100, 1, burst=1, endpoint_limits={"option_chain": (10, 1, 1)})
+
+    rate_limiter.acquire("option_chain")
+    wait_time = rate_limiter.acquire("option_chain")
+
+    stats = rate_limiter.stats()
+    assert wait_time > 0.08
+    assert stats["endpoints"]["option_chain"]["max_wait_time"] == wait_time
+    assert 0 < stats["shared"]["max_wait_time"] < 0.02
@@ -0,0 +1,102 @@
+"""
+Checks the scenario grid against a brute-force valuation of every position in every scenario, and that the endpoint rejects
+scenario values it can't compute.
+
+Run from the backend directory:
+    python -m pytest -q test
+"""
+import copy
+import math
+import random
+from datetime import datetime
+import numpy as np
+import pytest
+import src.api.options_positions as options_positions
+from src.util.black_scholes import MIN_VOLATILITY, SECONDS_PER_YEAR, calculate_scenario_profits
+from src.util.options_position import ContractType, TradeDirection
+from src.util.scheduler import MARKET_CLOSE, MARKET_TIMEZONE
+from test.positions import generate_positions
+
+RATE = 0.04
+
+def black_scholes_value(underlying_price: float, strike_price: float, years: float, volatility: float, is_call: bool) -> float:
+    """
+    Returns the Black-Scholes value of a single option, or its exercise value at or past the expiration
+    """
+    if years <= 0:
+        return max(underlying_price - strike_price, 0) if is_call else max(strike_price - underlying_price, 0)
+
+    def norm_cdf(x: float) -> float:
+        return 0.5 * (1 + math.erf(x / math.sqrt(2)))
+
+    volatility_sqrt_time = volatility * math.sqrt(years)
+    d1 = (math.log(underlying_price / strike_price) + (RATE + 0.5 * volatility ** 2) * years) / volatility_sqrt_time
+    d2 = d1 - volatility_sqrt_time
+    discounted_strike = strike_price * math.exp(-RATE * years)
+    if is_call:
+        return underlying_price * norm_cdf(d1) - discounted_strike * norm_cdf(d2)
+    return discounted_strike * norm_cdf(-d2) - underlying_price * norm_cdf(-d1)
+
+def test_scenario_profits_match_brute_force():
+    rng = random.Random(0)
+    positions = generate_positions(40, expired=False)
+    # Several positions on the same contract, so that the contracts are valued once and weighted by their net shares
+    for position_id, position in enumerate(positions[:10], start=1001):
+        same_contract = copy.copy(position)
+        same_contract.position_id = position_id
+        same_contract.quantity = rng.randint(1, 10)
+        same_contract.trade_direction = rng.choice(list(TradeDirection))
+        positions.append(same_contract)
+
+    underlying_prices_by_ticker = {position.ticker: rng.uniform(50, 500) for position in positions}
+    volatilities_by_contract = {}
+    for position in positions:
+        volatilities_by_contract.setdefault(
+            (position.ticker, position.expiration_date, position.strike_price, position.contract_type), rng.uniform(0.1, 0.8)
+        )
+    underlying_prices = np.array([underlying_prices_by_ticker[position.ticker] for position in positions])
+    volatilities = np.array([
+        volatilities_by_contract[(position.ticker, position.expiration_date, position.strike_price, position.contract_type)]
+        for position in positions
+    ])
+    price_moves = np.array([-0.2, 0, 0.1])
+    volatility_shifts = np.array([-0.5, 0, 0.05]) # -0.5 takes some volatilities below MIN_VOLATILITY
+    days_forward = np.array([0, 30, 400]) # 400 days is past the expiration of every position
+    now = datetime.now(MARKET_TIMEZONE)
+
+    profits = calculate_scenario_profits(positions, underlying_prices, volatilities, price_moves, volatility_shifts, days_forward, RATE, now)
+
+    expected = np.zeros((len(price_moves), len(volatility_shifts), len(days_forward)))
+    scale = 0.0
+    for i, position in enumerate(positions):
+        shares = position.quantity * 100 * (1 if position.trade_direction == TradeDirection.LONG else -1)
+        years_to_expiry = (datetime.combine(position.expiration_date, MARKET_CLOSE, tzinfo=MARKET_TIMEZONE) - now).total_seconds() / SECONDS_PER_YEAR
+        scale += abs(shares) * underlying_prices[i]
+        for m, price_move in enumerate(price_moves):
+            for v, volatility_shift in enumerate(volatility_shifts):
+                for d, days in enumerate(days_forward):
+                    value = black_scholes_value(
+                        underlying_prices[i] * (1 + price_move),
+                        position.strike_price,
+                        years_to_expiry - days / 365,
+                        max(volatilities[i] + volatility_shift, MIN_VOLATILITY),
+                        position.contract_type == ContractType.CALL
+                    )
+                    expected[m, v, d] += (value - position.premium) * shares
+
+    # The vectorized normal CDF is accurate to about 1e-7, on top of the floating point error of summing in a different order
+    np.testing.assert_allclose(profits, expected, rtol=0, atol=1e-6 * scale)
+
+@pytest.mark.parametrize("scenarios", [
+    {"price_moves": ["nan"]},
+    {"volatility_shifts": [0, "inf"]},
+    {"days_forward": ["-inf"]},
+    {"price_moves": [-1]},
+    {"days_forward": [-1]},
+    {"price_moves": []},
+    {"price_moves": ["up"]}
+])
+def test_scenario_grid_rejects_invalid_scenarios(client, scenarios):
+    response = client.post(f"{options_positions.api_header}/scenario_grid", json=scenarios)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
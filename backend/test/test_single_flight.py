@@ -0,0 +1,99 @@
+"""
+Checks that SingleFlight shares concurrent market data fetches for the same key, and that concurrent requests for the same option
+chain only download it once.
+
+Run from the backend directory:
+    python -m pytest -q test
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import pytest
+import src.data.data_fetcher as data_fetcher
+from src.data.option_chain_cache import OptionChainCache
+from src.data.single_flight import SingleFlight
+
+NUM_CALLERS = 8
+
+def test_single_flight_shares_concurrent_calls():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch(key):
+        calls.append(key)
+        release.wait(5)
+        return f"chain for {key}"
+
+    with ThreadPoolExecutor(NUM_CALLERS) as executor:
+        futures = [executor.submit(single_flight.do, "AAPL", fetch, "AAPL") for _ in range(NUM_CALLERS)]
+        # Releasing the leader only once every other caller has joined its call
+        deadline = time.monotonic() + 5
+        while single_flight.shared_calls < NUM_CALLERS - 1 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        release.set()
+        results = [future.result(timeout=5) for future in futures]
+
+    assert calls == ["AAPL"]
+    assert results == ["chain for AAPL"] * NUM_CALLERS
+    assert single_flight.shared_calls == NUM_CALLERS - 1
+    assert single_flight.in_flight == {}
+
+def test_single_flight_shares_exceptions_and_forgets_finished_calls():
+    single_flight = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError("No option chain")
+
+    with ThreadPoolExecutor(2) as executor:
+        leader = executor.submit(single_flight.do, "AAPL", fail)
+        while "AAPL" not in single_flight.in_flight:
+            time.sleep(0.001)
+        follower = executor.submit(single_flight.do, "AAPL", fail)
+        while single_flight.shared_calls < 1:
+            time.sleep(0.001)
+        release.set()
+
+        for future in [leader, follower]:
+            with pytest.raises(ValueError):
+                future.result(timeout=5)
+
+    # The failed call isn't cached, so the next caller makes a fresh call
+    assert single_flight.do("AAPL", lambda: "chain") == "chain"
+
+def test_single_flight_does_not_share_between_keys():
+    single_flight = SingleFlight()
+    with ThreadPoolExecutor(NUM_CALLERS) as executor:
+        results = list(executor.map(lambda key: single_flight.do(key, lambda: key), range(NUM_CALLERS)))
+
+    assert results == list(range(NUM_CALLERS))
+    assert single_flight.shared_calls == 0
+
+def test_concurrent_option_chain_requests_download_once(monkeypatch):
+    single_flight = SingleFlight()
+    monkeypatch.setattr(data_fetcher, "single_flight", single_flight)
+    monkeypatch.setattr(data_fetcher, "option_chain_cache", OptionChainCache(ttl=60, max_entries=8))
+    release = threading.Event()
+    downloads = []
+
+    def download_option_chain(ticker, expiry):
+        downloads.append((ticker, expiry))
+        release.wait(5)
+        return f"{ticker} chain for {expiry}"
+    monkeypatch.setattr(data_fetcher, "download_option_chain", download_option_chain)
+
+    expiration_date = date.today() + timedelta(days=30)
+    with ThreadPoolExecutor(NUM_CALLERS) as executor:
+        futures = [executor.submit(data_fetcher.get_entire_option_chain, "aapl", expiration_date) for _ in range(NUM_CALLERS)]
+        deadline = time.monotonic() + 5
+        while single_flight.shared_calls < NUM_CALLERS - 1 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        release.set()
+        results = [future.result(timeout=5) for future in futures]
+
+    expiry = expiration_date.strftime("%Y-%m-%d")
+    assert downloads == [("AAPL", expiry)]
+    assert results == [f"AAPL chain for {expiry}"] * NUM_CALLERS